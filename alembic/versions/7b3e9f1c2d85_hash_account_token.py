@@ -0,0 +1,107 @@
+"""hash_account_token
+
+Revision ID: 7b3e9f1c2d85
+Revises: 0a7d5e3b9c48
+Create Date: 2026-10-18 22:04:37.518204
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7b3e9f1c2d85"
+down_revision = "0a7d5e3b9c48"
+branch_labels = None
+depends_on = None
+
+# rows rehashed per UPDATE batch, every batch is committed on its own
+CHUNK_SIZE = 1000
+
+account_token = sa.table(
+    "account_token",
+    sa.column("token", sa.String(300)),
+    sa.column("token_hash", sa.LargeBinary(32)),
+)
+
+
+def _key_chunks(key_column, condition=None):
+    """primary keys in CHUNK_SIZE chunks by key order, each chunk continues after the last key
+    instead of scanning the table for rows not updated yet"""
+    last_key = None
+    while True:
+        query = sa.select(key_column).order_by(key_column).limit(CHUNK_SIZE)
+        if condition is not None:
+            query = query.where(condition)
+        if last_key is not None:
+            query = query.where(key_column > last_key)
+        keys = op.get_bind().execute(query).scalars().all()
+        if not keys:
+            return
+        yield keys
+        last_key = keys[-1]
+
+
+def _hash_tokens(condition=None):
+    update = (
+        account_token.update()
+        .where(account_token.c.token == sa.bindparam("old_token"))
+        .values(token_hash=sa.bindparam("new_token_hash"))
+    )
+    for tokens in _key_chunks(account_token.c.token, condition):
+        op.get_bind().execute(
+            update,
+            [
+                {"old_token": token, "new_token_hash": hashlib.sha256(token.encode()).digest()}
+                for token in tokens
+            ],
+        )
+
+
+def _unhash_tokens(condition=None):
+    update = (
+        account_token.update()
+        .where(account_token.c.token_hash == sa.bindparam("old_token_hash"))
+        .values(token=sa.bindparam("new_token"))
+    )
+    for token_hashes in _key_chunks(account_token.c.token_hash, condition):
+        op.get_bind().execute(
+            update,
+            [
+                {"old_token_hash": token_hash, "new_token": token_hash.hex()}
+                for token_hash in token_hashes
+            ],
+        )
+
+
+def upgrade():
+    with op.batch_alter_table("account_token", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("token_hash", sa.LargeBinary(length=32), nullable=True))
+
+    with op.get_context().autocommit_block():
+        _hash_tokens()
+    # catch up tokens created while the backfill was running, before the column is NOT NULL
+    _hash_tokens(account_token.c.token_hash.is_(None))
+
+    with op.batch_alter_table("account_token", schema=None) as batch_op:
+        batch_op.alter_column("token_hash", existing_type=sa.LargeBinary(length=32), nullable=False)
+        batch_op.drop_column("token")
+        batch_op.create_primary_key("pk_account_token", ["token_hash"])
+
+
+def downgrade():
+    # tokens can not be recovered from digests, the hex digests are kept as unusable tokens
+    with op.batch_alter_table("account_token", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("token", sa.String(length=300), nullable=True))
+
+    with op.get_context().autocommit_block():
+        _unhash_tokens()
+    # catch up tokens created while the backfill was running, before the column is NOT NULL
+    _unhash_tokens(account_token.c.token.is_(None))
+
+    with op.batch_alter_table("account_token", schema=None) as batch_op:
+        batch_op.alter_column("token", existing_type=sa.String(length=300), nullable=False)
+        batch_op.drop_column("token_hash")
+        batch_op.create_primary_key("pk_account_token", ["token"])
@@ -0,0 +1,74 @@
+"""benchmark of the account serialization paths
+
+`flask_restx.marshal` + `json.dumps` on ORM objects against
+`zgiam.api.lib.compile_serializer` + `zgiam.api.lib.json_dumps` on column rows
+
+Usage:
+    PYTHONPATH=. python benchmarks/serializer.py [--accounts 2000] [--repeat 5]
+"""
+import argparse
+import json
+import timeit
+
+import flask_restx
+import sqlalchemy
+import sqlalchemy.orm
+
+import zgiam.api.account
+import zgiam.api.lib
+import zgiam.models
+
+
+def _setup(accounts: int) -> sqlalchemy.orm.Session:
+    engine = sqlalchemy.create_engine("sqlite://")
+    zgiam.models.Account.metadata.create_all(engine)
+    session = sqlalchemy.orm.Session(engine)
+    session.execute(
+        zgiam.models.Account.__table__.insert(),
+        [
+            {
+                "email": f"account{i:06d}@iam.test",
+                "first_name": "Account",
+                "last_name": f"{i:06d}",
+                "phone_number": "+10001112222",
+                "id": f"account{i:06d}",
+                "memo": {"note": "benchmark"},
+            }
+            for i in range(accounts)
+        ],
+    )
+    session.commit()
+    return session
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    session = _setup(args.accounts)
+    model = zgiam.api.account._approved_account  # pylint: disable=protected-access
+    columns = zgiam.api.account._account_columns(model)  # pylint: disable=protected-access
+    serializer = zgiam.api.lib.compile_serializer(model)
+
+    def marshal_path():
+        session.expunge_all()
+        for account in session.query(zgiam.models.Account):
+            json.dumps(flask_restx.marshal(account, model))
+
+    def serializer_path():
+        for row in session.query(*columns):
+            zgiam.api.lib.json_dumps(serializer(row))
+
+    backend = zgiam.api.lib.json_dumps({}) and zgiam.api.lib._json_backend.__name__
+    print(f"{args.accounts} accounts, best of {args.repeat}, JSON backend {backend}")
+    results = {}
+    for name, func in (("marshal", marshal_path), ("serializer", serializer_path)):
+        results[name] = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{name:>12}: {results[name]:.3f}s")
+    print(f"{'speedup':>12}: {results['marshal'] / results['serializer']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
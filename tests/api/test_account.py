@@ -1,9 +1,17 @@
 """testing for zgiam.api.account module"""
 # pylint: disable=C0116,W0621,W0212,W0611
+import csv
+import datetime
+import io
 import json
 import mock
+import pytest
 import googleapiclient.errors
+import sqlalchemy
+import sqlalchemy.exc
+import zgiam.api.account
 import zgiam.database
+import zgiam.lib.config
 import zgiam.models
 
 
@@ -133,7 +141,8 @@ def test_update_account_info_bad_database(app, unittest_data):
 
 
 @mock.patch("zgiam.lib.google.AdminDirectory")
-def test_approve_registers_pass(_, app, unittest_data):
+def test_approve_registers_pass(admin_directory_mock, app, unittest_data, batch_http_request):
+    batch_http_request(admin_directory_mock)
     app.config.pop("LOGIN_DISABLED")
     db = zgiam.database.get_db()
     account1 = unittest_data.account1
@@ -172,9 +181,12 @@ def test_approve_registers_account_not_found_in_db(_, app, unittest_data):
 
 
 @mock.patch("zgiam.lib.google.AdminDirectory")
-def test_approve_registers_google_http_error(admin_directory_mock, app, unittest_data):
-    admin_directory_mock().users.insert.side_effect = googleapiclient.errors.HttpError(
-        resp=mock.Mock(), content=b"this must fail"
+def test_approve_registers_google_http_error(
+    admin_directory_mock, app, unittest_data, batch_http_request
+):
+    batch_http_request(
+        admin_directory_mock,
+        googleapiclient.errors.HttpError(resp=mock.Mock(), content=b"this must fail"),
     )
     app.config.pop("LOGIN_DISABLED")
     db = zgiam.database.get_db()
@@ -190,3 +202,417 @@ def test_approve_registers_google_http_error(admin_directory_mock, app, unittest
             headers={"token": account_token1.token, "Content-Type": "application/json"},
         )
         assert response.status_code == 400
+
+
+@mock.patch("zgiam.lib.google.AdminDirectory")
+def test_approve_registers_google_batch_error(admin_directory_mock, app, unittest_data):
+    admin_directory_mock().service.new_batch_http_request().execute.side_effect = (
+        googleapiclient.errors.HttpError(resp=mock.Mock(), content=b"this must fail")
+    )
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account1 = unittest_data.account1
+    account_token1 = unittest_data.account_token1
+    account2 = unittest_data.account2
+    db.session.add_all([account1, account_token1, account2])
+    db.session.commit()
+    with app.test_client() as client:
+        response = client.post(
+            "/api/v1/account/approve_registers",
+            data=json.dumps({"emails": [account2.email]}),
+            headers={"token": account_token1.token, "Content-Type": "application/json"},
+        )
+        assert response.status_code == 400
+        assert (
+            db.session.query(zgiam.models.Account)
+            .filter_by(email=account2.email)
+            .one()
+            .review_status
+            is None
+        )
+
+
+def test_approve_registers_async(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account1 = unittest_data.account1
+    account_token1 = unittest_data.account_token1
+    account2 = unittest_data.account2
+    expect_id = account2.id
+    del account2.id
+    db.session.add_all([account1, account_token1, account2])
+    db.session.commit()
+    zgiam.lib.config.get_config().set("JOB", "ASYNC_APPROVAL", "True")
+    with app.test_client() as client:
+        response = client.post(
+            "/api/v1/account/approve_registers",
+            data=json.dumps({"emails": [account2.email]}),
+            headers={"token": account_token1.token, "Content-Type": "application/json"},
+        )
+    assert response.status_code == 202
+    result = json.loads(response.data)[-1]
+    assert result["message"] == f"QUEUED: id: {expect_id}"
+    job = db.session.query(zgiam.models.Job).filter_by(id=result["job_id"]).one()
+    assert job.type == "create_google_workspace_account"
+    assert job.payload == {"email": account2.email}
+    assert job.status == "QUEUED"
+
+
+@mock.patch("zgiam.lib.google.AdminDirectory")
+def test_approve_registers_bulk(admin_directory_mock, app, unittest_data, batch_http_request):
+    batch_http_request(admin_directory_mock)
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account1 = unittest_data.account1
+    account_token1 = unittest_data.account_token1
+    account2 = unittest_data.account2
+    expect_id = account2.id
+    del account2.id
+    db.session.add_all([account1, account_token1, account2])
+    db.session.commit()
+    account1_id = account1.id
+    emails = [account2.email, "nobody@iam.test", account2.email]
+    with app.test_client() as client:
+        response = client.post(
+            "/api/v1/account/approve_registers",
+            data=json.dumps({"emails": emails, "bulk": True}),
+            headers={"token": account_token1.token, "Content-Type": "application/json"},
+        )
+    assert response.status_code == 400
+    message = json.loads(response.data)["message"]
+    assert f"SUCCESS: id: {expect_id}" in message
+    assert "ERROR: account not found in database" in message
+    account = db.session.query(zgiam.models.Account).filter_by(email=emails[0]).one()
+    assert account.review_status == "APPROVED"
+    assert account.review_by_id == account1_id
+
+
+@mock.patch("zgiam.lib.google.AdminDirectory")
+def test_approve_registers_bulk_google_error(
+    admin_directory_mock, app, unittest_data, batch_http_request
+):
+    batch_http_request(
+        admin_directory_mock,
+        googleapiclient.errors.HttpError(resp=mock.Mock(), content=b"this must fail"),
+    )
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account1 = unittest_data.account1
+    account_token1 = unittest_data.account_token1
+    account2 = unittest_data.account2
+    db.session.add_all([account1, account_token1, account2])
+    db.session.commit()
+    email = account2.email
+    with app.test_client() as client:
+        response = client.post(
+            "/api/v1/account/approve_registers",
+            data=json.dumps({"emails": [email], "bulk": True}),
+            headers={"token": account_token1.token, "Content-Type": "application/json"},
+        )
+    assert response.status_code == 400
+    account = db.session.query(zgiam.models.Account).filter_by(email=email).one()
+    assert account.review_status is None
+
+
+def test_approve_registers_bulk_no_transaction_during_google(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account1 = unittest_data.account1
+    account_token1 = unittest_data.account_token1
+    account2 = unittest_data.account2
+    expect_id = account2.id
+    del account2.id
+    db.session.add_all([account1, account_token1, account2])
+    db.session.commit()
+    email = account2.email
+
+    def _insert(bodies):
+        assert not db.session().in_transaction()
+        # the reserved id is committed before Google is called
+        with db.engine.connect() as connection:
+            table = zgiam.models.Account.__table__
+            assert (
+                connection.execute(
+                    sqlalchemy.select(table.c.id).where(table.c.email == email)
+                ).scalar()
+                == expect_id
+            )
+        return {email: None for email in bodies}
+
+    with mock.patch("zgiam.jobs.insert_google_workspace_accounts", side_effect=_insert):
+        with app.test_client() as client:
+            response = client.post(
+                "/api/v1/account/approve_registers",
+                data=json.dumps({"emails": [email], "bulk": True}),
+                headers={"token": account_token1.token, "Content-Type": "application/json"},
+            )
+    assert response.status_code == 200
+    assert json.loads(response.data) == [{"email": email, "message": f"SUCCESS: id: {expect_id}"}]
+    account = db.session.query(zgiam.models.Account).filter_by(email=email).one()
+    assert account.review_status == "APPROVED"
+
+
+def test_approve_registers_bulk_async(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account1 = unittest_data.account1
+    account_token1 = unittest_data.account_token1
+    account2 = unittest_data.account2
+    db.session.add_all([account1, account_token1, account2])
+    db.session.commit()
+    email = account2.email
+    zgiam.lib.config.get_config().set("JOB", "ASYNC_APPROVAL", "True")
+    with app.test_client() as client:
+        response = client.post(
+            "/api/v1/account/approve_registers",
+            data=json.dumps({"emails": [email], "bulk": True}),
+            headers={"token": account_token1.token, "Content-Type": "application/json"},
+        )
+    assert response.status_code == 202
+    result = json.loads(response.data)[0]
+    job = db.session.query(zgiam.models.Job).filter_by(id=result["job_id"]).one()
+    assert job.payload == {"email": email}
+
+
+def test_import_accounts_database_error(app, unittest_data):  # pylint: disable=unused-argument
+    new_account = {"first_name": "new", "last_name": "one", "phone_number": "+1"}
+    rows = [
+        {**new_account, "email": "new1@iam.test"},
+        {**new_account, "email": "new2@iam.test", "first_name": "n" * 31},
+        {**new_account, "email": "new3@iam.test"},
+    ]
+    write = zgiam.api.account._write_imported_accounts
+
+    def _write(accounts_kwargs, on_conflict):
+        if "new3@iam.test" in accounts_kwargs:
+            raise sqlalchemy.exc.IntegrityError("INSERT", {}, Exception("constraint failed"))
+        return write(accounts_kwargs, on_conflict)
+
+    with mock.patch.object(zgiam.api.account, "_write_imported_accounts", side_effect=_write):
+        reports = list(zgiam.api.account.import_accounts(rows))
+    assert [report["message"] for report in reports] == [
+        "CREATED",
+        "ERROR: Validation of 'first_name' field failed, longer than 30",
+        "ERROR: database error",
+    ]
+    db = zgiam.database.get_db()
+    assert [account.email for account in db.session.query(zgiam.models.Account)] == [
+        "new1@iam.test"
+    ]
+
+
+@pytest.fixture
+def listed_accounts(app, unittest_data):  # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    db.session.add_all([unittest_data.account1, unittest_data.account_token1])
+    for i in range(5):
+        db.session.add(
+            zgiam.models.Account(
+                email=f"list{i}@iam.test",
+                first_name="list",
+                last_name=str(i),
+                phone_number="+1",
+                register_date=datetime.date(2022, 1, 5 - i),
+                review_status="APPROVED" if i % 2 else None,
+            )
+        )
+    db.session.commit()
+    return unittest_data.account_token1.token
+
+
+def _list_all(client, token, **params):
+    emails, pages, after = [], 0, None
+    while True:
+        response = client.get(
+            "/api/v1/account/list",
+            query_string={**params, "after": after} if after else params,
+            headers={"token": token},
+        )
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        emails += [account["email"] for account in data["accounts"]]
+        pages += 1
+        after = data["next"]
+        if not after:
+            return emails, pages
+
+
+def test_account_list(app, listed_accounts):
+    app.config.pop("LOGIN_DISABLED")
+    with app.test_client() as client:
+        emails, pages = _list_all(client, listed_accounts, limit=2)
+        assert emails == ["accounto@iam.test"] + [f"list{i}@iam.test" for i in range(5)]
+        assert pages == 3
+
+        emails, _ = _list_all(client, listed_accounts, limit=2, order_by="register_date")
+        # account1 is registered today
+        assert emails == [f"list{i}@iam.test" for i in reversed(range(5))] + ["accounto@iam.test"]
+
+        emails, _ = _list_all(
+            client,
+            listed_accounts,
+            review_status="APPROVED",
+            register_date_from="2022-01-03",
+            register_date_to="2022-01-04",
+        )
+        assert emails == ["list1@iam.test"]
+
+        response = client.get(
+            "/api/v1/account/list", headers={"token": listed_accounts}, query_string={"limit": 1}
+        )
+        data = json.loads(response.data)
+        assert data["accounts"][0]["id"] == "accounto"
+        assert data["accounts"][0]["phone_number"] == "+10001112222;1,1234"
+
+
+def test_account_list_bad_request(app, listed_accounts):
+    app.config.pop("LOGIN_DISABLED")
+    with app.test_client() as client:
+        for params in [
+            {"after": "not a cursor"},
+            {"after": "WzEsIDJd", "order_by": "email"},
+            {"limit": 0},
+            {"order_by": "id"},
+        ]:
+            response = client.get(
+                "/api/v1/account/list", headers={"token": listed_accounts}, query_string=params
+            )
+            assert response.status_code == 400
+
+
+def test_account_export(app, listed_accounts, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account = db.session.query(zgiam.models.Account).filter_by(id="accounto").one()
+    account.groups.append(unittest_data.group1)
+    account.memo = {"note": "a, b"}
+    db.session.commit()
+    with app.test_client() as client:
+        response = client.get(
+            "/api/v1/account/export",
+            headers={"token": listed_accounts},
+            query_string={"groups": "true"},
+        )
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.data.decode().splitlines()]
+        assert len(rows) == 6
+        assert rows[0]["email"] == "accounto@iam.test"
+        assert rows[0]["groups"] == ["group1@team.com"]
+        assert rows[1]["groups"] == []
+
+        response = client.get(
+            "/api/v1/account/export",
+            headers={"token": listed_accounts},
+            query_string={"format": "csv"},
+        )
+        assert response.mimetype == "text/csv"
+        rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+        assert len(rows) == 6
+        assert rows[0]["id"] == "accounto"
+        # same as account info
+        assert rows[0]["memo"] == "{'note': 'a, b'}"
+        assert "groups" not in rows[0]
+
+        response = client.get(
+            "/api/v1/account/export",
+            headers={"token": listed_accounts},
+            query_string={"format": "xml"},
+        )
+        assert response.status_code == 400
+
+
+def test_export_accounts_unknown_format(app):  # pylint: disable=unused-argument
+    with pytest.raises(ValueError):
+        next(zgiam.api.account.export_accounts("xml"))
+
+
+def test_bulk_register(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account_token1 = unittest_data.account_token1
+    db.session.add_all([unittest_data.account1, account_token1])
+    db.session.commit()
+    token = account_token1.token
+    new_account = {"first_name": "new", "last_name": "ONE", "phone_number": "+1"}
+    lines = [
+        json.dumps({**new_account, "email": "new1@iam.test"}),
+        json.dumps({**new_account, "email": "accounto@iam.test"}),
+        "",
+        json.dumps({**new_account, "email": "new1@iam.test"}),
+        json.dumps({**new_account, "email": "new2"}),
+        "not json",
+        json.dumps({**new_account, "email": "new3@iam.test", "birthday": "yesterday"}),
+        json.dumps({**new_account, "email": "new4@iam.test", "join_date": "2022-01-01"}),
+        json.dumps({**new_account, "email": 1}),
+        json.dumps({**new_account, "email": "new6@iam.test", "birthday": 19900101}),
+        json.dumps({**new_account, "email": "new7@iam.test", "first_name": 123}),
+    ]
+    with app.test_client() as client:
+        response = client.post(
+            "/api/v1/account/bulk_register",
+            data="\n".join(lines),
+            headers={"token": token, "Content-Type": "application/x-ndjson"},
+        )
+        assert response.status_code == 200
+        assert [report["message"] for report in json.loads(response.data)] == [
+            "CREATED",
+            "DUPLICATE",
+            "ERROR: email is duplicated in the import",
+            "ERROR: Validation of 'email' field failed",
+            "ERROR: row is not a JSON object",
+            "ERROR: wrong date format",
+            "CREATED",
+            "ERROR: Validation of 'email' field failed, wrong type",
+            "ERROR: Validation of 'birthday' field failed, wrong type",
+            "ERROR: Validation of 'first_name' field failed, wrong type",
+        ]
+        account = db.session.query(zgiam.models.Account).filter_by(email="new1@iam.test").one()
+        assert (account.first_name, account.last_name) == ("New", "One")
+        assert account.join_date == datetime.date.today()
+        assert account.register_date
+        account = db.session.query(zgiam.models.Account).filter_by(email="new4@iam.test").one()
+        assert account.join_date == datetime.date(2022, 1, 1)
+
+        data = "email,first_name,last_name,phone_number,memo\n"
+        data += 'accounto@iam.test,,,,"{""note"": ""imported""}"\n'
+        data += "new5@iam.test,new,five,+1,\n"
+        response = client.post(
+            "/api/v1/account/bulk_register",
+            data=data,
+            query_string={"on_conflict": "update"},
+            headers={"token": token, "Content-Type": "text/csv"},
+        )
+        assert [report["message"] for report in json.loads(response.data)] == [
+            "ERROR: Required field 'first_name' field missing",
+            "CREATED",
+        ]
+        data = "email,first_name,last_name,phone_number,memo\n"
+        data += 'accounto@iam.test,Account,One,+1,"{""note"": ""imported""}"\n'
+        response = client.post(
+            "/api/v1/account/bulk_register",
+            data=data,
+            query_string={"on_conflict": "update"},
+            headers={"token": token, "Content-Type": "text/csv"},
+        )
+        assert json.loads(response.data)[0]["message"] == "UPDATED"
+        db.session.expire_all()
+        account = db.session.query(zgiam.models.Account).filter_by(email="accounto@iam.test").one()
+        assert account.memo == {"note": "imported"}
+        assert account.phone_number == "+1"
+        assert account.id == "accounto"
+        assert account.join_date is None
+
+        response = client.post(
+            "/api/v1/account/bulk_register",
+            data="{}",
+            headers={"token": token, "Content-Type": "application/json"},
+        )
+        assert response.status_code == 415
+
+
+def test_import_accounts_wrong_arguments(app):  # pylint: disable=unused-argument
+    with pytest.raises(ValueError):
+        next(zgiam.api.account.import_accounts([], on_conflict="replace"))
+    with pytest.raises(ValueError):
+        next(zgiam.api.account.read_account_rows(io.StringIO(), "xml"))
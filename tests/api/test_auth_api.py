@@ -1,10 +1,12 @@
 """testing for zgiam.api.auth module"""
 # pylint: disable=C0116,W0621,W0212,W0611
+import datetime
 import json
 import mock
 import oauthlib.oauth2.rfc6749.errors
 import zgiam.models
 import zgiam.database
+import zgiam.auth
 
 
 def test_login_oauth_redirect(client):
@@ -88,6 +90,81 @@ def test_get_token(app, unittest_data):
             headers={"token": account_token.token, "Content-Type": "application/json"},
         )
         assert json.loads(response.data)["tokens"] == [
-            account_token.token for account_token in account.tokens
+            zgiam.models.hash_token(account_token.token).hex()
         ]
+        assert json.loads(response.data)["next"] is None
         assert response.status_code == 200
+
+
+def test_get_token_pagination(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    db.session.add(account)
+    account_token = unittest_data.account_token1
+    db.session.add(account_token)
+    for i in range(3):
+        account.tokens.append(zgiam.models.AccountToken(token=f"token{i}"))
+    account.tokens.append(
+        zgiam.models.AccountToken(token="expired", expire_time=datetime.datetime(2021, 1, 1))
+    )
+    db.session.commit()
+    expected = sorted(
+        zgiam.models.hash_token(token).hex()
+        for token in ["token0", "token1", "token2", account_token.token]
+    )
+    header = {"token": account_token.token}
+    with app.test_client() as client:
+        response = client.get("/api/v1/auth/token?limit=3", headers=header)
+        assert response.status_code == 200
+        page = json.loads(response.data)
+        assert page["tokens"] == expected[:3]
+        assert page["next"] == expected[2]
+        response = client.get(f"/api/v1/auth/token?limit=3&after={page['next']}", headers=header)
+        page = json.loads(response.data)
+        assert page["tokens"] == expected[3:]
+        assert page["next"] is None
+        response = client.get("/api/v1/auth/token?after=zz", headers=header)
+        assert response.status_code == 400
+
+
+def test_delete_listed_token(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    db.session.add_all([unittest_data.account1, unittest_data.account_token1])
+    db.session.add(zgiam.models.AccountToken(account_id="accounto", token="lost"))
+    db.session.commit()
+    header = {"token": "...", "Content-Type": "application/json"}
+    lost_hash = zgiam.models.hash_token("lost").hex()
+    with app.test_client() as client:
+        tokens = json.loads(client.get("/api/v1/auth/token", headers=header).data)["tokens"]
+        assert lost_hash in tokens
+        response = client.delete(
+            "/api/v1/auth/token", data=json.dumps({"token": lost_hash}), headers=header
+        )
+        assert response.status_code == 200
+        tokens = json.loads(client.get("/api/v1/auth/token", headers=header).data)["tokens"]
+        assert tokens == [zgiam.models.hash_token("...").hex()]
+        assert client.get("/api/v1/auth/token", headers={"token": "lost"}).status_code == 401
+        assert zgiam.auth.get_token_denylist().is_revoked("lost")
+
+
+def test_deleted_token_stop_working(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    db.session.add(account)
+    account_token = unittest_data.account_token1
+    db.session.add(account_token)
+    db.session.commit()
+    with app.test_client() as client:
+        response = client.get("/api/v1/auth/token", headers={"token": "..."})
+        assert response.status_code == 200
+        response = client.delete(
+            "/api/v1/auth/token",
+            data=json.dumps({"token": "..."}),
+            headers={"token": "...", "Content-Type": "application/json"},
+        )
+        assert response.status_code == 200
+        response = client.get("/api/v1/auth/token", headers={"token": "..."})
+        assert response.status_code == 401
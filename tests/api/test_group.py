@@ -0,0 +1,164 @@
+"""testing for zgiam.api.group module"""
+# pylint: disable=C0116,W0621,W0212,W0611
+import json
+
+import pytest
+import sqlalchemy
+
+import zgiam.database
+import zgiam.models
+
+
+@pytest.fixture
+def group_token(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    db.session.add_all(
+        [
+            unittest_data.account1,
+            unittest_data.account2,
+            unittest_data.account_token1,
+            unittest_data.group1,
+        ]
+    )
+    db.session.commit()
+    return unittest_data.account_token1.token
+
+
+def test_create_update_delete_group(app, group_token):
+    with app.test_client() as client:
+        response = client.post(
+            "/api/v1/groups/",
+            json={"email": "design@team.com", "english_name": "Design", "memo": {"a": 1}},
+            headers={"token": group_token},
+        )
+        assert response.status_code == 201
+        group = json.loads(response.data)
+        assert group["email"] == "design@team.com"
+        assert group["memo"] == {"a": 1}
+
+        response = client.post(
+            "/api/v1/groups/", json={"email": "design@team.com"}, headers={"token": group_token}
+        )
+        assert response.status_code == 409
+        response = client.post(
+            "/api/v1/groups/", json={"email": "design"}, headers={"token": group_token}
+        )
+        assert response.status_code == 400
+
+        response = client.patch(
+            f"/api/v1/groups/{group['id']}", json={"year": 2021}, headers={"token": group_token}
+        )
+        assert response.status_code == 200
+        assert json.loads(response.data)["year"] == 2021
+        response = client.patch(
+            f"/api/v1/groups/{group['id']}",
+            json={"email": "group1@team.com"},
+            headers={"token": group_token},
+        )
+        assert response.status_code == 409
+
+        client.post(
+            f"/api/v1/groups/{group['id']}/members",
+            json={"add": ["accounto@iam.test"]},
+            headers={"token": group_token},
+        )
+        response = client.delete(f"/api/v1/groups/{group['id']}", headers={"token": group_token})
+        assert response.status_code == 204
+        response = client.get(f"/api/v1/groups/{group['id']}", headers={"token": group_token})
+        assert response.status_code == 404
+    db = zgiam.database.get_db()
+    assert db.session.query(zgiam.models.AccountGroup).count() == 0
+
+
+def test_change_group_members(app, group_token, unittest_data):
+    group_id = unittest_data.group1.id
+    with app.test_client() as client:
+        response = client.post(
+            f"/api/v1/groups/{group_id}/members",
+            json={"add": ["accounto@iam.test", "accountt@iam.test"]},
+            headers={"token": group_token},
+        )
+        assert response.status_code == 200
+        assert json.loads(response.data) == {"added": 2, "removed": 0}
+
+        response = client.post(
+            f"/api/v1/groups/{group_id}/members",
+            json={"add": ["accounto@iam.test"], "remove": ["accountt@iam.test"]},
+            headers={"token": group_token},
+        )
+        assert json.loads(response.data) == {"added": 0, "removed": 1}
+
+        response = client.get(f"/api/v1/groups/{group_id}", headers={"token": group_token})
+        assert response.status_code == 200
+        assert json.loads(response.data)["members"] == [
+            {"id": "accounto", "email": "accounto@iam.test"}
+        ]
+
+        response = client.put(
+            f"/api/v1/groups/{group_id}/members",
+            json={"emails": ["accountt@iam.test"]},
+            headers={"token": group_token},
+        )
+        assert json.loads(response.data) == {"added": 1, "removed": 1}
+
+        response = client.post(
+            "/api/v1/groups/9999/members", json={"add": []}, headers={"token": group_token}
+        )
+        assert response.status_code == 404
+
+
+def test_change_group_members_unknown_account(app, group_token, unittest_data):
+    group_id = unittest_data.group1.id
+    db = zgiam.database.get_db()
+    db.session.add(
+        zgiam.models.Account(
+            email="new@iam.test", first_name="new", last_name="one", phone_number="+1"
+        )
+    )
+    db.session.commit()
+    with app.test_client() as client:
+        response = client.post(
+            f"/api/v1/groups/{group_id}/members",
+            json={"add": ["accounto@iam.test", "new@iam.test", "nobody@iam.test"]},
+            headers={"token": group_token},
+        )
+        assert response.status_code == 400
+        message = json.loads(response.data)["message"]
+        assert "new@iam.test" in message and "not approved" in message
+        assert "nobody@iam.test" in message
+    assert db.session.query(zgiam.models.AccountGroup).count() == 0
+
+
+def test_list_groups_members_no_n_plus_one(app, group_token, unittest_data):
+    db = zgiam.database.get_db()
+    db.session.add(zgiam.models.Group(email="group2@team.com"))
+    db.session.commit()
+    zgiam.models.change_group_members(db.session, unittest_data.group1.id, add=["accounto"])
+    db.session.commit()
+
+    statements = []
+
+    def _count(*_):
+        statements.append(1)
+
+    engine = db.get_engine()
+    sqlalchemy.event.listen(engine, "before_cursor_execute", _count)
+    try:
+        with app.test_client() as client:
+            response = client.get(
+                "/api/v1/groups/", query_string={"members": "true"}, headers={"token": group_token}
+            )
+    finally:
+        sqlalchemy.event.remove(engine, "before_cursor_execute", _count)
+    assert response.status_code == 200
+    groups = json.loads(response.data)
+    assert [group["email"] for group in groups] == ["group1@team.com", "group2@team.com"]
+    assert groups[0]["members"] == [{"id": "accounto", "email": "accounto@iam.test"}]
+    assert groups[1]["members"] == []
+    # login, groups and one SELECT IN of members
+    assert len(statements) <= 3
+
+    with app.test_client() as client:
+        response = client.get("/api/v1/groups/", headers={"token": group_token})
+    assert "members" not in json.loads(response.data)[0]
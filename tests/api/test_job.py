@@ -0,0 +1,31 @@
+"""testing for zgiam.api.job module"""
+# pylint: disable=C0116,W0621,W0212,W0611
+import json
+import zgiam.database
+import zgiam.jobs
+
+
+def test_get_job(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account_token1 = unittest_data.account_token1
+    db.session.add_all([unittest_data.account1, account_token1])
+    job = zgiam.jobs.enqueue("create_google_workspace_account", {"email": "accountt@iam.test"})
+    db.session.commit()
+    with app.test_client() as client:
+        response = client.get(f"/api/v1/jobs/{job.id}", headers={"token": account_token1.token})
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data["type"] == "create_google_workspace_account"
+        assert data["status"] == "QUEUED"
+        assert data["attempts"] == 0
+
+        response = client.get("/api/v1/jobs/9999", headers={"token": account_token1.token})
+        assert response.status_code == 404
+
+
+def test_get_job_unauthorized(app):
+    app.config.pop("LOGIN_DISABLED")
+    with app.test_client() as client:
+        response = client.get("/api/v1/jobs/1")
+        assert response.status_code == 401
@@ -1,11 +1,17 @@
 """testing for zgiam.api.lib module"""
 # pylint: disable=C0116,W0621,W0212,W0611
+import datetime
+import json
+
 import flask_restx.namespace
 import flask_restx.fields
+import mock
 import pytest
 import werkzeug.exceptions
 import zgiam.api.lib
 import zgiam.api.account
+import zgiam.database
+import zgiam.models
 
 
 @pytest.fixture
@@ -82,3 +88,137 @@ def test_validate_payload_fail_for_unexpect_key(test_model):
 def test_validate_payload_fail_for_validation(test_model):
     with pytest.raises(werkzeug.exceptions.BadRequest):
         zgiam.api.lib.validate_payload({"email": "abc@gmail", "name": "abc"}, test_model)
+
+
+def test_validate_payloads(test_model):
+    assert zgiam.api.lib.validate_payloads(
+        [
+            {"email": "abc@gmail.com", "name": "abc", "data": ["1"]},
+            {"email": "abc@gmail.com"},
+            {"name": "abc", "nickname": "xxx"},
+            {"email": "abc@gmail", "name": "abc"},
+        ],
+        test_model,
+    ) == [
+        None,
+        "Required field 'name' field missing",
+        "Validation of 'nickname' field. It is unexpected key error",
+        "Validation of 'email' field failed",
+    ]
+
+
+def test_compile_validation_plan(test_model):
+    plan = zgiam.api.lib.compile_validation_plan(test_model)
+    assert plan.required_keys == ("name",)
+    assert plan.allowed_keys == {"email", "name", "data"}
+    assert set(plan.validators) == {"email"}
+    assert zgiam.api.lib.compile_validation_plan(test_model) is plan
+
+
+def test_validate_payload_no_compile(test_model):
+    zgiam.api.lib.compile_validation_plan(test_model)
+    with mock.patch.object(zgiam.api.lib.re, "compile") as mock_compile:
+        zgiam.api.lib.validate_payload({"email": "abc@gmail.com", "name": "abc"}, test_model)
+        zgiam.api.lib.PhoneNumber().validate("+10000000000")
+    assert not mock_compile.called
+
+
+def test_validate_payloads_list_field():
+    model = flask_restx.namespace.Namespace(__name__).model(
+        "emails", {"emails": flask_restx.fields.List(zgiam.api.lib.Email())}
+    )
+    assert zgiam.api.lib.validate_payloads(
+        [{"emails": ["abc@gmail.com"]}, {"emails": ["abc@gmail.com", "abc"]}], model
+    ) == [None, "Validation of 'emails' field failed"]
+
+
+def test_validate_payloads_wrong_type(test_model):
+    model = flask_restx.namespace.Namespace(__name__).model(
+        "typed",
+        {
+            "email": zgiam.api.lib.Email(),
+            "count": flask_restx.fields.Integer(),
+            "birthday": flask_restx.fields.Date(),
+            "emails": flask_restx.fields.List(zgiam.api.lib.Email()),
+            "memo": flask_restx.fields.Raw(),
+        },
+    )
+    assert zgiam.api.lib.validate_payloads(
+        [
+            {"email": "abc@gmail.com", "count": 1, "birthday": "1990-01-01", "memo": 1},
+            {"email": 1},
+            {"count": True},
+            {"birthday": 19900101},
+            {"emails": "abc@gmail.com"},
+            {"emails": [1]},
+        ],
+        model,
+    ) == [None] + [
+        "Validation of '{}' field failed, wrong type".format(key)
+        for key in ("email", "count", "birthday", "emails", "emails")
+    ]
+
+
+def test_compile_serializer_same_as_marshal(app, unittest_data):
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    account.birthday = datetime.date(2000, 1, 2)
+    account.memo = {"note": "a, b"}
+    db.session.add(account)
+    db.session.commit()
+    model = zgiam.api.account._approved_account
+    serializer = zgiam.api.lib.compile_serializer(model)
+    expected = flask_restx.marshal(account, model)
+    assert expected["memo"] == "{'note': 'a, b'}"
+    assert serializer(account) == expected
+    row = db.session.query(*zgiam.api.account._account_columns(model)).one()
+    assert serializer(row) == expected
+    assert serializer(dict(row._mapping)) == expected
+    assert zgiam.api.lib.compile_serializer(model) is serializer
+
+
+def test_compile_serializer_fallback_fields():
+    model = flask_restx.namespace.Namespace(__name__).model(
+        "fallback",
+        {
+            "name": flask_restx.fields.String(attribute="user.name"),
+            "size": flask_restx.fields.Integer(default=1),
+            "date": flask_restx.fields.Date(),
+            "tags": flask_restx.fields.List(flask_restx.fields.String),
+            "any*": flask_restx.fields.Wildcard(flask_restx.fields.String),
+        },
+    )
+    serializer = zgiam.api.lib.compile_serializer(model)
+    data = {"user": {"name": "Jack"}, "date": datetime.datetime(2000, 1, 2, 3), "tags": [1]}
+    assert serializer(data) == flask_restx.marshal(data, model)
+    assert serializer(data)["size"] == 1
+
+
+def test_json_dumps():
+    with mock.patch.object(zgiam.api.lib, "_json_backend", None), mock.patch(
+        "importlib.import_module", side_effect=ImportError
+    ):
+        assert zgiam.api.lib.json_dumps({"a": [1]}) == b'{"a": [1]}'
+        assert zgiam.api.lib._json_backend is json
+    backend = mock.Mock()
+    backend.dumps.return_value = b'{"a":[1]}'
+    with mock.patch.object(zgiam.api.lib, "_json_backend", None), mock.patch(
+        "importlib.import_module", return_value=backend
+    ):
+        assert zgiam.api.lib.json_dumps({"a": [1]}) == b'{"a":[1]}'
+        backend.dumps.assert_called_once_with({"a": [1]})
+
+
+def test_serialize_with(app, test_model):
+    @zgiam.api.lib.serialize_with(test_model)
+    def view():
+        return {"email": "abc@gmail.com", "name": "Jack", "other": 1}, 201, {"X-Test": "1"}
+
+    with app.test_request_context():
+        response = view()
+        assert response.status_code == 201
+        assert response.headers["X-Test"] == "1"
+        assert response.mimetype == "application/json"
+        assert json.loads(response.data) == {"email": "abc@gmail.com", "name": "Jack", "data": None}
+    with app.test_request_context(headers={"X-Fields": "name"}):
+        assert view() == ({"name": "Jack"}, 201, {"X-Test": "1"})
@@ -5,21 +5,37 @@ import os
 import configparser
 
 import pytest
+import mock
 import flask
 import flask_sqlalchemy
+import googleapiclient.errors
+import httplib2
+import sqlalchemy.engine
 
 import zgiam.core
 import zgiam.database
 import zgiam.models
 import zgiam.auth
 import zgiam.api
+import zgiam.instrumentation
 import zgiam.lib.config
+import zgiam.lib.google
 
 
 def setup_testing_config_env():
     zgiam.core._app = None  # pylint: disable=protected-access
     zgiam.database._db = None  # pylint: disable=protected-access
+    zgiam.database._pool_metrics = None  # pylint: disable=protected-access
+    zgiam.database._replica_engines = None  # pylint: disable=protected-access
+    zgiam.database._token_write_marks = None  # pylint: disable=protected-access
     zgiam.lib.config._config = None  # pylint: disable=protected-access
+    zgiam.lib.config._settings = None  # pylint: disable=protected-access
+    zgiam.auth._token_cache = None  # pylint: disable=protected-access
+    zgiam.auth._token_denylist = None  # pylint: disable=protected-access
+    zgiam.auth._account_cache = None  # pylint: disable=protected-access
+    zgiam.lib.google._registry = None  # pylint: disable=protected-access
+    zgiam.lib.google._executor = None  # pylint: disable=protected-access
+    zgiam.instrumentation._request_metrics = None  # pylint: disable=protected-access
     os.environ["IAM_CONFIG_PATH"] = os.path.join(
         os.path.dirname(__file__), os.path.normpath("iam_test.cfg")
     )
@@ -58,6 +74,16 @@ def db() -> flask_sqlalchemy.SQLAlchemy:
     _db.session.close()
 
 
+@pytest.fixture
+def replica(app, tmp_path) -> sqlalchemy.engine.Engine:  # pylint: disable=unused-argument
+    """empty SQLite file as the read replica"""
+    url = f"sqlite:///{tmp_path / 'replica.sql'}"
+    zgiam.lib.config.get_config().set("DATABASE", "REPLICA_URLS", f'["{url}"]')
+    engine = zgiam.database.get_replica_engines()[0]
+    zgiam.models.base.metadata.create_all(engine)
+    return engine
+
+
 @pytest.fixture
 def unittest_data():
     return type(
@@ -95,3 +121,158 @@ def unittest_data():
             "account_token1": zgiam.models.AccountToken(account_id="accounto", token="..."),
         },
     )
+
+
+@pytest.fixture
+def batch_http_request():
+    """mock Google batch HTTP request of a mocked Google client,
+    every added request callbacks with the exception"""
+
+    def _mock(google_client_mock, exception=None):
+        def new_batch_http_request(callback):
+            request_ids = []
+            batch = mock.Mock()
+            batch.add.side_effect = lambda _, request_id: request_ids.append(request_id)
+            batch.execute.side_effect = lambda: [
+                callback(request_id, {}, exception) for request_id in request_ids
+            ]
+            return batch
+
+        google_client_mock().service.new_batch_http_request.side_effect = new_batch_http_request
+
+    return _mock
+
+
+class FakeRequest:
+    """request of `FakeDirectory`, runs when executed alone or in a batch"""
+
+    def __init__(self, directory, resource, method, kwargs):
+        self.directory = directory
+        self.resource = resource
+        self.method = method
+        self.kwargs = kwargs
+
+    def execute(self):
+        self.directory.calls.append((self.resource, self.method, self.kwargs))
+        return getattr(self.directory, f"_{self.resource}_{self.method}")(**self.kwargs)
+
+
+class FakeResource:
+    def __init__(self, directory, resource):
+        self.directory = directory
+        self.resource = resource
+
+    def __getattr__(self, method):
+        return lambda **kwargs: FakeRequest(self.directory, self.resource, method, kwargs)
+
+
+class FakeDirectory:
+    """in-memory Admin Directory API has users, groups and members resources"""
+
+    def __init__(self):
+        self.users_data: typing.Dict[str, dict] = {}
+        self.groups_data: typing.Dict[str, dict] = {}
+        self.members_data: typing.Dict[str, typing.Set[str]] = {}
+        self.calls: typing.List[tuple] = []
+        self.batches = 0
+        self.service = self
+        self.users = FakeResource(self, "users")
+        self.groups = FakeResource(self, "groups")
+        self.members = FakeResource(self, "members")
+        self._etag = 0
+
+    def new_batch_http_request(self, callback):
+        requests = []
+        directory = self
+
+        class _Batch:
+            @staticmethod
+            def add(request, request_id):
+                requests.append((request, request_id))
+
+            @staticmethod
+            def execute():
+                directory.batches += 1
+                for request, request_id in requests:
+                    try:
+                        response = request.execute()
+                    except googleapiclient.errors.HttpError as e:
+                        callback(request_id, None, e)
+                    else:
+                        callback(request_id, response, None)
+
+        return _Batch()
+
+    def writes(self):
+        return [call for call in self.calls if call[1] != "list"]
+
+    @staticmethod
+    def _error(status):
+        return googleapiclient.errors.HttpError(httplib2.Response({"status": status}), b"")
+
+    def _new_etag(self):
+        self._etag += 1
+        return f'"etag{self._etag}"'
+
+    @staticmethod
+    def _page(items, key, maxResults, pageToken=None, **_):  # pylint: disable=invalid-name
+        start = int(pageToken or 0)
+        response = {key: items[start : start + maxResults]}
+        if start + maxResults < len(items):
+            response["nextPageToken"] = str(start + maxResults)
+        return response
+
+    def _users_list(self, **kwargs):
+        return self._page(
+            [self.users_data[key] for key in sorted(self.users_data)], "users", **kwargs
+        )
+
+    def _users_insert(self, body):
+        key = body["primaryEmail"].lower()
+        if key in self.users_data:
+            raise self._error(409)
+        self.users_data[key] = dict(body, etag=self._new_etag())
+        return self.users_data[key]
+
+    def _users_patch(self, userKey, body):  # pylint: disable=invalid-name
+        key = userKey.lower()
+        if key not in self.users_data:
+            raise self._error(404)
+        self.users_data[key].update(body, etag=self._new_etag())
+        return self.users_data[key]
+
+    def _groups_list(self, **kwargs):
+        return self._page(
+            [self.groups_data[key] for key in sorted(self.groups_data)], "groups", **kwargs
+        )
+
+    def _groups_insert(self, body):
+        key = body["email"].lower()
+        if key in self.groups_data:
+            raise self._error(409)
+        self.groups_data[key] = dict(body, etag=self._new_etag())
+        self.members_data[key] = set()
+        return self.groups_data[key]
+
+    def _groups_patch(self, groupKey, body):  # pylint: disable=invalid-name
+        self.groups_data[groupKey.lower()].update(body, etag=self._new_etag())
+        return self.groups_data[groupKey.lower()]
+
+    def _members_list(self, groupKey, **kwargs):  # pylint: disable=invalid-name
+        members = [{"email": email} for email in sorted(self.members_data[groupKey.lower()])]
+        return self._page(members, "members", **kwargs)
+
+    def _members_insert(self, groupKey, body):  # pylint: disable=invalid-name
+        if groupKey.lower() not in self.members_data:
+            raise self._error(404)
+        self.members_data[groupKey.lower()].add(body["email"].lower())
+        return dict(body, etag=self._new_etag())
+
+    def _members_delete(self, groupKey, memberKey):  # pylint: disable=invalid-name
+        self.members_data[groupKey.lower()].discard(memberKey.lower())
+        return ""
+
+
+@pytest.fixture
+def fake_directory():
+    return FakeDirectory()
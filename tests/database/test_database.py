@@ -1,6 +1,11 @@
 """testing for zgiam.database module"""
 # pylint: disable=C0116,W0621,W0212,W0611
+import flask
 import pytest
+import mock
+import sqlalchemy.dialects
+import sqlalchemy.exc
+import sqlalchemy.pool
 import zgiam.models
 import zgiam.core
 import zgiam.lib.config
@@ -63,3 +68,151 @@ def test_database_wrong_config(app, config):
 def test_close_session(app):  # pylint: disable=unused-argument
     with zgiam.database.get_session(close=True):
         ...
+
+
+def test_insert_ignore():
+    table = zgiam.models.AccountIdSequence.__table__
+    for name, expect in [
+        ("postgresql", "ON CONFLICT DO NOTHING"),
+        ("mysql", "INSERT IGNORE"),
+        ("sqlite", "INSERT OR IGNORE"),
+    ]:
+        connection = mock.Mock()
+        connection.dialect = sqlalchemy.dialects.registry.load(name)()
+        statement = zgiam.database.insert_ignore(connection, table)
+        assert expect in str(statement.compile(dialect=connection.dialect))
+    connection.dialect.name = "mongodb"
+    with pytest.raises(TypeError):
+        zgiam.database.insert_ignore(connection, table)
+
+
+def test_upsert():
+    table = zgiam.models.Account.__table__
+    for name, expect in [
+        ("postgresql", "ON CONFLICT (email) DO UPDATE SET first_name = coalesce("),
+        ("mysql", "ON DUPLICATE KEY UPDATE first_name = coalesce("),
+        ("sqlite", "ON CONFLICT (email) DO UPDATE SET first_name = coalesce("),
+    ]:
+        connection = mock.Mock()
+        connection.dialect = sqlalchemy.dialects.registry.load(name)()
+        statement = zgiam.database.upsert(connection, table, ["email"], ["first_name"])
+        assert expect in str(statement.compile(dialect=connection.dialect))
+    connection.dialect.name = "mongodb"
+    with pytest.raises(TypeError):
+        zgiam.database.upsert(connection, table, ["email"], ["first_name"])
+
+
+def test_database_pool_config(app, config):
+    config.set("DATABASE", "TYPE", "PostgreSQL")
+    config.set("DATABASE", "POOL_SIZE", "20")
+    config.set("DATABASE", "STATEMENT_TIMEOUT", "5000")
+    config.set("DATABASE", "CONNECT_ARGS", '{"sslmode": "require"}')
+    zgiam.database._config_db(app)
+    options = app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+    assert options["poolclass"] is zgiam.database.InstrumentedQueuePool
+    assert options["pool_size"] == 20
+    assert options["pool_pre_ping"]
+    assert options["connect_args"] == {
+        "sslmode": "require",
+        "options": "-c statement_timeout=5000",
+    }
+
+    config.set("DATABASE", "TYPE", "mysql")
+    zgiam.database._config_db(app)
+    options = app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+    assert options["connect_args"]["init_command"] == "SET SESSION MAX_EXECUTION_TIME=5000"
+
+    config.set("DATABASE", "TYPE", "sqlite")
+    zgiam.database._config_db(app)
+    assert app.config["SQLALCHEMY_ENGINE_OPTIONS"] == {}
+
+
+def test_database_pgbouncer_config(app, config):
+    config.set("DATABASE", "TYPE", "PostgreSQL")
+    config.set("DATABASE", "PGBOUNCER", "True")
+    config.set("DATABASE", "STATEMENT_TIMEOUT", "5000")
+    zgiam.database._config_db(app)
+    options = app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+    assert options == {"poolclass": sqlalchemy.pool.NullPool}
+
+
+def test_pool_metrics(config, tmp_path):  # pylint: disable=unused-argument
+    metrics = zgiam.database.get_pool_metrics()
+    metrics.log_interval = 0.000001
+    engine = sqlalchemy.create_engine(
+        f"sqlite:///{tmp_path / 'pool.sql'}",
+        poolclass=zgiam.database.InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.01,
+    )
+    with mock.patch.object(zgiam.database.logger, "info") as mock_info:
+        with engine.connect():
+            with pytest.raises(sqlalchemy.exc.TimeoutError):
+                engine.connect()
+            stats = metrics.stats()
+        assert mock_info.called
+    assert stats["checkouts"] == 2
+    assert stats["timeouts"] == 1
+    assert stats["checked_out"] == 1
+    assert stats["wait_seconds_max"] >= 0.01
+    assert metrics.stats()["checked_out"] == 0
+
+
+def test_read_only_routing(app, replica):
+    db = zgiam.database.get_db()
+    replica.execute(
+        zgiam.models.Account.__table__.insert().values(
+            email="replica@iam.test", first_name="r", last_name="r", phone_number="+1"
+        )
+    )
+
+    def _load():
+        return db.session.query(zgiam.models.Account).filter_by(email="replica@iam.test").all()
+
+    assert not _load()
+    with zgiam.database.read_only():
+        assert _load()
+    assert zgiam.database.RoutingSession.get_bind(db.session(), bind=replica) is replica
+    db.session.close()
+
+    with app.test_request_context(headers={"token": "a token"}):
+        with zgiam.database.read_only():
+            assert _load()
+        db.session.add(zgiam.models.Group(english_name="group"))
+        db.session.commit()
+        # requester wrote, read from the primary
+        with zgiam.database.read_only():
+            assert not _load()
+    db.session.close()
+
+    with app.test_request_context(headers={"token": "a token"}):
+        with zgiam.database.read_only():
+            assert not _load()
+    with app.test_request_context():
+        with zgiam.database.read_only():
+            assert _load()
+
+
+def test_read_only_sticky_session_cookie(app, replica):  # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    with app.test_request_context():
+        flask.session["_user_id"] = "accounto"
+        db.session.add(zgiam.models.Group(english_name="group"))
+        db.session.commit()
+        assert zgiam.database._SESSION_WRITE_AT_KEY in flask.session
+        flask.g.pop("zgiam_database_write")
+        assert zgiam.database._recent_write()
+        flask.session[zgiam.database._SESSION_WRITE_AT_KEY] = 0
+        assert not zgiam.database._recent_write()
+
+
+def test_write_not_marked_without_replica(app):
+    db = zgiam.database.get_db()
+    with app.test_request_context():
+        flask.session["_user_id"] = "accounto"
+        flask.session.modified = False
+        db.session.add(zgiam.models.Group(english_name="group"))
+        db.session.commit()
+        assert zgiam.database._SESSION_WRITE_AT_KEY not in flask.session
+        assert not flask.session.modified
@@ -0,0 +1,86 @@
+"""testing for zgiam.lib.cache module"""
+# pylint: disable=C0116,W0621,W0212,W0611
+import mock
+import pytest
+import zgiam.lib.cache
+
+
+def test_ttl_cache_hit_and_miss():
+    cache = zgiam.lib.cache.TTLCache(maxsize=2, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_ttl_cache_lru_evict():
+    cache = zgiam.lib.cache.TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+@mock.patch("time.monotonic")
+def test_ttl_cache_expire(monotonic_mock):
+    monotonic_mock.return_value = 100
+    cache = zgiam.lib.cache.TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    monotonic_mock.return_value = 111
+    assert cache.get("a") is None
+    assert not len(cache)
+
+
+def test_ttl_cache_disabled():
+    cache = zgiam.lib.cache.TTLCache(maxsize=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_ttl_cache_delete():
+    cache = zgiam.lib.cache.TTLCache()
+    cache.set("a", {"id": "x"})
+    cache.set("b", {"id": "y"})
+    cache.delete("c")
+    assert cache.delete_if(lambda _, value: value["id"] == "x") == 1
+    assert cache.get("a") is None
+    cache.delete("b")
+    assert cache.get("b") is None
+    cache.set("a", 1)
+    cache.clear()
+    assert not len(cache)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def set(self, name, value, ex=None):  # pylint: disable=unused-argument
+        self.data[name] = value
+
+    def delete(self, name):
+        self.data.pop(name, None)
+
+
+def test_redis_cache():
+    client = FakeRedis()
+    cache = zgiam.lib.cache.RedisCache(client, prefix="test:")
+    assert cache.get("a") is None
+    cache.set("a", {"id": "x"})
+    assert "test:a" in client.data
+    assert cache.get("a") == {"id": "x"}
+    cache.delete("a")
+    assert cache.get("a", 1) == 1
+    assert cache.stats() == {"hits": 1, "misses": 2}
+
+
+def test_redis_cache_without_redis_package():
+    with mock.patch("importlib.import_module", side_effect=ImportError):
+        with pytest.raises(RuntimeError):
+            zgiam.lib.cache.RedisCache.from_url("redis://localhost")
@@ -3,6 +3,7 @@
 # NOTE: we may already test config in other module
 import os
 import logging
+import signal
 import mock
 import pytest
 import zgiam.lib.config
@@ -39,3 +40,73 @@ def test_load_config_fail(_load_config_fn_mock):
     zgiam.lib.config._config = None
     with pytest.raises(RuntimeError):
         zgiam.lib.config.get_config()
+
+
+def test_settings_rebuilt_on_change(config):
+    settings = zgiam.lib.config.get_settings()
+    assert zgiam.lib.config.get_settings() is settings
+    assert settings.domains == ("iam.test",)
+    assert settings.primary_domain == "iam.test"
+    config.set("CORE", "TOKEN_VERIFY_MODE", "JWT")
+    assert zgiam.lib.config.get_settings().token_verify_mode == "jwt"
+    with pytest.raises(AttributeError):
+        settings.token_verify_mode = "database"
+
+
+def test_settings_match_domain(config):
+    config.set("CORE", "DOMAINS", '["iam.test", "Example.com"]')
+    settings = zgiam.lib.config.get_settings()
+    assert settings.match_domain("accounto@iam.test")
+    assert settings.match_domain("accounto@EXAMPLE.com")
+    assert settings.match_domain("accounto@team.example.com")
+    assert not settings.match_domain("accounto@eviliam.test")
+    assert not settings.match_domain("accounto@iam.test.evil")
+
+
+def test_reload_config_keep_current_on_error(config):
+    settings = zgiam.lib.config.get_settings()
+    with mock.patch.dict(os.environ, {"IAM_CORE_GOOGLE_OAUTH_TOKEN_EXPIRE_TIME": "60"}):
+        reloaded = zgiam.lib.config.reload_config()
+    assert reloaded is not settings
+    assert reloaded.google_oauth_token_expire_time == 60
+    assert zgiam.lib.config.get_config() is not config
+
+    current = zgiam.lib.config.get_config()
+    for name, value in (
+        ("IAM_CORE_DOMAINS", "not json"),
+        ("IAM_CORE_GOOGLE_OAUTH_TOKEN_EXPIRE_TIME", "abc"),
+    ):
+        with mock.patch.dict(os.environ, {name: value}):
+            with pytest.raises(ValueError):
+                zgiam.lib.config.reload_config()
+        assert zgiam.lib.config.get_config() is current
+        assert zgiam.lib.config.get_settings() is reloaded
+
+
+def test_config_watcher(config, tmp_path):  # pylint: disable=unused-argument
+    config_path = tmp_path / "zgiam.cfg"
+    config_path.write_text("[CORE]\nGOOGLE_OAUTH_TOKEN_EXPIRE_TIME=60\n")
+    with mock.patch.dict(os.environ, {"IAM_CONFIG_PATH": str(config_path)}):
+        watcher = zgiam.lib.config.ConfigWatcher(interval=0.01)
+        with mock.patch.object(zgiam.lib.config, "reload_config") as reload_config:
+            watcher.start()
+            watcher.reload_event.set()
+            watcher.join(0.1)
+            assert reload_config.call_count == 1
+
+            os.utime(config_path, (0, 0))
+            watcher.join(0.1)
+            assert reload_config.call_count == 2
+            watcher.stop()
+            watcher.join(1)
+    assert not watcher.is_alive()
+
+
+def test_watch_config(config):  # pylint: disable=unused-argument
+    with mock.patch.object(zgiam.lib.config.signal, "signal") as signal_mock:
+        with mock.patch.object(zgiam.lib.config.ConfigWatcher, "start") as start_mock:
+            watcher = zgiam.lib.config.watch_config()
+    assert start_mock.called
+    assert signal_mock.call_args[0][0] == signal.SIGHUP
+    signal_mock.call_args[0][1](signal.SIGHUP, None)
+    assert watcher.reload_event.is_set()
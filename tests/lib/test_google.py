@@ -1,5 +1,8 @@
 """testing for zgiam.lib.google module"""
 # pylint: disable=C0116,W0621,W0212,W0611,C0115
+import threading
+import googleapiclient.errors
+import httplib2
 import pytest
 import mock
 
@@ -28,5 +31,189 @@ def test_google_admin_directory(
 ):  # pylint: disable=unused-argument
     google_ad_client = zgiam.lib.google.AdminDirectory()
     assert from_service_account_file_fn_mock.called
+    assert from_service_account_file_fn_mock.call_args.kwargs["scopes"] == [
+        "https://www.googleapis.com/auth/admin.directory.user"
+    ]
+    # the sync has its own credentials, user provisioning does not need the group scope
+    zgiam.lib.google.AdminDirectory(scopes=zgiam.lib.google.ADMIN_DIRECTORY_SYNC_SCOPES)
+    assert from_service_account_file_fn_mock.call_count == 2
+    assert "https://www.googleapis.com/auth/admin.directory.group" in (
+        from_service_account_file_fn_mock.call_args.kwargs["scopes"]
+    )
     assert google_ad_client.users
     assert google_ad_client.groups
+    assert google_ad_client.members
+
+
+@mock.patch("google.oauth2.service_account.Credentials.from_service_account_file")
+def test_google_client_registry_reuse(
+    from_service_account_file_fn_mock, config
+):  # pylint: disable=unused-argument
+    client1 = zgiam.lib.google.AdminDirectory()
+    client2 = zgiam.lib.google.AdminDirectory()
+    assert from_service_account_file_fn_mock.call_count == 1
+    assert client1.service is client2.service
+
+    services = []
+    thread = threading.Thread(target=lambda: services.append(zgiam.lib.google.AdminDirectory()))
+    thread.start()
+    thread.join()
+    assert services[0].service is not client1.service
+
+
+@mock.patch("googleapiclient.discovery_cache.get_static_doc", return_value=None)
+@mock.patch("googleapiclient.discovery.build")
+@mock.patch("google.oauth2.service_account.Credentials.from_service_account_file")
+def test_google_client_registry_no_static_document(
+    _, build_fn_mock, __, config
+):  # pylint: disable=unused-argument
+    assert zgiam.lib.google.AdminDirectory().service == build_fn_mock.return_value
+
+
+@mock.patch("google.oauth2.service_account.Credentials.from_service_account_file")
+def test_google_warm_up(
+    from_service_account_file_fn_mock, config
+):  # pylint: disable=unused-argument
+    zgiam.lib.google.warm_up()
+    assert from_service_account_file_fn_mock.called
+    from_service_account_file_fn_mock.side_effect = OSError
+    zgiam.lib.google._registry = None
+    zgiam.lib.google.warm_up()
+
+
+def _http_error(status, content=b""):
+    return googleapiclient.errors.HttpError(httplib2.Response({"status": status}), content)
+
+
+def test_is_retriable():
+    assert zgiam.lib.google.is_retriable(_http_error(429))
+    assert zgiam.lib.google.is_retriable(_http_error(503))
+    assert zgiam.lib.google.is_retriable(
+        _http_error(403, b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}')
+    )
+    assert not zgiam.lib.google.is_retriable(_http_error(403, b"forbidden"))
+    assert not zgiam.lib.google.is_retriable(_http_error(409))
+    assert not zgiam.lib.google.is_retriable(
+        googleapiclient.errors.HttpError(resp=mock.Mock(), content=b"")
+    )
+    assert not zgiam.lib.google.is_retriable(RuntimeError())
+
+
+def test_is_conflict():
+    assert zgiam.lib.google.is_conflict(_http_error(409))
+    assert not zgiam.lib.google.is_conflict(_http_error(404))
+    assert not zgiam.lib.google.is_conflict(RuntimeError())
+
+
+@mock.patch("time.sleep")
+def test_token_bucket(sleep_mock):
+    with mock.patch("time.monotonic", return_value=100.0):
+        bucket = zgiam.lib.google.TokenBucket(rate=10, capacity=2)
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0
+        assert bucket.acquire(2) == pytest.approx(0.2)
+        sleep_mock.assert_called_once_with(pytest.approx(0.2))
+        # the next caller waits behind the deficit
+        assert bucket.acquire() == pytest.approx(0.3)
+    with mock.patch("time.monotonic", return_value=101.0):
+        # refilled to capacity at most
+        assert bucket.acquire(2) == 0
+        assert bucket.acquire() == pytest.approx(0.1)
+    assert zgiam.lib.google.TokenBucket(rate=0, capacity=0).acquire(100) == 0
+
+
+@mock.patch("time.sleep")
+def test_api_executor_execute(sleep_mock, config):  # pylint: disable=unused-argument
+    executor = zgiam.lib.google.ApiExecutor(rate=0, max_retries=2)
+    request = mock.Mock()
+    request.execute.side_effect = [_http_error(429), _http_error(500), {"id": 1}]
+    assert executor.execute(request) == {"id": 1}
+    assert sleep_mock.call_count == 2
+    stats = executor.metrics.stats()
+    assert stats["calls"] == 3
+    assert stats["retries"] == 2
+    assert stats["errors"] == 0
+    assert stats["latency_seconds_count"] == 3
+    assert stats["latency_seconds_bucket"]["0.05"] == 3
+    assert stats["latency_seconds_bucket"]["+Inf"] == 3
+
+    request.execute.side_effect = _http_error(429)
+    with pytest.raises(googleapiclient.errors.HttpError):
+        executor.execute(request)
+    request.execute.side_effect = _http_error(404)
+    with pytest.raises(googleapiclient.errors.HttpError):
+        executor.execute(request)
+    stats = executor.metrics.stats()
+    assert stats["calls"] == 7
+    assert stats["retries"] == 4
+    assert stats["errors"] == 2
+
+    # the insert failed after creating the resource, the retry conflicts
+    request.execute.side_effect = [_http_error(503), _http_error(409)]
+    assert executor.execute(request, insert=True) is None
+    request.execute.side_effect = [_http_error(409)]
+    with pytest.raises(googleapiclient.errors.HttpError):
+        executor.execute(request, insert=True)
+    request.execute.side_effect = [_http_error(503), _http_error(409)]
+    with pytest.raises(googleapiclient.errors.HttpError):
+        executor.execute(request)
+
+
+@mock.patch("time.sleep")
+def test_api_executor_execute_batch(sleep_mock, config):
+    config.set("GOOGLE_API", "BATCH_SIZE", "2")
+    executor = zgiam.lib.google.ApiExecutor(rate=1000, burst=1, max_retries=1)
+    responses = {"a": [_http_error(429), {"id": "a"}], "b": [{"id": "b"}], "c": [_http_error(409)]}
+    batches = []
+
+    def new_batch_http_request(callback):
+        batch = mock.Mock()
+        requests = []
+        batch.add.side_effect = lambda request, request_id: requests.append(request_id)
+
+        def execute():
+            batches.append(list(requests))
+            for request_id in requests:
+                response = responses[request_id].pop(0)
+                if isinstance(response, Exception):
+                    callback(request_id, None, response)
+                else:
+                    callback(request_id, response, None)
+
+        batch.execute.side_effect = execute
+        return batch
+
+    service = mock.Mock()
+    service.new_batch_http_request.side_effect = new_batch_http_request
+    results = executor.execute_batch(service, [(key, mock.Mock()) for key in "abc"])
+    assert batches == [["a", "b"], ["c"], ["a"]]
+    assert results["a"] == ({"id": "a"}, None)
+    assert results["b"] == ({"id": "b"}, None)
+    assert isinstance(results["c"][1], googleapiclient.errors.HttpError)
+    stats = executor.metrics.stats()
+    assert stats["calls"] == 4
+    assert stats["batches"] == 3
+    assert stats["retries"] == 1
+    assert stats["errors"] == 1
+    # throttled by the bucket and one backoff
+    assert stats["throttle_wait_seconds_total"] > 0
+    assert sleep_mock.call_count >= 2
+
+    responses.update({"d": [_http_error(503), _http_error(409)], "e": [_http_error(409)]})
+    results = executor.execute_batch(
+        service, [(key, mock.Mock()) for key in "de"], inserts=frozenset("de")
+    )
+    assert results["d"] == (None, None)
+    assert results["e"][1].resp.status == 409
+
+    service.new_batch_http_request.side_effect = None
+    service.new_batch_http_request.return_value.execute.side_effect = _http_error(400)
+    results = executor.execute_batch(service, [("f", mock.Mock())])
+    assert results["f"][1].resp.status == 400
+
+
+def test_get_executor(config):
+    config.set("GOOGLE_API", "RATE_LIMIT", "5")
+    executor = zgiam.lib.google.get_executor()
+    assert executor is zgiam.lib.google.get_executor()
+    assert executor.bucket.rate == 5
@@ -13,7 +13,9 @@ def test_init():
                 assert mock_exit.call_args[0][0] == 42
 
 
+@mock.patch("zgiam.lib.config.watch_config")
 @mock.patch("zgiam.core.get_app")
-def test_main(mock_get_app_fn):
+def test_main(mock_get_app_fn, mock_watch_config_fn):
     zgiam.app.main()
     assert mock_get_app_fn.called
+    assert mock_watch_config_fn.called
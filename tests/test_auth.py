@@ -5,9 +5,11 @@ import datetime
 import pytest
 import mock
 import flask_login
+import flask_jwt_extended
 import werkzeug.exceptions
 import flask_dance.contrib.google
 
+import zgiam.core
 import zgiam.models
 import zgiam.auth
 import zgiam.database
@@ -90,6 +92,56 @@ def test_login_oauth_token_expired(app, unittest_data):
         assert response.status_code == 401
 
 
+def test_login_oauth_token_check_from_session(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    db.session.add(account)
+    db.session.commit()
+
+    @app.route("/test")
+    def _():
+        flask_login.login_user(account)
+        # no OAuth row in database, session remembered one is trusted
+        zgiam.auth._set_session_oauth_created_at(account.id, datetime.datetime.utcnow())
+        response = zgiam.auth.login_oauth_token_check(lambda: {"message": "ok"})()
+        return response
+
+    with app.test_client() as client:
+        response = client.get("/test")
+        assert response.status_code == 200
+
+
+def test_login_oauth_token_check_session_expired(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    config = zgiam.lib.config.get_config()
+    google_oauth_token_expire_time = config.getint("CORE", "GOOGLE_OAUTH_TOKEN_EXPIRE_TIME")
+    account = unittest_data.account1
+    oauth = unittest_data.oauth1
+    db.session.add_all([account, oauth])
+    db.session.commit()
+
+    @app.route("/test")
+    def _():
+        flask_login.login_user(account)
+        zgiam.auth._set_session_oauth_created_at(
+            account.id,
+            datetime.datetime.utcnow()
+            - datetime.timedelta(seconds=google_oauth_token_expire_time + 1),
+        )
+        # the session deadline passed, database has a newer one
+        response = zgiam.auth.login_oauth_token_check(lambda: {"message": "ok"})()
+        assert zgiam.auth._get_session_oauth_created_at(account.id) == (
+            oauth.created_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+        )
+        return response
+
+    with app.test_client() as client:
+        response = client.get("/test")
+        assert response.status_code == 200
+
+
 def test_flask_login_user_loader(db, unittest_data):
     account = unittest_data.account1
     assert not zgiam.auth._flask_login_user_loader(account.id)
@@ -99,6 +151,58 @@ def test_flask_login_user_loader(db, unittest_data):
     assert zgiam.auth._flask_login_user_loader(account.id) == account
 
 
+def test_flask_login_loader_replica_behind(app, replica, unittest_data):
+    # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    account_token = unittest_data.account_token1
+    account_id, token = account.id, account_token.token
+    db.session.add_all([account, account_token])
+    db.session.commit()
+    db.session.close()
+    assert zgiam.auth._flask_login_user_loader(account_id).id == account_id
+    db.session.close()
+    request = mock.Mock()
+    request.headers = {"token": token}
+    assert zgiam.auth._flask_login_request_loader(request).id == account_id
+
+
+def test_flask_login_user_loader_cache(db, unittest_data):
+    account = unittest_data.account1
+    account_id, phone_number = account.id, account.phone_number
+    db.session.add(account)
+    db.session.commit()
+    db.session.close()
+    assert zgiam.auth._flask_login_user_loader(account_id).id == account_id
+    db.session.close()
+
+    account_cache = zgiam.auth.get_account_cache()
+    assert account_cache.stats()["misses"] == 1
+    readback_account = zgiam.auth._flask_login_user_loader(account_id)
+    assert account_cache.stats()["hits"] == 1
+    assert readback_account.id == account_id
+    # not cached column is loaded when needed
+    assert readback_account.phone_number == phone_number
+
+    readback_account.first_name = "changed"
+    db.session.commit()
+    zgiam.auth.update_account_cache(readback_account)
+    db.session.close()
+    assert zgiam.auth._flask_login_user_loader(account_id).first_name == "changed"
+    zgiam.auth.invalidate_account_cache(account_id)
+    assert account_cache.get(account_id) is None
+
+
+def test_account_cache_backend(config):
+    config.set("CORE", "ACCOUNT_CACHE_BACKEND", "redis")
+    with mock.patch("zgiam.lib.cache.RedisCache.from_url") as from_url_mock:
+        assert zgiam.auth.get_account_cache() == from_url_mock.return_value
+    zgiam.auth._account_cache = None
+    config.set("CORE", "ACCOUNT_CACHE_BACKEND", "memcached")
+    with pytest.raises(TypeError):
+        zgiam.auth.get_account_cache()
+
+
 def test_login_account_token_check_pass(app, unittest_data):
     app.config.pop("LOGIN_DISABLED")
     db = zgiam.database.get_db()
@@ -188,4 +292,104 @@ def test_google_logged_in_success(_, db, unittest_data):
     blueprint.session.get.return_value = type(
         "_", (), {"json": lambda: {"email": account.email, "id": "12345"}, "ok": True}
     )
-    assert not zgiam.auth._google_logged_in(blueprint, {"token": "..."})
+    with zgiam.core.get_app().test_request_context():
+        assert not zgiam.auth._google_logged_in(blueprint, {"token": "..."})
+        assert zgiam.auth._get_session_oauth_created_at(account.id)
+
+
+def test_login_account_token_cache(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    account_token = unittest_data.account_token1
+    db.session.add_all([account, account_token])
+    db.session.commit()
+
+    @app.route("/test")
+    @flask_login.login_required
+    def _():
+        return {"id": flask_login.current_user.id}
+
+    token_cache = zgiam.auth.get_token_cache()
+    with app.test_client() as client:
+        for _ in range(2):
+            response = client.get("/test", headers={"token": account_token.token})
+            assert response.status_code == 200
+            assert response.json["id"] == account.id
+    assert token_cache.stats()["hits"] == 1
+    assert token_cache.stats()["misses"] == 1
+
+
+def test_login_account_token_cache_invalidate(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    account_token = unittest_data.account_token1
+    db.session.add_all([account, account_token])
+    db.session.commit()
+
+    @app.route("/test")
+    @flask_login.login_required
+    def _():
+        return {"message": "ok"}
+
+    with app.test_client() as client:
+        response = client.get("/test", headers={"token": account_token.token})
+        assert response.status_code == 200
+        account_token.expire_time = datetime.datetime.now()
+        db.session.commit()
+        zgiam.auth.invalidate_token_cache(account_token.token)
+        response = client.get("/test", headers={"token": account_token.token})
+        assert response.status_code == 401
+
+
+def test_invalidate_token_cache_by_account(app):  # pylint: disable=unused-argument
+    token_cache = zgiam.auth.get_token_cache()
+    token_cache.set("token1", {"id": "accounto"})
+    token_cache.set("token2", {"id": "accountt"})
+    zgiam.auth.invalidate_token_cache(account_id="accounto")
+    assert token_cache.get("token1") is None
+    assert token_cache.get("token2") == {"id": "accountt"}
+
+
+def test_login_account_jwt_token(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    zgiam.lib.config.get_config().set("CORE", "TOKEN_VERIFY_MODE", "jwt")
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    with app.app_context():
+        token = flask_jwt_extended.create_access_token(account.id)
+    account_token = zgiam.models.AccountToken(account_id=account.id, token=token)
+    db.session.add_all([account, account_token])
+    db.session.commit()
+
+    @app.route("/test")
+    @flask_login.login_required
+    def _():
+        return {"id": flask_login.current_user.id}
+
+    with app.test_client() as client:
+        response = client.get("/test", headers={"token": token})
+        assert response.status_code == 200
+        assert response.json["id"] == account.id
+        response = client.get("/test", headers={"token": "it must fail"})
+        assert response.status_code == 401
+        zgiam.auth.revoke_token(token)
+        response = client.get("/test", headers={"token": token})
+        assert response.status_code == 401
+
+
+def test_token_denylist_refresh(db, unittest_data):
+    account = unittest_data.account1
+    account_token = unittest_data.account_token1
+    db.session.add_all([account, account_token])
+    db.session.commit()
+    denylist = zgiam.auth.get_token_denylist()
+    assert not denylist.is_revoked(account_token.token)
+    account_token.expire_time = datetime.datetime.now()
+    db.session.commit()
+    assert not denylist.is_revoked(account_token.token)
+    denylist.refresh()
+    assert denylist.is_revoked(account_token.token)
+    denylist.refresh()
+    assert len(denylist) == 1
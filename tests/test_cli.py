@@ -0,0 +1,90 @@
+"""testing for zgiam.cli module"""
+# pylint: disable=C0116,W0621,W0212,W0611
+import json
+import mock
+import click.testing
+import zgiam.cli
+import zgiam.database
+
+
+def test_init():
+    module = zgiam.cli
+    with mock.patch.object(module, "main", return_value=42):
+        with mock.patch.object(module, "__name__", "__main__"):
+            with mock.patch.object(module.sys, "exit") as mock_exit:
+                module.init()
+                assert mock_exit.call_args[0][0] == 42
+
+
+def test_main():
+    with mock.patch.object(zgiam.cli, "cli") as mock_cli:
+        zgiam.cli.main()
+        assert mock_cli.called
+
+
+def test_export_accounts(app, unittest_data):  # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    db.session.add_all([unittest_data.account1, unittest_data.group1])
+    unittest_data.account1.groups.append(unittest_data.group1)
+    db.session.commit()
+    runner = click.testing.CliRunner()
+    result = runner.invoke(zgiam.cli.cli, ["export-accounts", "--groups"])
+    assert result.exit_code == 0
+    row = json.loads(result.output)
+    assert row["id"] == "accounto"
+    assert row["groups"] == ["group1@team.com"]
+
+    result = runner.invoke(zgiam.cli.cli, ["export-accounts", "--format", "csv"])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[0].startswith("email,first_name")
+
+
+def test_import_accounts(app, unittest_data):  # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    db.session.add(unittest_data.account1)
+    db.session.commit()
+    runner = click.testing.CliRunner()
+    data = "email,first_name,last_name,phone_number\n"
+    data += "new1@iam.test,new,one,+1\n"
+    result = runner.invoke(zgiam.cli.cli, ["import-accounts", "--format", "csv", "-"], input=data)
+    assert result.exit_code == 0
+    assert json.loads(result.output) == {"row": 1, "email": "new1@iam.test", "message": "CREATED"}
+
+    data += "accounto@iam.test,account,one,+1\n"
+    data += "new2@iam.test,new,two,\n"
+    result = runner.invoke(zgiam.cli.cli, ["import-accounts", "--format", "csv", "-"], input=data)
+    assert result.exit_code == 1
+    assert [json.loads(line)["message"] for line in result.output.splitlines()] == [
+        "DUPLICATE",
+        "DUPLICATE",
+        "ERROR: Required field 'phone_number' field missing",
+    ]
+
+
+def test_sync_directory(app):  # pylint: disable=unused-argument
+    runner = click.testing.CliRunner()
+    report = {"entity_type": "user", "action": "insert", "key": "a@iam.test", "message": "PLANNED"}
+    with mock.patch("zgiam.sync.sync_directory", return_value=[report]) as sync_directory:
+        result = runner.invoke(zgiam.cli.cli, ["sync-directory", "--dry-run"])
+    assert result.exit_code == 0
+    assert json.loads(result.output) == report
+    sync_directory.assert_called_once_with(dry_run=True)
+
+    report = dict(report, message="ERROR: forbidden")
+    with mock.patch("zgiam.sync.sync_directory", return_value=[report]):
+        result = runner.invoke(zgiam.cli.cli, ["sync-directory"])
+    assert result.exit_code == 1
+
+
+def test_sweep_retention(app):  # pylint: disable=unused-argument
+    runner = click.testing.CliRunner()
+    report = {"table": "oauth", "deleted": 2, "seconds": 0.01, "message": "SUCCESS"}
+    with mock.patch("zgiam.retention.sweep", return_value=[report]):
+        result = runner.invoke(zgiam.cli.cli, ["sweep-retention"])
+    assert result.exit_code == 0
+    assert json.loads(result.output) == report
+
+    report = dict(report, message="ERROR: database is locked")
+    with mock.patch("zgiam.retention.sweep", return_value=[report]):
+        result = runner.invoke(zgiam.cli.cli, ["sweep-retention"])
+    assert result.exit_code == 1
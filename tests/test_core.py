@@ -1,3 +1,16 @@
 """testing for zgiam.core module"""
 # pylint: disable=C0116,W0621,W0212,W0611
 # NOTE: we may already test core in other module
+import os
+import subprocess
+import sys
+
+import pytest
+
+_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", ["zgiam.models", "zgiam.database", "zgiam.auth", "zgiam.core"])
+def test_import_first(module):
+    # a fresh interpreter, the modules are not imported yet by the tests
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True, cwd=_ROOT)
@@ -0,0 +1,79 @@
+"""testing for zgiam.instrumentation module"""
+# pylint: disable=C0116,W0621,W0212,W0611
+import flask
+import mock
+import sqlalchemy
+
+import zgiam.core
+import zgiam.database
+import zgiam.instrumentation
+
+
+def test_metrics(app, unittest_data):
+    app.config.pop("LOGIN_DISABLED")
+    db = zgiam.database.get_db()
+    db.session.add_all([unittest_data.account1, unittest_data.account_token1])
+    db.session.commit()
+    with app.test_client() as client:
+        response = client.get(
+            "/api/v1/account/info", headers={"token": unittest_data.account_token1.token}
+        )
+        assert response.status_code == 200
+        client.get("/api/v1/not_found")
+        response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.data.decode()
+    labels = 'endpoint="/api/v1/account/info"'
+    assert f'zgiam_http_requests_total{{{labels},method="GET",status="200"}} 1' in text
+    assert 'zgiam_http_requests_total{endpoint="<unmatched>",method="GET",status="404"} 1' in text
+    assert f'zgiam_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+    assert f"zgiam_http_request_duration_seconds_count{{{labels}}} 1" in text
+    stats = zgiam.instrumentation.get_request_metrics().endpoints["/api/v1/account/info"]
+    assert stats.queries >= 1
+    assert f"zgiam_db_queries_total{{{labels}}} {stats.queries}" in text
+    assert "zgiam_db_pool_checkouts" in text
+    assert "zgiam_google_api_calls 0" in text
+    assert 'zgiam_google_api_latency_seconds_bucket{le="+Inf"} 0' in text
+    assert "zgiam_token_cache_hits" in text
+
+
+def test_slow_and_repeated_queries(app):
+    metrics = zgiam.instrumentation.get_request_metrics()
+    metrics.slow_query_threshold = 0
+    metrics.repeated_query_threshold = 3
+    metrics.log_requests = True
+    db = zgiam.database.get_db()
+    with mock.patch.object(zgiam.instrumentation, "logger") as logger_mock:
+        with app.test_request_context("/api/v1/account/info"):
+            flask.request.url_rule = next(app.url_map.iter_rules("metrics"))
+            zgiam.instrumentation._start_request()
+            for _ in range(3):
+                db.session.execute(sqlalchemy.text("SELECT 1"))
+            zgiam.instrumentation._save_status(flask.Response())
+            zgiam.instrumentation._finish_request(None)
+    warnings = [call.args[1] for call in logger_mock.warning.call_args_list]
+    assert sum('"sql": "SELECT 1"' in warning for warning in warnings) == 4
+    assert any('"count": 3' in warning for warning in warnings)
+    assert '"queries": 3' in logger_mock.info.call_args.args[1]
+    stats = metrics.endpoints["/metrics"]
+    assert stats.slow_queries == 3
+    assert stats.slow_query_samples[-1][1] == "SELECT 1"
+    assert stats.requests == {("GET", 200): 1}
+
+
+def test_queries_outside_request(app):  # pylint: disable=unused-argument
+    metrics = zgiam.instrumentation.get_request_metrics()
+    metrics.slow_query_threshold = 0
+    zgiam.database.get_db().session.execute(sqlalchemy.text("SELECT 1"))
+    assert metrics.endpoints["<none>"].slow_queries == 1
+
+
+def test_labels_escape():
+    assert zgiam.instrumentation._labels(a='x"\\\n') == '{a="x\\"\\\\\\n"}'
+
+
+def test_metrics_disabled(config):
+    config.set("METRICS", "ENABLED", "False")
+    app = zgiam.core.get_app()
+    assert "metrics" not in app.view_functions
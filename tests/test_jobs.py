@@ -0,0 +1,230 @@
+"""testing for zgiam.jobs module"""
+# pylint: disable=C0116,W0621,W0212,W0611
+import datetime
+import mock
+import pytest
+import googleapiclient.errors
+
+import zgiam.database
+import zgiam.jobs
+import zgiam.lib.google
+import zgiam.models
+
+
+@mock.patch("zgiam.lib.google.AdminDirectory")
+def test_create_google_workspace_account(admin_directory_mock, config, unittest_data):
+    zgiam.jobs.create_google_workspace_account(unittest_data.account1)
+    body = admin_directory_mock().users.insert.call_args.kwargs["body"]
+    assert body["primaryEmail"] == f"accounto@{config.get('CORE', 'PRIMARY_DOMAIN')}"
+
+
+@mock.patch("time.sleep")
+@mock.patch("zgiam.lib.google.AdminDirectory")
+def test_create_google_workspace_account_rate_limited(
+    admin_directory_mock, sleep_mock, config, unittest_data
+):  # pylint: disable=unused-argument
+    rate_limited = googleapiclient.errors.HttpError(
+        mock.Mock(status=403), b'{"error": {"errors": [{"reason": "rateLimitExceeded"}]}}'
+    )
+    admin_directory_mock().users.insert().execute.side_effect = [rate_limited, {}]
+    zgiam.jobs.create_google_workspace_account(unittest_data.account1)
+    assert sleep_mock.call_count == 1
+    assert zgiam.lib.google.get_executor().metrics.stats()["retries"] == 1
+
+
+@mock.patch("zgiam.lib.google.AdminDirectory")
+def test_create_google_workspace_accounts_in_batches(
+    admin_directory_mock, config, unittest_data, batch_http_request
+):
+    config.set("GOOGLE_API", "BATCH_SIZE", "1")
+    batch_http_request(admin_directory_mock)
+    accounts = [unittest_data.account1, unittest_data.account2]
+    results = zgiam.jobs.create_google_workspace_accounts(accounts)
+    assert results == {account.email: None for account in accounts}
+    assert admin_directory_mock().service.new_batch_http_request.call_count == 2
+
+
+@mock.patch("zgiam.lib.google.AdminDirectory")
+def test_create_google_workspace_accounts_no_response(
+    _, config, unittest_data
+):  # pylint: disable=unused-argument
+    results = zgiam.jobs.create_google_workspace_accounts([unittest_data.account1])
+    assert isinstance(results[unittest_data.account1.email], RuntimeError)
+    assert zgiam.jobs.create_google_workspace_accounts([]) == {}
+
+
+@pytest.fixture
+def job_handlers():
+    calls = []
+
+    @zgiam.jobs.job_handler("test_ok")
+    def _(payload):
+        calls.append(payload)
+        return {"ok": True}
+
+    @zgiam.jobs.job_handler("test_fail")
+    def _(payload):
+        calls.append(payload)
+        raise ValueError("this must fail")
+
+    yield calls
+    del zgiam.jobs._handlers["test_ok"]
+    del zgiam.jobs._handlers["test_fail"]
+
+
+def test_enqueue_unknown_job(db):  # pylint: disable=unused-argument
+    with pytest.raises(KeyError):
+        zgiam.jobs.enqueue("no_such_job", {})
+
+
+def test_worker_run_job(app, job_handlers):  # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    job = zgiam.jobs.enqueue("test_ok", {"value": 1})
+    db.session.commit()
+    job_id = job.id
+    assert repr(job) == f"Job<id: {job.id}, type: test_ok, status: QUEUED>"
+    worker = zgiam.jobs.Worker()
+    assert worker.run_once() == 1
+    assert job_handlers == [{"value": 1}]
+    job = db.session.query(zgiam.models.Job).get(job_id)
+    assert job.status == "SUCCEEDED"
+    assert job.result == {"ok": True}
+    assert job.attempts == 1
+    assert worker.run_once() == 0
+
+
+def test_worker_retry_job(app, job_handlers):  # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    job = zgiam.jobs.enqueue("test_fail", {}, max_attempts=2)
+    db.session.commit()
+    job_id = job.id
+    worker = zgiam.jobs.Worker()
+    worker.run_once()
+    job = db.session.query(zgiam.models.Job).get(job_id)
+    assert job.status == "QUEUED"
+    assert "this must fail" in job.error
+    assert job.run_after > datetime.datetime.utcnow()
+    # not due yet
+    assert worker.run_once() == 0
+
+    job.run_after = datetime.datetime.utcnow()
+    db.session.commit()
+    worker.run_once()
+    job = db.session.query(zgiam.models.Job).get(job_id)
+    assert job.status == "FAILED"
+    assert job.attempts == 2
+    assert len(job_handlers) == 2
+
+
+def test_worker_claim_expired_lease(app, job_handlers):  # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    job = zgiam.jobs.enqueue("test_ok", {})
+    db.session.commit()
+    job_id = job.id
+    worker = zgiam.jobs.Worker()
+    assert worker.claim(0) == []
+    assert worker.claim(1) == [job.id]
+    assert worker.claim(1) == []
+    job = db.session.query(zgiam.models.Job).get(job_id)
+    job.updated_at = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=worker.lease_timeout + 1
+    )
+    db.session.commit()
+    assert worker.claim(1) == [job.id]
+
+
+def test_worker_run_until_stop(app, job_handlers):  # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    zgiam.jobs.enqueue("test_ok", {})
+    db.session.commit()
+    worker = zgiam.jobs.Worker(poll_interval=0.01)
+    with mock.patch.object(worker, "claim", wraps=worker.claim) as claim_mock:
+
+        def _claim(limit):
+            if claim_mock.call_count > 2:
+                worker.stop_event.set()
+            return worker.__class__.claim(worker, limit)
+
+        claim_mock.side_effect = _claim
+        worker.run()
+    assert job_handlers == [{}]
+
+
+def test_worker_run_retention_sweep(app, job_handlers):  # pylint: disable=unused-argument
+    worker = zgiam.jobs.Worker(poll_interval=0.01)
+    worker.retention_interval = 3600
+    with mock.patch("zgiam.retention.sweep") as sweep_mock:
+        with mock.patch.object(worker, "claim") as claim_mock:
+
+            def _claim(_):
+                if claim_mock.call_count > 2:
+                    worker.stop_event.set()
+                return []
+
+            claim_mock.side_effect = _claim
+            worker.run()
+    # once at start, not again before the interval passed
+    assert sweep_mock.call_count == 1
+
+    with mock.patch("zgiam.retention.sweep", side_effect=RuntimeError("sweep failed")):
+        worker.run_retention_sweep()
+
+
+@mock.patch("zgiam.lib.google.AdminDirectory")
+def test_create_google_workspace_account_job(_, app, unittest_data):
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    db.session.add(account)
+    job = zgiam.jobs.enqueue("create_google_workspace_account", {"email": account.email})
+    db.session.commit()
+    job_id = job.id
+    zgiam.jobs.Worker().run_once()
+    job = db.session.query(zgiam.models.Job).get(job_id)
+    assert job.status == "SUCCEEDED"
+    assert job.result == {"id": "accounto"}
+    account = db.session.query(zgiam.models.Account).filter_by(id="accounto").one()
+    assert account.has_iam_google_account
+
+
+def test_create_google_workspace_account_job_no_transaction(app, unittest_data):
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    db.session.add(account)
+    job = zgiam.jobs.enqueue("create_google_workspace_account", {"email": account.email})
+    db.session.commit()
+    job_id = job.id
+
+    def _insert(body):
+        assert not db.session().in_transaction()
+        assert body["recoveryEmail"] == "accounto@iam.test"
+
+    with mock.patch("zgiam.jobs.insert_google_workspace_account", side_effect=_insert) as insert:
+        zgiam.jobs.Worker().run_once()
+    assert insert.call_count == 1
+    assert db.session.query(zgiam.models.Job).get(job_id).status == "SUCCEEDED"
+
+
+@mock.patch("zgiam.lib.google.AdminDirectory")
+def test_create_google_workspace_account_job_rerun(admin_directory_mock, app, unittest_data):
+    db = zgiam.database.get_db()
+    account = unittest_data.account1
+    db.session.add(account)
+    db.session.commit()
+    # the last run created the Google account but the job did not finish
+    admin_directory_mock().users.insert().execute.side_effect = googleapiclient.errors.HttpError(
+        mock.Mock(status=409), b'{"error": {"message": "Entity already exists."}}'
+    )
+    job = zgiam.jobs.enqueue("create_google_workspace_account", {"email": account.email})
+    db.session.commit()
+    job_id = job.id
+    zgiam.jobs.Worker().run_once()
+    job = db.session.query(zgiam.models.Job).get(job_id)
+    assert job.status == "SUCCEEDED"
+    account = db.session.query(zgiam.models.Account).filter_by(id="accounto").one()
+    assert account.has_iam_google_account
+
+    admin_directory_mock().users.insert().execute.side_effect = googleapiclient.errors.HttpError(
+        mock.Mock(status=400), b""
+    )
+    with pytest.raises(googleapiclient.errors.HttpError):
+        zgiam.jobs.create_google_workspace_account(account)
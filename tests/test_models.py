@@ -1,6 +1,7 @@
 """testing for zgiam.models module"""
 # pylint: disable=C0116,W0621,W0212,W0611
 import pytest
+import mock
 import sqlalchemy.exc
 import zgiam.models
 
@@ -112,6 +113,18 @@ def test_account_token_create(db, unittest_data):
     assert repr(readback_account_token) == "AccountToken<account_id: accounto, partial token: ...>"
 
 
+def test_account_token_store_digest_only(db, unittest_data):
+    db.session.add_all([unittest_data.account1, unittest_data.account_token1])
+    db.session.commit()
+    db.session.expunge_all()
+    account_token = db.session.query(zgiam.models.AccountToken).one()
+    assert account_token.token is None
+    assert account_token.token_hash == zgiam.models.hash_token("...")
+    assert len(account_token.token_hash) == 32
+    assert account_token.check_token("...")
+    assert not account_token.check_token("..")
+
+
 def test_account_id_create_no_duplicate_name(db, unittest_data):
     account = unittest_data.account1
     expect_id = account.id
@@ -140,3 +153,103 @@ def test_account_id_already_exist(db, unittest_data):
     db.session.commit()
     readback_account = db.session.query(zgiam.models.Account).filter_by(email=account.email).one()
     assert readback_account.id == account.generate_id()
+
+
+def test_account_id_sequence_allocate(db, unittest_data):
+    account1 = unittest_data.account1
+    account3 = unittest_data.account3
+    account3.id = None
+    db.session.add_all([account1, account3])
+    db.session.commit()
+    assert account3.generate_id() == "accounto1"
+    sequence = db.session.query(zgiam.models.AccountIdSequence).filter_by(base_id="accounto").one()
+    assert repr(sequence) == "AccountIdSequence<base_id: accounto, next_suffix: 2>"
+    assert zgiam.models.allocate_account_id_suffixes(db.session, "accounto", 3) == 2
+    assert zgiam.models.allocate_account_id_suffixes(db.session, "accounto") == 5
+
+
+def test_account_id_sequence_not_overlap_prefix(db, unittest_data):
+    account = unittest_data.account1
+    account.id = "accountone"
+    db.session.add(account)
+    db.session.commit()
+    assert zgiam.models.allocate_account_id_suffixes(db.session, "accounto") == 0
+    assert zgiam.models.allocate_account_id_suffixes(db.session, "account_") == 0
+
+
+def test_generate_account_ids(db, unittest_data):
+    account1 = unittest_data.account1
+    account3 = unittest_data.account3
+    account3.id = None
+    account4 = zgiam.models.Account(
+        email="accountor@iam.test", first_name="account", last_name="o", phone_number="+1"
+    )
+    account5 = zgiam.models.Account(
+        email="accountf@iam.test", first_name="account", last_name="five", phone_number="+1"
+    )
+    db.session.add_all([account1, account3, account4, account5])
+    db.session.commit()
+    zgiam.models.generate_account_ids(db.session, [account1, account3, account4, account5])
+    db.session.commit()
+    assert account1.id == "accounto"
+    assert account5.id == "accountf"
+    assert (account3.id, account4.id) == ("accounto1", "accounto2")
+    sequence = db.session.query(zgiam.models.AccountIdSequence).filter_by(base_id="accounto").one()
+    assert sequence.next_suffix == 3
+
+
+@mock.patch("zgiam.database.insert_ignore")
+@mock.patch("zgiam.models._next_existing_account_id_suffix", return_value=0)
+def test_account_id_sequence_seed_race(_, __):
+    session = mock.Mock()
+    session.connection().execute.return_value.rowcount = 0
+    with pytest.raises(RuntimeError):
+        zgiam.models.allocate_account_id_suffixes(session, "accounto")
+
+
+def test_change_group_members(db, unittest_data):
+    group = unittest_data.group1
+    db.session.add_all([unittest_data.account1, unittest_data.account2, group])
+    db.session.commit()
+    assert group.accounts == []
+
+    added, removed = zgiam.models.change_group_members(
+        db.session, group.id, add=["accounto", "accountt"]
+    )
+    assert (added, removed) == ({"accounto", "accountt"}, set())
+    assert {account.id for account in group.accounts} == {"accounto", "accountt"}
+    assert unittest_data.account1.groups == [group]
+
+    added, removed = zgiam.models.change_group_members(
+        db.session, group.id, add=["accounto"], remove=["accountt", "nobody"]
+    )
+    assert (added, removed) == (set(), {"accountt"})
+    db.session.commit()
+    assert zgiam.models.get_group_member_ids(db.session, group.id) == {"accounto"}
+
+
+def test_replace_group_members(db, unittest_data):
+    group = unittest_data.group1
+    db.session.add_all([unittest_data.account1, unittest_data.account2, group])
+    db.session.commit()
+    zgiam.models.change_group_members(db.session, group.id, add=["accounto"])
+
+    with mock.patch.object(zgiam.models, "_MEMBERSHIP_CHUNK_SIZE", 1):
+        added, removed = zgiam.models.replace_group_members(db.session, group.id, ["accountt"])
+    assert (added, removed) == ({"accountt"}, {"accounto"})
+    assert [account.id for account in group.accounts] == ["accountt"]
+    assert zgiam.models.replace_group_members(db.session, group.id, ["accountt"]) == (set(), set())
+
+
+def test_change_group_members_added_concurrently(db, unittest_data):
+    group = unittest_data.group1
+    db.session.add_all([unittest_data.account1, group])
+    db.session.commit()
+    zgiam.models.change_group_members(db.session, group.id, add=["accounto"])
+    db.session.commit()
+
+    # another request added the member after this one read the members
+    with mock.patch("zgiam.models.get_group_member_ids", return_value=set()):
+        zgiam.models.change_group_members(db.session, group.id, add=["accounto"])
+    db.session.commit()
+    assert zgiam.models.get_group_member_ids(db.session, group.id) == {"accounto"}
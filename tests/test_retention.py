@@ -0,0 +1,72 @@
+"""testing for zgiam.retention module"""
+# pylint: disable=C0116,W0621,W0212,W0611
+import datetime
+import pytest
+
+import zgiam.core
+import zgiam.database
+import zgiam.lib.config
+import zgiam.models
+import zgiam.retention
+
+
+NOW = datetime.datetime(2026, 10, 18)
+
+
+@pytest.fixture
+def retention_data(app, unittest_data):  # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    db.session.add_all([unittest_data.account1, unittest_data.account_token1])
+    for i, days in enumerate([1, 40, 50]):
+        db.session.add(
+            zgiam.models.AccountToken(
+                account_id="accounto",
+                token=f"expired{i}",
+                expire_time=NOW - datetime.timedelta(days=days),
+            )
+        )
+    unittest_data.oauth1.created_at = NOW - datetime.timedelta(days=2)
+    db.session.add(unittest_data.oauth1)
+    for key, seconds in (("a", -1), ("b", 1)):
+        expire_at = NOW + datetime.timedelta(seconds=seconds)
+        db.session.add(zgiam.models.WebSession(id=key * 64, data="{}", expire_at=expire_at))
+    db.session.commit()
+    return db
+
+
+def test_sweep(retention_data):
+    db = retention_data
+    zgiam.lib.config.get_config().set("CORE", "RETENTION_BATCH_SIZE", "1")
+    reports = zgiam.retention.sweep(NOW)
+    assert [(report["table"], report["deleted"], report["message"]) for report in reports] == [
+        ("account_token", 2, "SUCCESS"),
+        ("oauth", 1, "SUCCESS"),
+        ("web_session", 1, "SUCCESS"),
+    ]
+    assert all(report["seconds"] >= 0 for report in reports)
+    tokens = db.session.query(zgiam.models.AccountToken).all()
+    assert sorted(token.token_hash for token in tokens) == sorted(
+        zgiam.models.hash_token(token) for token in ["...", "expired0"]
+    )
+    assert db.session.query(zgiam.models.OAuth).count() == 0
+    assert db.session.query(zgiam.models.WebSession.id).all() == [("b" * 64,)]
+    assert [report["deleted"] for report in zgiam.retention.sweep(NOW)] == [0, 0, 0]
+
+
+def test_sweep_keep_forever(retention_data):
+    sweeper = zgiam.retention.RetentionSweeper(expired_token_days=0, oauth_seconds=0)
+    reports = sweeper.run(NOW)
+    assert [report["message"] for report in reports] == ["SKIPPED", "SKIPPED", "SUCCESS"]
+    assert retention_data.session.query(zgiam.models.AccountToken).count() == 4
+
+
+def test_sweep_jwt_mode_keep_revoked_tokens(retention_data):
+    zgiam.lib.config.get_config().set("CORE", "TOKEN_VERIFY_MODE", "jwt")
+    app = zgiam.core.get_app()
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = False
+    sweeper = zgiam.retention.RetentionSweeper()
+    assert sweeper.run(NOW)[0]["message"] == "SKIPPED"
+
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = 45 * 86400
+    assert sweeper.run(NOW)[0]["deleted"] == 1
+    assert retention_data.session.query(zgiam.models.AccountToken).count() == 3
@@ -0,0 +1,104 @@
+"""testing for zgiam.session module"""
+# pylint: disable=C0116,W0621,W0212,W0611
+import datetime
+import flask
+import flask_login
+import mock
+import pytest
+
+import zgiam.database
+import zgiam.lib.config
+import zgiam.models
+import zgiam.session
+
+
+@pytest.fixture
+def session_app(app):
+    @app.route("/test/login")
+    def _login():
+        flask.session["account"] = "accounto"
+        return "ok"
+
+    @app.route("/test/read")
+    def _read():
+        return flask.session.get("account", "")
+
+    @app.route("/test/login_user")
+    def _login_user():
+        db = zgiam.database.get_db()
+        flask_login.login_user(db.session.query(zgiam.models.Account).first())
+        return "ok"
+
+    @app.route("/test/logout")
+    def _logout():
+        flask.session.clear()
+        return "ok"
+
+    return app
+
+
+def _set_cookies(response):
+    return response.headers.getlist("Set-Cookie")
+
+
+def test_refresh_session_throttled(session_app):
+    with session_app.test_client() as client:
+        assert _set_cookies(client.get("/test/read")) == []
+        response = client.get("/test/login")
+        assert len(_set_cookies(response)) == 1
+        assert "Expires=" in _set_cookies(response)[0]
+        assert flask.session["_refreshed_at"]
+        # not due, nothing changed
+        assert _set_cookies(client.get("/test/read")) == []
+
+        lifetime = session_app.permanent_session_lifetime.total_seconds()
+        with mock.patch("time.time", return_value=flask.session["_refreshed_at"] + lifetime):
+            assert len(_set_cookies(client.get("/test/read"))) == 1
+
+
+def test_refresh_session_every_request(session_app):
+    zgiam.lib.config.get_config().set("CORE", "SESSION_REFRESH_FRACTION", "0")
+    with session_app.test_client() as client:
+        client.get("/test/login")
+        assert len(_set_cookies(client.get("/test/read"))) == 1
+
+
+def test_database_session(session_app):
+    session_app.session_interface = zgiam.session.DatabaseSessionInterface()
+    db = zgiam.database.get_db()
+    with session_app.test_client() as client:
+        set_cookie = _set_cookies(client.get("/test/login"))[0]
+        assert "accounto" not in set_cookie
+        web_session = db.session.query(zgiam.models.WebSession).one()
+        assert "accounto" in web_session.data
+        assert web_session.expire_at > datetime.datetime.utcnow()
+        assert client.get("/test/read").data == b"accounto"
+
+        db.session.query(zgiam.models.WebSession).update({"expire_at": datetime.datetime.utcnow()})
+        db.session.commit()
+        assert client.get("/test/read").data == b""
+
+        client.get("/test/login")
+        response = client.get("/test/logout")
+        assert "session=;" in _set_cookies(response)[0]
+        assert db.session.query(zgiam.models.WebSession).count() == 1
+
+
+def test_database_session_regenerated_on_login(session_app, unittest_data):
+    session_app.session_interface = zgiam.session.DatabaseSessionInterface()
+    db = zgiam.database.get_db()
+    db.session.add(unittest_data.account1)
+    db.session.commit()
+    with session_app.test_client() as client:
+        planted_sid = _set_cookies(client.get("/test/login"))[0].split(";")[0]
+        logged_in_sid = _set_cookies(client.get("/test/login_user"))[0].split(";")[0]
+        assert logged_in_sid != planted_sid
+        # the session data is kept, the planted sid is no longer stored
+        assert client.get("/test/read").data == b"accounto"
+        assert db.session.query(zgiam.models.WebSession).count() == 1
+
+
+def test_init_app_unsupported_backend(app):
+    zgiam.lib.config.get_config().set("CORE", "SESSION_BACKEND", "memcached")
+    with pytest.raises(TypeError):
+        zgiam.session.init_app(app)
@@ -0,0 +1,154 @@
+"""testing for zgiam.sync module"""
+# pylint: disable=C0116,W0621,W0212,W0611
+import mock
+import pytest
+
+import zgiam.database
+import zgiam.lib.config
+import zgiam.models
+import zgiam.sync
+
+
+@pytest.fixture
+def sync_data(app, unittest_data):  # pylint: disable=unused-argument
+    db = zgiam.database.get_db()
+    for account in (unittest_data.account1, unittest_data.account2):
+        account.review_status = "APPROVED"
+    unittest_data.group1.english_name = "Group One"
+    db.session.add_all([unittest_data.account1, unittest_data.account2, unittest_data.group1])
+    db.session.commit()
+    zgiam.models.change_group_members(db.session, unittest_data.group1.id, add=["accounto"])
+    db.session.commit()
+    return unittest_data
+
+
+def _messages(reports):
+    return {(r["entity_type"], r["action"], r["key"]): r["message"] for r in reports}
+
+
+def test_sync_directory_dry_run(sync_data, fake_directory):  # pylint: disable=unused-argument
+    reports = zgiam.sync.sync_directory(fake_directory, dry_run=True)
+    assert _messages(reports) == {
+        ("user", "insert", "accounto@iam.test"): "PLANNED",
+        ("user", "insert", "accountt@iam.test"): "PLANNED",
+        ("group", "insert", "group1@team.com"): "PLANNED",
+        ("member", "insert", "accounto@iam.test"): "PLANNED",
+    }
+    assert fake_directory.writes() == []
+    db = zgiam.database.get_db()
+    assert db.session.query(zgiam.models.SyncState).count() == 0
+
+
+def test_sync_directory(sync_data, fake_directory):  # pylint: disable=unused-argument
+    reports = zgiam.sync.sync_directory(fake_directory)
+    assert set(_messages(reports).values()) == {"SUCCESS"}
+    assert set(fake_directory.users_data) == {"accounto@iam.test", "accountt@iam.test"}
+    assert fake_directory.users_data["accounto@iam.test"]["password"] == "+10001112222;1,1234"
+    assert fake_directory.groups_data["group1@team.com"]["name"] == "Group One"
+    assert fake_directory.members_data["group1@team.com"] == {"accounto@iam.test"}
+    # users and groups in one batch, members in another
+    assert fake_directory.batches == 2
+
+    db = zgiam.database.get_db()
+    states = {
+        (state.entity_type, state.entity_key): state
+        for state in db.session.query(zgiam.models.SyncState)
+    }
+    assert set(states) == {
+        ("user", "accounto@iam.test"),
+        ("user", "accountt@iam.test"),
+        ("group", "group1@team.com"),
+        ("members", "group1@team.com"),
+    }
+    assert states[("user", "accounto@iam.test")].etag == (
+        fake_directory.users_data["accounto@iam.test"]["etag"]
+    )
+    account = db.session.query(zgiam.models.Account).filter_by(id="accounto").one()
+    assert account.has_iam_google_account
+
+    # nothing changed, only users and groups are listed
+    fake_directory.calls.clear()
+    assert zgiam.sync.sync_directory(fake_directory) == []
+    assert [call[:2] for call in fake_directory.calls] == [("users", "list"), ("groups", "list")]
+    assert "etag" in fake_directory.calls[0][2]["fields"]
+
+
+def test_sync_directory_changes(sync_data, fake_directory):
+    zgiam.sync.sync_directory(fake_directory)
+    db = zgiam.database.get_db()
+    account = db.session.query(zgiam.models.Account).filter_by(id="accountt").one()
+    account.first_name = "Changed"
+    db.session.commit()
+    zgiam.models.replace_group_members(db.session, sync_data.group1.id, ["accountt"])
+    db.session.commit()
+    # changed in the admin console
+    fake_directory.users_data["accounto@iam.test"].update(name={"givenName": "X"}, etag='"console"')
+    fake_directory.users_data["admin@iam.test"] = {"primaryEmail": "admin@iam.test", "etag": "1"}
+
+    fake_directory.calls.clear()
+    reports = zgiam.sync.sync_directory(fake_directory)
+    assert _messages(reports) == {
+        ("user", "update", "accounto@iam.test"): "SUCCESS",
+        ("user", "update", "accountt@iam.test"): "SUCCESS",
+        ("user", "unmanaged", "admin@iam.test"): "UNMANAGED",
+        ("member", "insert", "accountt@iam.test"): "SUCCESS",
+        ("member", "delete", "accounto@iam.test"): "SUCCESS",
+    }
+    assert fake_directory.users_data["accounto@iam.test"]["name"]["givenName"] == "account"
+    assert fake_directory.users_data["accountt@iam.test"]["name"]["givenName"] == "Changed"
+    assert fake_directory.members_data["group1@team.com"] == {"accountt@iam.test"}
+    patches = [call for call in fake_directory.writes() if call[:2] == ("users", "patch")]
+    assert all("password" not in call[2]["body"] for call in patches)
+
+
+def test_sync_directory_failed_push_retried(sync_data, fake_directory):  # pylint: disable=W0613
+    with mock.patch.object(
+        fake_directory, "_groups_insert", side_effect=fake_directory._error(403)
+    ):
+        reports = zgiam.sync.sync_directory(fake_directory)
+    messages = _messages(reports)
+    assert messages[("group", "insert", "group1@team.com")].startswith("ERROR")
+    assert messages[("member", "insert", "accounto@iam.test")].startswith("ERROR")
+    assert messages[("user", "insert", "accounto@iam.test")] == "SUCCESS"
+    db = zgiam.database.get_db()
+    assert {state.entity_type for state in db.session.query(zgiam.models.SyncState)} == {"user"}
+
+    reports = zgiam.sync.sync_directory(fake_directory)
+    assert _messages(reports) == {
+        ("group", "insert", "group1@team.com"): "SUCCESS",
+        ("member", "insert", "accounto@iam.test"): "SUCCESS",
+    }
+
+
+def test_sync_directory_no_transaction_open(sync_data, fake_directory):  # pylint: disable=W0613
+    session = zgiam.database.get_db().session
+    in_transaction = []
+
+    def _watch(name):
+        method = getattr(fake_directory, name)
+
+        def _call(*args, **kwargs):
+            in_transaction.append(session().in_transaction())
+            return method(*args, **kwargs)
+
+        return mock.patch.object(fake_directory, name, side_effect=_call)
+
+    with _watch("_users_list"), _watch("_users_insert"), _watch("_members_insert"):
+        reports = zgiam.sync.sync_directory(fake_directory)
+    assert set(_messages(reports).values()) == {"SUCCESS"}
+    assert in_transaction and not any(in_transaction)
+    assert zgiam.database.get_db().session.query(zgiam.models.SyncState).count() == 4
+
+
+def test_sync_directory_paging(sync_data, fake_directory):  # pylint: disable=unused-argument
+    zgiam.sync.sync_directory(fake_directory)
+    fake_directory.calls.clear()
+    with mock.patch.object(zgiam.sync, "_LIST_PAGE_SIZES", {"users": 1, "groups": 1}):
+        assert zgiam.sync.sync_directory(fake_directory) == []
+    assert [call[2]["pageToken"] for call in fake_directory.calls] == [None, "1", None]
+
+
+def test_directory_sync_batch_size(sync_data, fake_directory):  # pylint: disable=W0613
+    zgiam.lib.config.get_config().set("GOOGLE_API", "BATCH_SIZE", "1")
+    zgiam.sync.DirectorySync(fake_directory).run()
+    assert fake_directory.batches == 4
@@ -0,0 +1,29 @@
+"""testing for zgiam.worker module"""
+# pylint: disable=C0116,W0621,W0212,W0611
+import signal
+import mock
+import zgiam.worker
+
+
+def test_init():
+    module = zgiam.worker
+    with mock.patch.object(module, "main", return_value=42):
+        with mock.patch.object(module, "__name__", "__main__"):
+            with mock.patch.object(module.sys, "exit") as mock_exit:
+                module.init()
+                assert mock_exit.call_args[0][0] == 42
+
+
+@mock.patch("zgiam.lib.config.watch_config")
+@mock.patch("zgiam.lib.google.warm_up")
+@mock.patch("zgiam.database.get_db")
+@mock.patch("zgiam.core.get_app")
+@mock.patch("zgiam.jobs.Worker")
+def test_main(mock_worker_cls, mock_get_app_fn, *_):
+    with mock.patch.object(zgiam.worker.signal, "signal") as mock_signal:
+        zgiam.worker.main()
+        handlers = {call[0][0]: call[0][1] for call in mock_signal.call_args_list}
+    assert mock_get_app_fn.called
+    assert mock_worker_cls().run.called
+    handlers[signal.SIGTERM]()
+    assert mock_worker_cls().stop_event.set.called
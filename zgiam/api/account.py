@@ -1,20 +1,31 @@
 """Account API modules"""
+import base64
+import binascii
+import csv
+import io
 import logging
 import datetime
 import http
+import json
+import typing
 
+import sqlalchemy
 import sqlalchemy.exc
+import sqlalchemy.orm
+import flask
 import flask_restx
+import flask_restx.inputs
 import flask_login
-import googleapiclient.errors
 
 import zgiam.api
 import zgiam.api.lib
 import zgiam.lib.log
+import zgiam.lib.config
 import zgiam.lib.google
 import zgiam.database
 import zgiam.models
 import zgiam.jobs
+import zgiam.auth
 
 
 logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
@@ -60,9 +71,79 @@ _approved_account: flask_restx.Model = _account_api_v1.clone(
     },
 )
 
+_listed_account: flask_restx.Model = _account_api_v1.clone(
+    "listed_account",
+    _approved_account,
+    {
+        "review_status": flask_restx.fields.String(example="APPROVED"),
+        "register_date": flask_restx.fields.Date(),
+    },
+)
+
+_ACCOUNT_LIST_MAX_LIMIT: int = 10000
+# rows fetched from the database cursor at a time when streaming account list
+_ACCOUNT_LIST_FETCH_SIZE: int = 500
+
+_account_list_parser: flask_restx.reqparse.RequestParser = _account_api_v1.parser()
+_account_list_parser.add_argument(
+    "order_by", choices=("email", "register_date"), default="email", location="args"
+)
+_account_list_parser.add_argument(
+    "after", location="args", help="`next` of the previous page, empty for the first page"
+)
+_account_list_parser.add_argument(
+    "limit",
+    type=flask_restx.inputs.int_range(1, _ACCOUNT_LIST_MAX_LIMIT),
+    default=100,
+    location="args",
+)
+_account_list_parser.add_argument("review_status", location="args")
+_account_list_parser.add_argument("type", location="args")
+_account_list_parser.add_argument(
+    "register_date_from", type=flask_restx.inputs.date_from_iso8601, location="args"
+)
+_account_list_parser.add_argument(
+    "register_date_to", type=flask_restx.inputs.date_from_iso8601, location="args"
+)
+
+_ACCOUNT_STREAM_FORMATS: typing.Dict[str, str] = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+_account_export_parser: flask_restx.reqparse.RequestParser = _account_api_v1.parser()
+_account_export_parser.add_argument(
+    "format", choices=tuple(_ACCOUNT_STREAM_FORMATS), default="ndjson", location="args"
+)
+_account_export_parser.add_argument(
+    "groups",
+    type=flask_restx.inputs.boolean,
+    default=False,
+    location="args",
+    help="add group emails of the account",
+)
+
+_IMPORT_CONFLICT_MODES: typing.Tuple[str, ...] = ("ignore", "update")
+# rows validated and inserted at a time by bulk register
+_IMPORT_CHUNK_SIZE: int = 500
+
+_bulk_register_parser: flask_restx.reqparse.RequestParser = _account_api_v1.parser()
+_bulk_register_parser.add_argument(
+    "on_conflict",
+    choices=_IMPORT_CONFLICT_MODES,
+    default="ignore",
+    location="args",
+    help="existing emails are ignored, or updated with the not empty fields",
+)
+
 _approving_accounts: flask_restx.Model = _account_api_v1.model(
     "approving_accounts",
-    {"emails": flask_restx.fields.List(flask_restx.fields.String, required=True)},
+    {
+        "emails": flask_restx.fields.List(flask_restx.fields.String, required=True),
+        "bulk": flask_restx.fields.Boolean(
+            default=False, description="approve in one transaction, for large batches"
+        ),
+    },
 )
 
 
@@ -82,24 +163,7 @@ class RegisterAccount(flask_restx.Resource):
         """register user and insert data to database"""
         zgiam.api.lib.validate_payload(_account_api_v1.payload, _account)
 
-        account_kwargs = _account_api_v1.payload.copy()
-
-        for name in ["first_name", "last_name"]:
-            # set format to "Apple Banana"
-            account_kwargs[name] = (
-                account_kwargs[name][0].upper() + account_kwargs[name][1:].lower()
-            )
-
-        try:
-            account_kwargs["join_date"] = datetime.date.fromisoformat(account_kwargs["join_date"])
-        except KeyError:
-            account_kwargs["join_date"] = datetime.date.today()
-
-        try:
-            account_kwargs["birthday"] = datetime.date.fromisoformat(account_kwargs["birthday"])
-        except KeyError:
-            ...
-
+        account_kwargs = _register_account_kwargs(_account_api_v1.payload)
         account = zgiam.models.Account(**account_kwargs)
 
         try:
@@ -110,6 +174,238 @@ class RegisterAccount(flask_restx.Resource):
             flask_restx.abort(http.HTTPStatus.CONFLICT)
 
 
+@_account_api_v1.route("/bulk_register")
+class BulkRegisterAccount(flask_restx.Resource):
+    """Bulk Register Account"""
+
+    @_account_api_v1.doc(
+        description=(
+            "register accounts from a NDJSON (application/x-ndjson) or CSV (text/csv) body, "
+            "fields are the same as user register, CSV header row is the field names"
+        ),
+        responses={
+            int(http.HTTPStatus.OK): "import finished, see the message of each row",
+            int(http.HTTPStatus.BAD_REQUEST): "wrong arguments",
+            int(http.HTTPStatus.UNSUPPORTED_MEDIA_TYPE): "body is not NDJSON or CSV",
+        },
+    )  # pylint: disable=no-self-use
+    @_account_api_v1.expect(_bulk_register_parser)
+    @flask_login.login_required
+    def post(self) -> list:
+        """register accounts in chunks"""
+        args = _bulk_register_parser.parse_args()
+        formats = {mimetype: format_ for format_, mimetype in _ACCOUNT_STREAM_FORMATS.items()}
+        try:
+            format_ = formats[flask.request.mimetype]
+        except KeyError:
+            flask_restx.abort(http.HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+        stream = io.TextIOWrapper(flask.request.stream, encoding="utf-8", newline="")
+        rows = read_account_rows(stream, format_)
+        return list(import_accounts(rows, on_conflict=args["on_conflict"]))
+
+
+def _register_account_kwargs(payload: dict) -> dict:
+    """registration payload to Account columns
+
+    Raises:
+        ValueError: wrong date format
+    """
+    account_kwargs = payload.copy()
+
+    for name in ["first_name", "last_name"]:
+        # set format to "Apple Banana"
+        account_kwargs[name] = account_kwargs[name][:1].upper() + account_kwargs[name][1:].lower()
+
+    try:
+        account_kwargs["join_date"] = datetime.date.fromisoformat(account_kwargs["join_date"])
+    except KeyError:
+        account_kwargs["join_date"] = datetime.date.today()
+
+    try:
+        account_kwargs["birthday"] = datetime.date.fromisoformat(account_kwargs["birthday"])
+    except KeyError:
+        ...
+    return account_kwargs
+
+
+def read_account_rows(stream: typing.TextIO, format_: str) -> typing.Generator:
+    """parse registrations, empty CSV cells are missing fields
+
+    Args:
+        stream (typing.TextIO): NDJSON or CSV text
+        format_ (str): "ndjson" or "csv"
+
+    Raises:
+        ValueError: unknown format
+
+    Yields:
+        typing.Generator: registration payload, or the line if it is not JSON
+    """
+    if format_ == "ndjson":
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
+    elif format_ == "csv":
+        for row in csv.DictReader(stream):
+            payload = {key: value for key, value in row.items() if value not in ("", None)}
+            if "memo" in payload:
+                try:
+                    payload["memo"] = json.loads(payload["memo"])
+                except ValueError:
+                    ...
+            yield payload
+    else:
+        raise ValueError(f"Unknown import format {format_}")
+
+
+def import_accounts(
+    rows: typing.Iterable[typing.Any], *, on_conflict: str = "ignore"
+) -> typing.Generator[dict, None, None]:
+    """register accounts in chunks, a chunk is validated at once and written by one
+    multi-row INSERT which ignores or updates existing emails. A chunk failed by the database
+    is written row by row, only the failed rows are reported as errors
+
+    Args:
+        rows (typing.Iterable[typing.Any]): registration payloads as user register
+        on_conflict (str, optional): "ignore" keeps existing accounts, "update" overwrites them
+            with the not empty fields. Defaults to "ignore".
+
+    Raises:
+        ValueError: unknown on_conflict
+
+    Yields:
+        typing.Generator[dict, None, None]: result of every row, "row" number from 1, "email"
+            and "message" is "CREATED", "UPDATED", "DUPLICATE" or starts with "ERROR"
+    """
+    if on_conflict not in _IMPORT_CONFLICT_MODES:
+        raise ValueError(f"Unknown on_conflict {on_conflict}")
+    seen_emails: typing.Set[str] = set()
+    chunk: typing.List[typing.Tuple[int, typing.Any]] = []
+    for number, row in enumerate(rows, 1):
+        chunk.append((number, row))
+        if len(chunk) >= _IMPORT_CHUNK_SIZE:
+            yield from _import_account_chunk(chunk, seen_emails, on_conflict)
+            chunk = []
+    if chunk:
+        yield from _import_account_chunk(chunk, seen_emails, on_conflict)
+
+
+def _import_account_chunk(
+    chunk: typing.List[typing.Tuple[int, typing.Any]],
+    seen_emails: typing.Set[str],
+    on_conflict: str,
+) -> typing.List[dict]:
+    payloads = [row if isinstance(row, dict) else {} for _, row in chunk]
+    errors = zgiam.api.lib.validate_payloads(payloads, _account)
+    reports = []
+    accounts_kwargs = {}
+    for (number, row), payload, error in zip(chunk, payloads, errors):
+        report = {"row": number, "email": payload.get("email")}
+        reports.append(report)
+        if not isinstance(row, dict):
+            error = "row is not a JSON object"
+        elif not error and row["email"] in seen_emails:
+            error = "email is duplicated in the import"
+        elif not error:
+            try:
+                kwargs = _register_account_kwargs(row)
+            except (TypeError, ValueError):
+                error = "wrong date format"
+            else:
+                if "join_date" not in row:
+                    # default join date is only for new accounts, see below
+                    kwargs["join_date"] = None
+                error = _too_long_field_error(kwargs)
+                if not error:
+                    accounts_kwargs[row["email"]] = kwargs
+        if error:
+            report["message"] = f"ERROR: {error}"
+            continue
+        seen_emails.add(row["email"])
+
+    existing_ids: typing.Dict[str, typing.Union[str, None]] = {}
+    failed_emails: typing.Set[str] = set()
+    try:
+        if accounts_kwargs:
+            existing_ids = _write_imported_accounts(accounts_kwargs, on_conflict)
+    except sqlalchemy.exc.SQLAlchemyError:
+        logger.exception("import chunk failed, write the rows one by one")
+        for email, kwargs in accounts_kwargs.items():
+            try:
+                existing_ids.update(_write_imported_accounts({email: kwargs}, on_conflict))
+            except sqlalchemy.exc.SQLAlchemyError:
+                logger.exception("import account %s failed", email)
+                failed_emails.add(email)
+        seen_emails.difference_update(failed_emails)
+    for report in reports:
+        if "message" in report:
+            continue
+        if report["email"] in failed_emails:
+            report["message"] = "ERROR: database error"
+        elif report["email"] not in existing_ids:
+            report["message"] = "CREATED"
+        else:
+            report["message"] = "UPDATED" if on_conflict == "update" else "DUPLICATE"
+    return reports
+
+
+def _too_long_field_error(kwargs: dict) -> typing.Union[str, None]:
+    """MySQL INSERT IGNORE and ON DUPLICATE KEY UPDATE truncate long strings silently"""
+    table = zgiam.models.Account.__table__
+    for key, value in kwargs.items():
+        if not isinstance(value, str) or key not in table.c:
+            continue
+        length = getattr(table.c[key].type, "length", None)
+        if length and len(value) > length:
+            return f"Validation of '{key}' field failed, longer than {length}"
+    return None
+
+
+def _write_imported_accounts(
+    accounts_kwargs: typing.Dict[str, dict], on_conflict: str
+) -> typing.Dict[str, typing.Union[str, None]]:
+    """insert accounts by one statement, returns email and id of the accounts already exist"""
+    table = zgiam.models.Account.__table__
+    columns = list(_account)
+    with zgiam.database.get_session() as session:
+        connection = session.connection()
+        existing_ids = dict(
+            connection.execute(
+                sqlalchemy.select(table.c.email, table.c.id).where(
+                    table.c.email.in_(list(accounts_kwargs))
+                )
+            ).all()
+        )
+        for email, kwargs in accounts_kwargs.items():
+            if email not in existing_ids:
+                kwargs["join_date"] = kwargs["join_date"] or datetime.date.today()
+        if on_conflict == "update":
+            statement = zgiam.database.upsert(
+                connection, table, ["email"], [column for column in columns if column != "email"]
+            )
+            values = list(accounts_kwargs.values())
+        else:
+            # insert ignore still skips accounts registered after the select
+            statement = zgiam.database.insert_ignore(connection, table)
+            values = [
+                kwargs for email, kwargs in accounts_kwargs.items() if email not in existing_ids
+            ]
+        if values:
+            connection.execute(
+                statement, [{column: kwargs.get(column) for column in columns} for kwargs in values]
+            )
+
+    if on_conflict == "update":
+        for account_id in filter(None, existing_ids.values()):
+            zgiam.auth.invalidate_token_cache(account_id=account_id)
+            zgiam.auth.invalidate_account_cache(account_id)
+    return existing_ids
+
+
 @_account_api_v1.route("/info")
 class Info(flask_restx.Resource):
     """Account Operation"""
@@ -118,7 +414,8 @@ class Info(flask_restx.Resource):
         description="Get account infomation",
         responses={int(http.HTTPStatus.OK): "get information successful"},
     )  # pylint: disable=no-self-use
-    @flask_restx.marshal_with(_approved_account)
+    @zgiam.database.read_only()
+    @zgiam.api.lib.serialize_with(_approved_account)
     @flask_login.login_required
     def get(self) -> zgiam.models.Account:
         """get account infomation from database"""
@@ -132,7 +429,7 @@ class Info(flask_restx.Resource):
             int(http.HTTPStatus.CONFLICT): "email conflict",
         },
     )  # pylint: disable=no-self-use
-    @flask_restx.marshal_with(_approved_account)
+    @zgiam.api.lib.serialize_with(_approved_account)
     @_account_api_v1.expect(_approved_account, validate=True)
     @flask_login.login_required
     def patch(self) -> None:
@@ -160,10 +457,196 @@ class Info(flask_restx.Resource):
                     setattr(account, key, value)
         except sqlalchemy.exc.IntegrityError:
             flask_restx.abort(http.HTTPStatus.CONFLICT)
+        zgiam.auth.invalidate_token_cache(account_id=account.id)
+        zgiam.auth.update_account_cache(account)
 
         return account
 
 
+@_account_api_v1.route("/list")
+class AccountList(flask_restx.Resource):
+    """Account List"""
+
+    @_account_api_v1.doc(
+        description=(
+            "list accounts by pages, pass `next` of the response as `after` to get the next "
+            "page, `next` is null on the last page. Accounts without register date are not "
+            "listed when order by `register_date`"
+        ),
+        responses={
+            int(http.HTTPStatus.OK): "list accounts successful",
+            int(http.HTTPStatus.BAD_REQUEST): "wrong arguments",
+        },
+    )  # pylint: disable=no-self-use
+    @_account_api_v1.expect(_account_list_parser)
+    @flask_login.login_required
+    def get(self) -> flask.Response:
+        """list accounts with keyset pagination, the response is streamed"""
+        args = _account_list_parser.parse_args()
+        query = _account_list_query(args)
+        return flask.Response(
+            flask.stream_with_context(_stream_account_list(query, args["order_by"], args["limit"])),
+            mimetype="application/json",
+        )
+
+
+def _account_list_query(args: dict) -> sqlalchemy.orm.Query:
+    """filtered account query after the cursor, with one more row to know the next page"""
+    Account = zgiam.models.Account  # pylint: disable=invalid-name
+    db = zgiam.database.get_db()
+    query = db.session.query(*_account_columns(_listed_account))
+    if args["review_status"]:
+        query = query.filter(Account.review_status == args["review_status"])
+    if args["type"]:
+        query = query.filter(Account.type == args["type"])
+    if args["register_date_from"]:
+        query = query.filter(Account.register_date >= args["register_date_from"])
+    if args["register_date_to"]:
+        query = query.filter(Account.register_date <= args["register_date_to"])
+
+    after = _decode_account_list_cursor(args["after"], args["order_by"])
+    if args["order_by"] == "email":
+        if after:
+            query = query.filter(Account.email > after[0])
+        query = query.order_by(Account.email)
+    else:
+        query = query.filter(Account.register_date.isnot(None))
+        if after:
+            register_date, email = after
+            query = query.filter(
+                sqlalchemy.or_(
+                    Account.register_date > register_date,
+                    sqlalchemy.and_(Account.register_date == register_date, Account.email > email),
+                )
+            )
+        query = query.order_by(Account.register_date, Account.email)
+    return query.limit(args["limit"] + 1)
+
+
+def _stream_account_list(
+    query: sqlalchemy.orm.Query, order_by: str, limit: int
+) -> typing.Generator[str, None, None]:
+    serializer = zgiam.api.lib.compile_serializer(_listed_account)
+    next_cursor = None
+    yield '{"accounts": ['
+    with zgiam.database.read_only():
+        last_row = None
+        for count, row in enumerate(query.yield_per(_ACCOUNT_LIST_FETCH_SIZE)):
+            if count == limit:
+                next_cursor = _encode_account_list_cursor(last_row, order_by)
+                break
+            if count:
+                yield ", "
+            yield zgiam.api.lib.json_dumps(serializer(row)).decode()
+            last_row = row
+    yield f'], "next": {json.dumps(next_cursor)}}}'
+
+
+def _account_columns(api_model: flask_restx.Model) -> typing.List[sqlalchemy.Column]:
+    """Account columns of the model fields, their rows are serialized without ORM objects"""
+    table = zgiam.models.Account.__table__
+    return [table.c[key] for key in api_model]
+
+
+def _encode_account_list_cursor(row: sqlalchemy.engine.Row, order_by: str) -> str:
+    if order_by == "email":
+        key = [row.email]
+    else:
+        key = [row.register_date.isoformat(), row.email]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def _decode_account_list_cursor(cursor: typing.Union[str, None], order_by: str) -> list:
+    if not cursor:
+        return []
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if order_by == "email":
+            (email,) = key
+            return [str(email)]
+        register_date, email = key
+        return [datetime.date.fromisoformat(register_date), str(email)]
+    except (binascii.Error, ValueError, TypeError):
+        flask_restx.abort(http.HTTPStatus.BAD_REQUEST, "wrong cursor `after`")
+
+
+@_account_api_v1.route("/export")
+class AccountExport(flask_restx.Resource):
+    """Account Export"""
+
+    @_account_api_v1.doc(
+        description="export all accounts as NDJSON or CSV, fields are the same as account info",
+        responses={
+            int(http.HTTPStatus.OK): "export accounts successful",
+            int(http.HTTPStatus.BAD_REQUEST): "wrong arguments",
+        },
+    )  # pylint: disable=no-self-use
+    @_account_api_v1.expect(_account_export_parser)
+    @flask_login.login_required
+    def get(self) -> flask.Response:
+        """stream all accounts from a server-side cursor"""
+        args = _account_export_parser.parse_args()
+        format_ = args["format"]
+        return flask.Response(
+            flask.stream_with_context(export_accounts(format_, groups=args["groups"])),
+            mimetype=_ACCOUNT_STREAM_FORMATS[format_],
+            headers={"Content-Disposition": f"attachment; filename=accounts.{format_}"},
+        )
+
+
+def export_accounts(
+    format_: str = "ndjson", *, groups: bool = False
+) -> typing.Generator[str, None, None]:
+    """serialize all accounts with the `_approved_account` fields, rows are fetched from a
+    server-side cursor so memory does not grow with the table
+
+    Args:
+        format_ (str, optional): "ndjson" or "csv". Defaults to "ndjson".
+        groups (bool, optional): add "groups", emails of the account groups. Defaults to False.
+
+    Raises:
+        ValueError: unknown format
+
+    Yields:
+        typing.Generator[str, None, None]: lines of the output
+    """
+    if format_ not in _ACCOUNT_STREAM_FORMATS:
+        raise ValueError(f"Unknown export format {format_}")
+    Account = zgiam.models.Account  # pylint: disable=invalid-name
+    db = zgiam.database.get_db()
+    if groups:
+        query = db.session.query(Account).options(sqlalchemy.orm.selectinload(Account.groups))
+    else:
+        query = db.session.query(*_account_columns(_approved_account))
+    query = query.order_by(Account.email)
+    serializer = zgiam.api.lib.compile_serializer(_approved_account)
+    field_names = list(_approved_account) + (["groups"] if groups else [])
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, field_names)
+    if format_ == "csv":
+        writer.writeheader()
+        yield buffer.getvalue()
+
+    with zgiam.database.read_only():
+        for account in query.yield_per(_ACCOUNT_LIST_FETCH_SIZE):
+            row = serializer(account)
+            if groups:
+                row["groups"] = [group.email for group in account.groups]
+            if format_ == "ndjson":
+                yield zgiam.api.lib.json_dumps(row).decode() + "\n"
+                continue
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(
+                {
+                    key: json.dumps(value) if isinstance(value, (dict, list)) else value
+                    for key, value in row.items()
+                }
+            )
+            yield buffer.getvalue()
+
+
 @_account_api_v1.route("/approve_registers")
 class ApproveRegisters(flask_restx.Resource):
     """Account Operation"""
@@ -172,6 +655,7 @@ class ApproveRegisters(flask_restx.Resource):
         description="approve accounts",
         responses={
             int(http.HTTPStatus.OK): "approve accounts successful",
+            int(http.HTTPStatus.ACCEPTED): "approve accounts with Google Workspace accounts queued",
             int(http.HTTPStatus.BAD_REQUEST): "approve accounts have some fails",
         },
     )  # pylint: disable=no-self-use
@@ -181,27 +665,147 @@ class ApproveRegisters(flask_restx.Resource):
         """get account infomation from database"""
         zgiam.api.lib.validate_payload(_account_api_v1.payload, _approving_accounts)
         emails = _account_api_v1.payload["emails"]
-        results = []
-        has_error = False
-        for email in emails:
-            message = ""
+        if _account_api_v1.payload.get("bulk"):
+            return _bulk_approve_accounts(emails)
 
+        messages = {}
+        accounts = {}
+        db = zgiam.database.get_db()
+        for email in emails:
+            if email in messages or email in accounts:
+                continue
             try:
-                with zgiam.database.get_session() as session:
-                    account = session.query(zgiam.models.Account).filter_by(email=email).one()
-                    account.generate_id()
-                    account.review_by_id = flask_login.current_user.id
-                    account.review_status = "APPROVED"
-                    zgiam.jobs.create_google_workspace_account(account)
-                    # TODO: send welcome email here
-                    message = f"SUCCESS: id: {account.id}"
+                account = db.session.query(zgiam.models.Account).filter_by(email=email).one()
             except sqlalchemy.exc.NoResultFound:
-                has_error = True
-                message = "ERROR: account not found in database"
-            except googleapiclient.errors.HttpError as e:
-                has_error = True
-                message = f"ERROR: Google Workspace with error({e.error_details})"
-            results.append({"email": email, "message": message})
-        if has_error:
-            flask_restx.abort(http.HTTPStatus.BAD_REQUEST, results)
-        return results
+                messages[email] = "ERROR: account not found in database"
+                continue
+            account.generate_id()
+            accounts[email] = account
+
+        if zgiam.lib.config.get_config().getboolean("JOB", "ASYNC_APPROVAL"):
+            return _queue_approved_accounts(emails, messages, accounts)
+
+        errors = zgiam.jobs.create_google_workspace_accounts(accounts.values())
+        with zgiam.database.get_session():
+            for email, account in accounts.items():
+                error = errors[email]
+                if error:
+                    error_details = getattr(error, "error_details", error)
+                    messages[email] = f"ERROR: Google Workspace with error({error_details})"
+                    continue
+                account.review_by_id = flask_login.current_user.id
+                account.review_status = "APPROVED"
+                # TODO: send welcome email here
+                messages[email] = f"SUCCESS: id: {account.id}"
+        for account in accounts.values():
+            zgiam.auth.invalidate_account_cache(account.id)
+        return _approval_results(emails, messages)
+
+
+def _queue_approved_accounts(
+    emails: typing.List[str],
+    messages: typing.Dict[str, str],
+    accounts: typing.Dict[str, zgiam.models.Account],
+) -> typing.Tuple[list, http.HTTPStatus]:
+    """approve accounts and queue Google Workspace account jobs in one transaction"""
+    job_ids = {}
+    with zgiam.database.get_session() as session:
+        for email, account in accounts.items():
+            account.review_by_id = flask_login.current_user.id
+            account.review_status = "APPROVED"
+            job = zgiam.jobs.enqueue(
+                "create_google_workspace_account", {"email": email}, session=session
+            )
+            job_ids[email] = job.id
+            messages[email] = f"QUEUED: id: {account.id}"
+    for account in accounts.values():
+        zgiam.auth.invalidate_account_cache(account.id)
+    return _approval_results(emails, messages, job_ids), http.HTTPStatus.ACCEPTED
+
+
+def _bulk_approve_accounts(emails: typing.List[str]) -> typing.Tuple[list, http.HTTPStatus]:
+    """approve accounts with short transactions
+    Accounts are loaded by one IN query and ids are reserved once per base id and committed.
+    Google Workspace accounts are created with no transaction open, then review fields are set
+    by one UPDATE. Queued approvals enqueue their jobs in the first transaction.
+    """
+    Account = zgiam.models.Account  # pylint: disable=invalid-name
+    messages: typing.Dict[str, str] = {}
+    job_ids: typing.Dict[str, int] = {}
+    approved_emails = []
+    is_async = zgiam.lib.config.get_config().getboolean("JOB", "ASYNC_APPROVAL")
+    with zgiam.database.get_session() as session:
+        accounts = {
+            account.email: account
+            for account in session.query(Account).filter(Account.email.in_(set(emails)))
+        }
+        for email in emails:
+            if email not in accounts:
+                messages[email] = "ERROR: account not found in database"
+        zgiam.models.generate_account_ids(session, accounts.values())
+        session.flush()
+        # models expire on commit, keep what is needed after it
+        account_ids = {email: account.id for email, account in accounts.items()}
+        bodies = {
+            email: zgiam.jobs.google_workspace_account_body(account)
+            for email, account in accounts.items()
+        }
+        if is_async:
+            for email, account_id in account_ids.items():
+                job = zgiam.jobs.enqueue(
+                    "create_google_workspace_account", {"email": email}, session=session
+                )
+                job_ids[email] = job.id
+                messages[email] = f"QUEUED: id: {account_id}"
+                approved_emails.append(email)
+            _update_review_status(session, approved_emails)
+
+    if not is_async:
+        errors = zgiam.jobs.insert_google_workspace_accounts(bodies)
+        for email, account_id in account_ids.items():
+            error = errors[email]
+            if error:
+                error_details = getattr(error, "error_details", error)
+                messages[email] = f"ERROR: Google Workspace with error({error_details})"
+                continue
+            # TODO: send welcome email here
+            messages[email] = f"SUCCESS: id: {account_id}"
+            approved_emails.append(email)
+        with zgiam.database.get_session() as session:
+            _update_review_status(session, approved_emails)
+
+    for account_id in account_ids.values():
+        zgiam.auth.invalidate_account_cache(account_id)
+    if job_ids:
+        return _approval_results(emails, messages, job_ids), http.HTTPStatus.ACCEPTED
+    return _approval_results(emails, messages), http.HTTPStatus.OK
+
+
+def _update_review_status(session: sqlalchemy.orm.Session, emails: typing.List[str]) -> None:
+    """approve the accounts by one UPDATE"""
+    if not emails:
+        return
+    table = zgiam.models.Account.__table__
+    session.connection().execute(
+        table.update()
+        .where(table.c.email.in_(emails))
+        .values(review_by_id=flask_login.current_user.id, review_status="APPROVED")
+    )
+
+
+def _approval_results(
+    emails: typing.List[str],
+    messages: typing.Dict[str, str],
+    job_ids: typing.Union[typing.Dict[str, int], None] = None,
+) -> list:
+    """results in request order, abort with 400 if any approval fails"""
+    if job_ids is None:
+        results = [{"email": email, "message": messages[email]} for email in emails]
+    else:
+        results = [
+            {"email": email, "message": messages[email], "job_id": job_ids.get(email)}
+            for email in emails
+        ]
+    if any(message.startswith("ERROR") for message in messages.values()):
+        flask_restx.abort(http.HTTPStatus.BAD_REQUEST, results)
+    return results
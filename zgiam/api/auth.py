@@ -2,8 +2,10 @@
 import datetime
 import logging
 import http
+import typing
 import flask
 import flask_restx
+import flask_restx.inputs
 import flask_login
 import flask_dance.contrib.google
 import flask_jwt_extended
@@ -17,6 +19,7 @@ import zgiam.lib.log
 import zgiam.database
 import zgiam.models
 import zgiam.api
+import zgiam.auth
 
 
 logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
@@ -27,6 +30,29 @@ _token: flask_restx.Model = _auth_api_v1.model(
     "token", {"token": flask_restx.fields.String(description="API access token")}
 )
 
+_TOKEN_LIST_MAX_LIMIT: int = 1000
+
+_token_list_parser: flask_restx.reqparse.RequestParser = _auth_api_v1.parser()
+_token_list_parser.add_argument(
+    "after", location="args", help="`next` of the previous page, empty for the first page"
+)
+_token_list_parser.add_argument(
+    "limit",
+    type=flask_restx.inputs.int_range(1, _TOKEN_LIST_MAX_LIMIT),
+    default=100,
+    location="args",
+)
+
+
+def _listed_token_hash(value: str) -> typing.Union[bytes, None]:
+    """digest of a hex digest listed by GET, None if the value is not one"""
+    if len(value) != 64:
+        return None
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        return None
+
 
 @_auth_api_v1.route("/login")
 class Login(flask_restx.Resource):
@@ -83,17 +109,35 @@ class Token(flask_restx.Resource):
     """Token API"""
 
     @_auth_api_v1.doc(
-        description="get lists of account token",
-        responses={int(http.HTTPStatus.OK): "get tokens successful"},
+        description="get lists of account token SHA-256 hex digests, tokens are not stored. "
+        "`next` is the `after` cursor of the next page, null on the last page",
+        responses={
+            int(http.HTTPStatus.OK): "get tokens successful",
+            int(http.HTTPStatus.BAD_REQUEST): "bad `after` cursor",
+        },
     )  # pylint: disable=no-self-use
+    @_auth_api_v1.expect(_token_list_parser)
+    @zgiam.database.read_only()
     @flask_login.login_required
     def get(self) -> dict:
-        """get account token list not expired"""
-        account = flask_login.current_user
+        """get account token digests not expired, paginated"""
+        args = _token_list_parser.parse_args()
+        AccountToken = zgiam.models.AccountToken  # pylint: disable=invalid-name
+        query = flask_login.current_user.tokens.with_entities(AccountToken.token_hash).filter(
+            AccountToken.expire_time.is_(None)
+        )
+        if args["after"]:
+            try:
+                after = bytes.fromhex(args["after"])
+            except ValueError:
+                flask_restx.abort(http.HTTPStatus.BAD_REQUEST, "bad `after` cursor")
+            query = query.filter(AccountToken.token_hash > after)
         tokens = [
-            account_token.token for account_token in account.tokens if not account_token.expire_time
+            token_hash.hex()
+            for token_hash, in query.order_by(AccountToken.token_hash).limit(args["limit"] + 1)
         ]
-        return {"tokens": tokens}
+        next_cursor = tokens[args["limit"] - 1] if len(tokens) > args["limit"] else None
+        return {"tokens": tokens[: args["limit"]], "next": next_cursor}
 
     @_auth_api_v1.doc(
         description="create account token",
@@ -122,18 +166,31 @@ class Token(flask_restx.Resource):
     @flask_login.login_required
     @_auth_api_v1.expect(_token, validate=True)
     def delete(self) -> None:
-        """delete account token"""
+        """delete account token by the token or its hex digest listed by GET"""
         zgiam.api.lib.validate_payload(_auth_api_v1.payload, _token)
         token = _auth_api_v1.payload["token"]
+        token_hash = _listed_token_hash(token)
+        AccountToken = zgiam.models.AccountToken  # pylint: disable=invalid-name
 
         try:
             with zgiam.database.get_session() as session:
                 account = flask_login.current_user
                 account_token = (
-                    session.query(zgiam.models.AccountToken)
-                    .filter_by(account_id=account.id, token=token, expire_time=None)
+                    session.query(AccountToken)
+                    .filter_by(account_id=account.id, expire_time=None)
+                    .filter(
+                        AccountToken.token_hash.in_(
+                            [zgiam.models.hash_token(token), token_hash or b""]
+                        )
+                    )
                     .one()
                 )
                 account_token.expire_time = datetime.datetime.now()
+                account_id = account.id
+                matched_hash = account_token.token_hash
         except sqlalchemy.exc.NoResultFound:
             flask_restx.abort(http.HTTPStatus.BAD_REQUEST)
+        if matched_hash == token_hash:
+            zgiam.auth.revoke_token_hash(matched_hash, account_id)
+        else:
+            zgiam.auth.revoke_token(token)
@@ -0,0 +1,295 @@
+"""Group API modules"""
+import logging
+import http
+import typing
+
+import sqlalchemy
+import sqlalchemy.exc
+import sqlalchemy.orm
+import flask_restx
+import flask_restx.inputs
+import flask_login
+
+import zgiam.api
+import zgiam.api.lib
+import zgiam.lib.log
+import zgiam.database
+import zgiam.models
+
+
+logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
+
+_group_api_v1: flask_restx.Namespace = zgiam.api.api_v1.namespace("groups")
+
+_group: flask_restx.Model = _group_api_v1.model(
+    "group",
+    {
+        "email": zgiam.api.lib.Email(required=True),
+        "english_name": flask_restx.fields.String(example="Design Team"),
+        "chinese_name": flask_restx.fields.String(example="設計組"),
+        "year": flask_restx.fields.Integer(example=2021),
+        "session": flask_restx.fields.Integer(example=1),
+        "memo": flask_restx.fields.Raw(description="json notes"),
+    },
+)
+
+_updating_group: flask_restx.Model = _group_api_v1.clone(
+    "updating_group", _group, {"email": zgiam.api.lib.Email()}
+)
+
+_saved_group: flask_restx.Model = _group_api_v1.clone(
+    "saved_group", _group, {"id": flask_restx.fields.Integer(example=1)}
+)
+
+_group_member: flask_restx.Model = _group_api_v1.model(
+    "group_member",
+    {
+        "id": flask_restx.fields.String(example="JackW"),
+        "email": zgiam.api.lib.Email(),
+    },
+)
+
+_group_with_members: flask_restx.Model = _group_api_v1.clone(
+    "group_with_members",
+    _saved_group,
+    {"members": flask_restx.fields.List(flask_restx.fields.Nested(_group_member))},
+)
+
+_changing_group_members: flask_restx.Model = _group_api_v1.model(
+    "changing_group_members",
+    {
+        "add": flask_restx.fields.List(zgiam.api.lib.Email(), description="account emails"),
+        "remove": flask_restx.fields.List(zgiam.api.lib.Email(), description="account emails"),
+    },
+)
+
+_replacing_group_members: flask_restx.Model = _group_api_v1.model(
+    "replacing_group_members",
+    {
+        "emails": flask_restx.fields.List(
+            zgiam.api.lib.Email(), required=True, description="account emails of all members"
+        ),
+    },
+)
+
+_changed_group_members: flask_restx.Model = _group_api_v1.model(
+    "changed_group_members",
+    {
+        "added": flask_restx.fields.Integer(example=2),
+        "removed": flask_restx.fields.Integer(example=1),
+    },
+)
+
+_group_list_parser: flask_restx.reqparse.RequestParser = _group_api_v1.parser()
+_group_list_parser.add_argument(
+    "members",
+    type=flask_restx.inputs.boolean,
+    default=False,
+    location="args",
+    help="add members of the groups",
+)
+
+# account emails bound to one IN query when resolving members
+_MEMBER_CHUNK_SIZE: int = 500
+
+
+def _group_query(session: sqlalchemy.orm.Session, members: bool = False) -> sqlalchemy.orm.Query:
+    """group query, members are loaded by one SELECT IN for all groups instead of N+1"""
+    Account = zgiam.models.Account  # pylint: disable=invalid-name
+    Group = zgiam.models.Group  # pylint: disable=invalid-name
+    query = session.query(Group)
+    if members:
+        query = query.options(
+            sqlalchemy.orm.selectinload(Group.accounts).load_only(Account.email, Account.id)
+        )
+    return query
+
+
+def _get_group(session: sqlalchemy.orm.Session, group_id: int, members: bool = False):
+    try:
+        return _group_query(session, members).filter_by(id=group_id).one()
+    except sqlalchemy.exc.NoResultFound:
+        flask_restx.abort(http.HTTPStatus.NOT_FOUND, "group not found")
+
+
+def _group_output(group: zgiam.models.Group, members: bool = False) -> dict:
+    serializer = zgiam.api.lib.compile_serializer(_saved_group)
+    output = serializer(group)
+    if members:
+        output["members"] = [
+            {"id": account.id, "email": account.email}
+            for account in sorted(group.accounts, key=lambda account: account.id)
+        ]
+    return output
+
+
+def _member_account_ids(emails: typing.Iterable[str]) -> typing.Set[str]:
+    """ids of the accounts, abort with 400 if any account is not found or not approved"""
+    Account = zgiam.models.Account  # pylint: disable=invalid-name
+    db = zgiam.database.get_db()
+    emails = sorted(set(emails))
+    account_ids: typing.Dict[str, typing.Union[str, None]] = {}
+    for i in range(0, len(emails), _MEMBER_CHUNK_SIZE):
+        chunk = emails[i : i + _MEMBER_CHUNK_SIZE]
+        account_ids.update(
+            db.session.query(Account.email, Account.id).filter(Account.email.in_(chunk))
+        )
+    errors = []
+    for email in emails:
+        if email not in account_ids:
+            errors.append({"email": email, "message": "ERROR: account not found in database"})
+        elif not account_ids[email]:
+            errors.append({"email": email, "message": "ERROR: account is not approved"})
+    if errors:
+        flask_restx.abort(http.HTTPStatus.BAD_REQUEST, errors)
+    return {account_id for account_id in account_ids.values() if account_id}
+
+
+@_group_api_v1.route("/")
+class Groups(flask_restx.Resource):
+    """Group Operation"""
+
+    @_group_api_v1.doc(
+        description="list groups",
+        responses={int(http.HTTPStatus.OK): "list groups successful"},
+        model=[_group_with_members],
+    )  # pylint: disable=no-self-use
+    @_group_api_v1.expect(_group_list_parser)
+    @zgiam.database.read_only()
+    @flask_login.login_required
+    def get(self) -> list:
+        """list groups ordered by email"""
+        args = _group_list_parser.parse_args()
+        db = zgiam.database.get_db()
+        groups = _group_query(db.session, args["members"]).order_by(zgiam.models.Group.email)
+        return [_group_output(group, args["members"]) for group in groups]
+
+    @_group_api_v1.doc(
+        description="create group",
+        responses={
+            int(http.HTTPStatus.CREATED): "create group successful",
+            int(http.HTTPStatus.CONFLICT): "group email exists",
+        },
+        model=_saved_group,
+    )  # pylint: disable=no-self-use
+    @_group_api_v1.expect(_group, validate=True)
+    @flask_login.login_required
+    def post(self) -> typing.Tuple[dict, http.HTTPStatus]:
+        """create group"""
+        zgiam.api.lib.validate_payload(_group_api_v1.payload, _group)
+        group = zgiam.models.Group(**_group_api_v1.payload)
+        try:
+            with zgiam.database.get_session() as session:
+                session.add(group)
+        except sqlalchemy.exc.IntegrityError as e:
+            logger.error("database commit error: %s", e)
+            flask_restx.abort(http.HTTPStatus.CONFLICT)
+        return _group_output(group), http.HTTPStatus.CREATED
+
+
+@_group_api_v1.route("/<int:group_id>")
+class Group(flask_restx.Resource):
+    """Group Operation"""
+
+    @_group_api_v1.doc(
+        description="get group with members",
+        responses={
+            int(http.HTTPStatus.OK): "get group successful",
+            int(http.HTTPStatus.NOT_FOUND): "group not found",
+        },
+        model=_group_with_members,
+    )  # pylint: disable=no-self-use
+    @zgiam.database.read_only()
+    @flask_login.login_required
+    def get(self, group_id: int) -> dict:
+        """get group with members"""
+        db = zgiam.database.get_db()
+        return _group_output(_get_group(db.session, group_id, members=True), members=True)
+
+    @_group_api_v1.doc(
+        description="update group",
+        responses={
+            int(http.HTTPStatus.OK): "update group successful",
+            int(http.HTTPStatus.NOT_FOUND): "group not found",
+            int(http.HTTPStatus.CONFLICT): "group email exists",
+        },
+        model=_saved_group,
+    )  # pylint: disable=no-self-use
+    @_group_api_v1.expect(_updating_group, validate=True)
+    @flask_login.login_required
+    def patch(self, group_id: int) -> dict:
+        """update group"""
+        zgiam.api.lib.validate_payload(_group_api_v1.payload, _updating_group)
+        try:
+            with zgiam.database.get_session() as session:
+                group = _get_group(session, group_id)
+                for key, value in _group_api_v1.payload.items():
+                    setattr(group, key, value)
+        except sqlalchemy.exc.IntegrityError as e:
+            logger.error("database commit error: %s", e)
+            flask_restx.abort(http.HTTPStatus.CONFLICT)
+        return _group_output(group)
+
+    @_group_api_v1.doc(
+        description="delete group and its memberships",
+        responses={
+            int(http.HTTPStatus.NO_CONTENT): "delete group successful",
+            int(http.HTTPStatus.NOT_FOUND): "group not found",
+        },
+    )  # pylint: disable=no-self-use
+    @flask_login.login_required
+    def delete(self, group_id: int) -> typing.Tuple[str, http.HTTPStatus]:
+        """delete group"""
+        with zgiam.database.get_session() as session:
+            group = _get_group(session, group_id)
+            table = zgiam.models.AccountGroup.__table__
+            session.connection().execute(table.delete().where(table.c.group_id == group_id))
+            session.expire(group, ["accounts"])
+            session.delete(group)
+        return "", http.HTTPStatus.NO_CONTENT
+
+
+@_group_api_v1.route("/<int:group_id>/members")
+class GroupMembers(flask_restx.Resource):
+    """Group Membership Operation"""
+
+    @_group_api_v1.doc(
+        description="add and remove members, only the difference is written",
+        responses={
+            int(http.HTTPStatus.OK): "change members successful",
+            int(http.HTTPStatus.BAD_REQUEST): "some accounts are not found or not approved",
+            int(http.HTTPStatus.NOT_FOUND): "group not found",
+        },
+        model=_changed_group_members,
+    )  # pylint: disable=no-self-use
+    @_group_api_v1.expect(_changing_group_members, validate=True)
+    @flask_login.login_required
+    def post(self, group_id: int) -> dict:
+        """add and remove group members"""
+        zgiam.api.lib.validate_payload(_group_api_v1.payload, _changing_group_members)
+        add = _member_account_ids(_group_api_v1.payload.get("add", ()))
+        remove = _member_account_ids(_group_api_v1.payload.get("remove", ()))
+        with zgiam.database.get_session() as session:
+            _get_group(session, group_id)
+            added, removed = zgiam.models.change_group_members(session, group_id, add, remove)
+        return {"added": len(added), "removed": len(removed)}
+
+    @_group_api_v1.doc(
+        description="replace all members, only the difference is written",
+        responses={
+            int(http.HTTPStatus.OK): "replace members successful",
+            int(http.HTTPStatus.BAD_REQUEST): "some accounts are not found or not approved",
+            int(http.HTTPStatus.NOT_FOUND): "group not found",
+        },
+        model=_changed_group_members,
+    )  # pylint: disable=no-self-use
+    @_group_api_v1.expect(_replacing_group_members, validate=True)
+    @flask_login.login_required
+    def put(self, group_id: int) -> dict:
+        """replace group members"""
+        zgiam.api.lib.validate_payload(_group_api_v1.payload, _replacing_group_members)
+        account_ids = _member_account_ids(_group_api_v1.payload["emails"])
+        with zgiam.database.get_session() as session:
+            _get_group(session, group_id)
+            added, removed = zgiam.models.replace_group_members(session, group_id, account_ids)
+        return {"added": len(added), "removed": len(removed)}
@@ -0,0 +1,57 @@
+"""Job API modules"""
+import logging
+import http
+
+import sqlalchemy.exc
+import flask_restx
+import flask_login
+
+import zgiam.api
+import zgiam.lib.log
+import zgiam.database
+import zgiam.models
+
+
+logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
+
+_job_api_v1: flask_restx.Namespace = zgiam.api.api_v1.namespace("jobs")
+
+_job: flask_restx.Model = _job_api_v1.model(
+    "job",
+    {
+        "id": flask_restx.fields.Integer(example=1),
+        "type": flask_restx.fields.String(example="create_google_workspace_account"),
+        "status": flask_restx.fields.String(
+            example="QUEUED", description="can be 'QUEUED', 'RUNNING', 'SUCCEEDED' or 'FAILED'"
+        ),
+        "attempts": flask_restx.fields.Integer(example=1),
+        "max_attempts": flask_restx.fields.Integer(example=5),
+        "result": flask_restx.fields.Raw(description="json result of the job"),
+        "error": flask_restx.fields.String(description="error of the last attempt"),
+        "run_after": flask_restx.fields.DateTime(),
+        "created_at": flask_restx.fields.DateTime(),
+        "updated_at": flask_restx.fields.DateTime(),
+    },
+)
+
+
+@_job_api_v1.route("/<int:job_id>")
+class Job(flask_restx.Resource):
+    """Job status"""
+
+    @_job_api_v1.doc(
+        description="get job status",
+        responses={
+            int(http.HTTPStatus.OK): "get job status successful",
+            int(http.HTTPStatus.NOT_FOUND): "job not found",
+        },
+    )  # pylint: disable=no-self-use
+    @flask_restx.marshal_with(_job)
+    @flask_login.login_required
+    def get(self, job_id: int) -> zgiam.models.Job:
+        """get job status from database"""
+        db = zgiam.database.get_db()
+        try:
+            return db.session.query(zgiam.models.Job).filter_by(id=job_id).one()
+        except sqlalchemy.exc.NoResultFound:
+            flask_restx.abort(http.HTTPStatus.NOT_FOUND)
@@ -1,10 +1,23 @@
 """API lib module"""
+import datetime
+import functools
+import importlib
+import json
 import re
 import http
 import typing
 
 import flask
 import flask_restx
+import flask_restx.utils
+import sqlalchemy.engine
+
+_EMAIL_REGEX: typing.Pattern = re.compile(r"\S+@\S+\.\S+")
+_PHONE_NUMBER_REGEX: typing.Pattern = re.compile(r"^[\d+;,]+$")
+_GLOB_REGEX: typing.Pattern = re.compile(r"[*?[]")
+
+# JSON encoder module has `dumps`, orjson if installed, see `json_dumps`
+_json_backend: typing.Any = None
 
 
 class CustomField(flask_restx.fields.Raw):
@@ -29,10 +42,9 @@ class Email(CustomField):
     __schema_example__ = "email@domain.com"
 
     def validate(self, value):
-        email_regex = re.compile(r"\S+@\S+\.\S+")
         if not value:
             return not self.required
-        return bool(email_regex.match(value))
+        return bool(_EMAIL_REGEX.match(value))
 
 
 class PhoneNumber(CustomField):
@@ -45,10 +57,9 @@ class PhoneNumber(CustomField):
     __schema_example__ = "+10000000000;1,1111"
 
     def validate(self, value):
-        phone_regex = re.compile(r"^[\d+;,]+$")
         if not value:
             return not self.required
-        return bool(phone_regex.match(value))
+        return bool(_PHONE_NUMBER_REGEX.match(value))
 
 
 def validate_payload(payload: typing.Any, api_model: flask_restx.Model):
@@ -58,25 +69,268 @@ def validate_payload(payload: typing.Any, api_model: flask_restx.Model):
         payload (typing.Any): response payload
         api_model (flask_restx.Model): API model
     """
+    error = validate_payloads([payload], api_model)[0]
+    if error:
+        flask.abort(http.HTTPStatus.BAD_REQUEST, error)
+
+
+class ValidationPlan(typing.NamedTuple):
+    """flat form of an API model for `validate_payloads`, see `compile_validation_plan`"""
+
+    # in model order, the first missing key is reported
+    required_keys: typing.Tuple[str, ...]
+    allowed_keys: typing.FrozenSet[str]
+    # key and (validate function of the field or its list items, is list)
+    validators: typing.Dict[str, typing.Tuple[typing.Callable[[typing.Any], bool], bool]]
+    # key and (accepted types of the field or its list items, is list)
+    types: typing.Dict[str, typing.Tuple[typing.Tuple[type, ...], bool]]
+
+
+# JSON schema type of a field and the accepted payload types, object fields are not checked
+_SCHEMA_TYPES: typing.Dict[str, typing.Tuple[type, ...]] = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+}
+
+# id of API model and (model, plan), the model is kept so its id is not reused
+_validation_plans: typing.Dict[int, typing.Tuple[flask_restx.Model, ValidationPlan]] = {}
+
+
+def compile_validation_plan(api_model: flask_restx.Model) -> ValidationPlan:
+    """read the API model once, later calls of the same model get the cached plan
+
+    Args:
+        api_model (flask_restx.Model): API model
+
+    Returns:
+        ValidationPlan
+    """
+    try:
+        return _validation_plans[id(api_model)][1]
+    except KeyError:
+        ...
+    validators = {}
+    types = {}
+    for key, field in api_model.items():
+        is_list = isinstance(field, flask_restx.fields.List)
+        if is_list:
+            field = field.container
+        if isinstance(field, CustomField):
+            validators[key] = (field.validate, is_list)
+        schema_types = _SCHEMA_TYPES.get(getattr(field, "__schema_type__", None), ())
+        if schema_types or is_list:
+            types[key] = (schema_types, is_list)
+    plan = ValidationPlan(
+        required_keys=tuple(key for key, field in api_model.items() if field.required),
+        allowed_keys=frozenset(api_model),
+        validators=validators,
+        types=types,
+    )
+    _validation_plans[id(api_model)] = (api_model, plan)
+    return plan
+
+
+def validate_payloads(
+    payloads: typing.Iterable[typing.Any], api_model: flask_restx.Model
+) -> typing.List[typing.Union[str, None]]:
+    """Validate many payloads as `validate_payload` without abort
+
+    Args:
+        payloads (typing.Iterable[typing.Any]): response payloads
+        api_model (flask_restx.Model): API model
+
+    Returns:
+        typing.List[typing.Union[str, None]]: error of each payload, None if it is valid
+    """
+    plan = compile_validation_plan(api_model)
+    return [_payload_error(payload, plan) for payload in payloads]
+
+
+def _payload_error(payload: typing.Any, plan: ValidationPlan) -> typing.Union[str, None]:
     # check if any required fields are missing in payload
-    for key in api_model:
-        if api_model[key].required and key not in payload:
-            flask.abort(http.HTTPStatus.BAD_REQUEST, f"Required field '{key}' field missing")
+    for key in plan.required_keys:
+        if key not in payload:
+            return f"Required field '{key}' field missing"
     # check payload
     for key in payload:
+        if key not in plan.allowed_keys:
+            return f"Validation of '{key}' field. It is unexpected key error"
+        if key in plan.types and not _match_types(payload[key], *plan.types[key]):
+            return f"Validation of '{key}' field failed, wrong type"
         try:
-            field = api_model[key]
+            validate, is_list = plan.validators[key]
         except KeyError:
-            flask.abort(
-                http.HTTPStatus.BAD_REQUEST,
-                f"Validation of '{key}' field. It is unexpected key error",
-            )
-        if isinstance(field, flask_restx.fields.List):
-            field = field.container
-            data = payload[key]
+            continue
+        if is_list:
+            if not all(validate(item) for item in payload[key]):
+                return f"Validation of '{key}' field failed"
+        elif not validate(payload[key]):
+            return f"Validation of '{key}' field failed"
+    return None
+
+
+def _match_types(value: typing.Any, types: typing.Tuple[type, ...], is_list: bool) -> bool:
+    def _match(item: typing.Any) -> bool:
+        if not types:
+            return True
+        # bool is an int, but not a JSON integer
+        return isinstance(item, types) and (bool in types or not isinstance(item, bool))
+
+    if is_list:
+        return isinstance(value, list) and all(_match(item) for item in value)
+    return _match(value)
+
+
+# id of API model and (model, serializer), the model is kept so its id is not reused
+_serializers: typing.Dict[int, typing.Tuple[flask_restx.Model, typing.Callable]] = {}
+
+
+def _format_date(field: flask_restx.fields.Date, value: typing.Any) -> typing.Any:
+    if type(value) is datetime.date:  # pylint: disable=unidiomatic-typecheck
+        return value.isoformat()
+    return field.format(value)
+
+
+def _field_format(field: flask_restx.fields.Raw) -> typing.Union[typing.Callable, None]:
+    """fast format function of the field, None if the field needs `Raw.output`"""
+    field_type = type(field)
+    if field.mask or not isinstance(field.attribute, (str, type(None))):
+        return None
+    if field.attribute and "." in field.attribute:
+        return None
+    if field_type is flask_restx.fields.String:
+        return str
+    if field_type is flask_restx.fields.Integer:
+        return int
+    if field_type is flask_restx.fields.Boolean:
+        return bool
+    if field_type is flask_restx.fields.Date:
+        return functools.partial(_format_date, field)
+    if field_type.format is flask_restx.fields.Raw.format:
+        return lambda value: value
+    return None
+
+
+def compile_serializer(api_model: flask_restx.Model) -> typing.Callable[[typing.Any], dict]:
+    """turn the API model into a function gives the same dict as `flask_restx.marshal`,
+    later calls of the same model get the cached function
+
+    The function reads attributes of an object, a SQLAlchemy `Row` or keys of a dict.
+
+    Args:
+        api_model (flask_restx.Model): API model
+
+    Returns:
+        typing.Callable[[typing.Any], dict]: serializer
+    """
+    try:
+        return _serializers[id(api_model)][1]
+    except KeyError:
+        ...
+    outputs: typing.List[typing.Tuple[str, typing.Callable[[typing.Any], typing.Any]]] = []
+    for key, field in api_model.items():
+        if isinstance(field, flask_restx.fields.Wildcard) and not _GLOB_REGEX.search(key):
+            # a wildcard of a plain key matches the attribute of the same name
+            format_ = _field_format(field.container)
+            if format_ is not None:
+                outputs.append((key, _wildcard_output(key, format_, field.default)))
+                continue
+        format_ = _field_format(field)
+        if format_ is None:
+            outputs.append((key, functools.partial(_raw_output, field, key)))
         else:
-            data = [payload[key]]
-        if isinstance(field, CustomField) and hasattr(field, "validate"):
-            for i in data:
-                if not field.validate(i):
-                    flask.abort(http.HTTPStatus.BAD_REQUEST, f"Validation of '{key}' field failed")
+            outputs.append((key, _fast_output(field.attribute or key, format_, field.default)))
+
+    def serializer(obj: typing.Any) -> dict:
+        return {key: output(obj) for key, output in outputs}
+
+    _serializers[id(api_model)] = (api_model, serializer)
+    return serializer
+
+
+def _fast_output(
+    attribute: str, format_: typing.Callable, default: typing.Any
+) -> typing.Callable[[typing.Any], typing.Any]:
+    def output(obj: typing.Any) -> typing.Any:
+        value = obj.get(attribute) if isinstance(obj, dict) else getattr(obj, attribute, None)
+        if value is None:
+            return format_(default) if default else default
+        return format_(value)
+
+    return output
+
+
+def _wildcard_output(
+    attribute: str, format_: typing.Callable, default: typing.Any
+) -> typing.Callable[[typing.Any], typing.Any]:
+    def output(obj: typing.Any) -> typing.Any:
+        value = obj.get(attribute) if isinstance(obj, dict) else getattr(obj, attribute, None)
+        if value is None:
+            return None if default is None else format_(default)
+        return format_(value)
+
+    return output
+
+
+def _raw_output(field: flask_restx.fields.Raw, key: str, obj: typing.Any) -> typing.Any:
+    # fields of flask_restx compare the object, which a SQLAlchemy `Row` does not support
+    if isinstance(obj, sqlalchemy.engine.Row):
+        obj = dict(obj._mapping)
+    return field.output(key, obj, ordered=False)
+
+
+def json_dumps(data: typing.Any) -> bytes:
+    """encode JSON by orjson if it is installed, otherwise the standard json
+
+    Args:
+        data (typing.Any): JSON serializable data
+
+    Returns:
+        bytes: UTF-8 JSON
+    """
+    global _json_backend
+    if _json_backend is None:
+        try:
+            _json_backend = importlib.import_module("orjson")
+        except ImportError:
+            _json_backend = json
+    if _json_backend is json:
+        return json.dumps(data).encode()
+    return _json_backend.dumps(data)
+
+
+def serialize_with(api_model: flask_restx.Model) -> typing.Callable:
+    """decorator works as `flask_restx.marshal_with` by `compile_serializer` and `json_dumps`,
+    falls back to `flask_restx.marshal_with` if the request has a fields mask header
+
+    Args:
+        api_model (flask_restx.Model): API model
+
+    Returns:
+        typing.Callable: decorator
+    """
+    serializer = compile_serializer(api_model)
+
+    def decorator(func: typing.Callable) -> typing.Callable:
+        marshal_func = flask_restx.marshal_with(api_model)(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if flask.request.headers.get(
+                flask.current_app.config.get("RESTX_MASK_HEADER", "X-Fields")
+            ):
+                return marshal_func(*args, **kwargs)
+            data, code, headers = flask_restx.utils.unpack(func(*args, **kwargs))
+            if isinstance(data, (list, tuple)):
+                body = [serializer(item) for item in data]
+            else:
+                body = serializer(data)
+            return flask.Response(
+                json_dumps(body), status=code, headers=headers, mimetype="application/json"
+            )
+
+        return wrapper
+
+    return decorator
@@ -4,6 +4,8 @@ import zgiam.core
 import zgiam.api
 import zgiam.database
 import zgiam.auth
+import zgiam.lib.config
+import zgiam.lib.google
 
 
 def main():
@@ -12,6 +14,8 @@ def main():
     zgiam.database.get_db()
     zgiam.api.register_blueprint()
     zgiam.auth.config_auth_apps()
+    zgiam.lib.google.warm_up()
+    zgiam.lib.config.watch_config()
     app.run()
 
 
@@ -1,28 +1,232 @@
 """Authorization module"""
 import functools
 import datetime
+import threading
+import time
 import typing
 import http
-import json
 import oauthlib.oauth2.rfc6749.tokens
+import jwt.exceptions
 
 import sqlalchemy.exc
+import sqlalchemy.orm
 import flask
 import flask_login
 import flask_dance.contrib.google
 import flask_dance.consumer.storage.sqla
 import flask_dance.consumer
 import flask_jwt_extended
+import flask_jwt_extended.exceptions
 import flask_restx
 
 import zgiam.core
 import zgiam.database
 import zgiam.models
+import zgiam.session
 import zgiam.lib.log
 import zgiam.lib.config
+import zgiam.lib.cache
 
 logger = zgiam.lib.log.get_logger(__name__)
 
+_SESSION_OAUTH_KEY = "_oauth"
+
+# API token to detached Account snapshot
+_token_cache: typing.Union[zgiam.lib.cache.TTLCache, None] = None
+_token_denylist: typing.Union["TokenDenylist", None] = None
+# Account id to Account identity columns
+_account_cache: typing.Union[zgiam.lib.cache.CacheBackend, None] = None
+
+
+def get_account_cache() -> zgiam.lib.cache.CacheBackend:
+    """get the login account cache by config ACCOUNT_CACHE_BACKEND
+
+    Raises:
+        TypeError: unsupported backend
+
+    Returns:
+        zgiam.lib.cache.CacheBackend
+    """
+    global _account_cache
+    if _account_cache is None:
+        config = zgiam.lib.config.get_config()
+        backend = config.get("CORE", "ACCOUNT_CACHE_BACKEND", fallback="local").lower()
+        ttl = config.getint("CORE", "ACCOUNT_CACHE_TTL", fallback=300)
+        if backend == "local":
+            _account_cache = zgiam.lib.cache.TTLCache(
+                maxsize=config.getint("CORE", "ACCOUNT_CACHE_SIZE", fallback=4096), ttl=ttl
+            )
+        elif backend == "redis":
+            _account_cache = zgiam.lib.cache.RedisCache.from_url(
+                config.get("CORE", "ACCOUNT_CACHE_URL"), ttl=ttl, prefix="zgiam:account:"
+            )
+        else:
+            raise TypeError("Unsupported account cache backend. Supported are local and redis")
+    return _account_cache
+
+
+def update_account_cache(account: zgiam.models.Account) -> None:
+    """write through the login account cache after the account is updated
+
+    Args:
+        account (zgiam.models.Account): database Account model
+    """
+    get_account_cache().set(
+        account.id, zgiam.models.snapshot(account, zgiam.models.Account.identity_columns)
+    )
+
+
+def invalidate_account_cache(account_id: str) -> None:
+    """drop the account from the login account cache
+
+    Args:
+        account_id (str): account id
+    """
+    get_account_cache().delete(account_id)
+
+
+class TokenDenylist:
+    """In-memory set of revoked API token digests
+    It is loaded from `account_token` rows with `expire_time` and refreshed incrementally
+    """
+
+    def __init__(self, refresh_interval: float = 30.0):
+        """
+        Args:
+            refresh_interval (float, optional): seconds between database refresh.
+                Defaults to 30.0.
+        """
+        self.refresh_interval = refresh_interval
+        self._digests: typing.Set[bytes] = set()
+        self._last_expire_time: typing.Union[datetime.datetime, None] = None
+        self._next_refresh: float = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return zgiam.models.hash_token(token)
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def add(self, token: str) -> None:
+        """revoke token in this process immediately
+
+        Args:
+            token (str): API token
+        """
+        self._digests.add(self._digest(token))
+
+    def add_digest(self, token_hash: bytes) -> None:
+        """revoke token by its digest in this process immediately
+
+        Args:
+            token_hash (bytes): SHA-256 digest of the API token
+        """
+        self._digests.add(token_hash)
+
+    def is_revoked(self, token: str) -> bool:
+        """check token is revoked, refresh from database when refresh interval passed
+
+        Args:
+            token (str): API token
+
+        Returns:
+            bool: True if token is revoked
+        """
+        if time.monotonic() >= self._next_refresh:
+            self.refresh()
+        return self._digest(token) in self._digests
+
+    def refresh(self) -> None:
+        """load tokens expired since the last refresh"""
+        with self._lock:
+            db = zgiam.database.get_db()
+            query = db.session.query(
+                zgiam.models.AccountToken.token_hash, zgiam.models.AccountToken.expire_time
+            ).filter(zgiam.models.AccountToken.expire_time.isnot(None))
+            if self._last_expire_time:
+                # overlap with the last refresh for rows committed late
+                query = query.filter(
+                    zgiam.models.AccountToken.expire_time
+                    >= self._last_expire_time - datetime.timedelta(seconds=self.refresh_interval)
+                )
+            for token_hash, expire_time in query:
+                self._digests.add(token_hash)
+                if not self._last_expire_time or expire_time > self._last_expire_time:
+                    self._last_expire_time = expire_time
+            self._next_refresh = time.monotonic() + self.refresh_interval
+
+
+def get_token_denylist() -> TokenDenylist:
+    """get the revoked API token denylist, refreshed by config TOKEN_DENYLIST_REFRESH_INTERVAL
+
+    Returns:
+        TokenDenylist
+    """
+    global _token_denylist
+    if _token_denylist is None:
+        config = zgiam.lib.config.get_config()
+        _token_denylist = TokenDenylist(
+            config.getint("CORE", "TOKEN_DENYLIST_REFRESH_INTERVAL", fallback=30)
+        )
+    return _token_denylist
+
+
+def revoke_token(token: str) -> None:
+    """stop accepting an expired API token in this process right away
+
+    Args:
+        token (str): API token
+    """
+    invalidate_token_cache(token)
+    get_token_denylist().add(token)
+
+
+def revoke_token_hash(token_hash: bytes, account_id: str) -> None:
+    """stop accepting an expired API token known only by its digest in this process right away,
+    the token cache is keyed by tokens so all cached tokens of the account are dropped
+
+    Args:
+        token_hash (bytes): SHA-256 digest of the API token
+        account_id (str): account of the token
+    """
+    invalidate_token_cache(account_id=account_id)
+    get_token_denylist().add_digest(token_hash)
+
+
+def get_token_cache() -> zgiam.lib.cache.TTLCache:
+    """get the API token cache, sized by config TOKEN_CACHE_SIZE and TOKEN_CACHE_TTL
+
+    Returns:
+        zgiam.lib.cache.TTLCache
+    """
+    global _token_cache
+    if _token_cache is None:
+        config = zgiam.lib.config.get_config()
+        _token_cache = zgiam.lib.cache.TTLCache(
+            maxsize=config.getint("CORE", "TOKEN_CACHE_SIZE", fallback=1024),
+            ttl=config.getint("CORE", "TOKEN_CACHE_TTL", fallback=60),
+        )
+    return _token_cache
+
+
+def invalidate_token_cache(
+    token: typing.Union[str, None] = None, *, account_id: typing.Union[str, None] = None
+) -> None:
+    """drop cached API token authentication, should be called when token is expired or
+    account is updated
+
+    Args:
+        token (str, optional): API token. Defaults to None.
+        account_id (str, optional): drop all tokens of the account. Defaults to None.
+    """
+    token_cache = get_token_cache()
+    if token:
+        token_cache.delete(token)
+    if account_id:
+        token_cache.delete_if(lambda _, snapshot: snapshot["id"] == account_id)
+
 
 def login_oauth_token_check(func: typing.Callable) -> typing.Any:
     """decorator for login oauth token check by config time
@@ -41,41 +245,66 @@ def login_oauth_token_check(func: typing.Callable) -> typing.Any:
         if app.config.get("LOGIN_DISABLED") or flask.request.headers.get("token", default=None):
             return func(*args, **kwargs)
 
-        config = zgiam.lib.config.get_config()
-        google_oauth_token_expire_time = config.getint("CORE", "GOOGLE_OAUTH_TOKEN_EXPIRE_TIME")
-
-        db = zgiam.database.get_db()
-        query = db.session.query(zgiam.models.OAuth).filter_by(
-            account_id=flask_login.current_user.id,
+        google_oauth_token_expire_time = (
+            zgiam.lib.config.get_settings().google_oauth_token_expire_time
         )
-        try:
-            oauth = query.one()
-        except sqlalchemy.exc.NoResultFound:
-            logger.error("cannot find oauth for %s", flask_login.current_user.id)
-            return app.login_manager.unauthorized()  # pylint: disable=no-member
-        if google_oauth_token_expire_time:
-            token_exist_seconds = (datetime.datetime.utcnow() - oauth.created_at).total_seconds()
-            if token_exist_seconds > google_oauth_token_expire_time:
-                del app.blueprints["google"].token
-                flask.session.clear()
+
+        # decide by the OAuth created time remembered in the signed session, only ask the
+        # database when there is none or the deadline passed
+        oauth_created_at = _get_session_oauth_created_at(flask_login.current_user.id)
+        if oauth_created_at is None or (
+            google_oauth_token_expire_time
+            and time.time() - oauth_created_at > google_oauth_token_expire_time
+        ):
+            db = zgiam.database.get_db()
+            query = db.session.query(zgiam.models.OAuth).filter_by(
+                account_id=flask_login.current_user.id,
+            )
+            try:
+                oauth = query.one()
+            except sqlalchemy.exc.NoResultFound:
+                logger.error("cannot find oauth for %s", flask_login.current_user.id)
                 return app.login_manager.unauthorized()  # pylint: disable=no-member
+            if google_oauth_token_expire_time:
+                token_exist_seconds = (
+                    datetime.datetime.utcnow() - oauth.created_at
+                ).total_seconds()
+                if token_exist_seconds > google_oauth_token_expire_time:
+                    del app.blueprints["google"].token
+                    flask.session.clear()
+                    return app.login_manager.unauthorized()  # pylint: disable=no-member
+            _set_session_oauth_created_at(oauth.account_id, oauth.created_at)
         return func(*args, **kwargs)
 
     return decorated_view
 
 
+def _get_session_oauth_created_at(account_id: str) -> typing.Union[float, None]:
+    value = flask.session.get(_SESSION_OAUTH_KEY)
+    if not value or value.get("account_id") != account_id:
+        return None
+    return value.get("created_at")
+
+
+def _set_session_oauth_created_at(account_id: str, created_at: datetime.datetime) -> None:
+    # OAuth created_at is naive UTC time
+    flask.session[_SESSION_OAUTH_KEY] = {
+        "account_id": account_id,
+        "created_at": created_at.replace(tzinfo=datetime.timezone.utc).timestamp(),
+    }
+
+
 def config_auth_apps() -> None:
     """config all auth apps"""
     config = zgiam.lib.config.get_config()
     app = zgiam.core.get_app()
-    app.before_request(_make_session_permanent)
+    zgiam.session.init_app(app)
     login_manager = flask_login.LoginManager(app)
     login_manager.user_loader(_flask_login_user_loader)
     login_manager.request_loader(_flask_login_request_loader)
 
-    domains = json.loads(config.get("CORE", "DOMAINS"))
     # set google hosted_domain
-    primary_domain = domains[0]
+    primary_domain = zgiam.lib.config.get_settings().primary_domain
 
     google_blueprint = flask_dance.contrib.google.make_google_blueprint(
         scope=["profile", "email"],
@@ -94,34 +323,85 @@ def config_auth_apps() -> None:
     flask_jwt_extended.JWTManager(app)
 
 
-def _make_session_permanent():
-    # pylint: disable= assigning-non-slot
-    flask.session.permanent = True
-    flask.session.modified = True
-
-
 def _flask_login_user_loader(user_id):
     db = zgiam.database.get_db()
-    try:
-        return db.session.query(zgiam.models.Account).filter_by(id=user_id).one()
-    except sqlalchemy.exc.NoResultFound:
+    account_cache = get_account_cache()
+    account_identity = account_cache.get(user_id)
+    if account_identity is not None:
+        return zgiam.models.merge_snapshot(db.session, zgiam.models.Account, account_identity)
+
+    query = (
+        db.session.query(zgiam.models.Account)
+        .options(sqlalchemy.orm.load_only(*zgiam.models.Account.identity_columns))
+        .filter_by(id=user_id)
+    )
+    account = _replica_first(query.one_or_none)
+    if account is None:
         return None
+    update_account_cache(account)
+    return account
+
+
+def _replica_first(load: typing.Callable[[], typing.Any]) -> typing.Any:
+    """load from a replica, the primary is asked again on miss in case the replica is behind"""
+    with zgiam.database.read_only():
+        result = load()
+    if result is None and zgiam.database.get_replica_engines():
+        result = load()
+    return result
 
 
 def _flask_login_request_loader(request: flask.Request):
-    db = zgiam.database.get_db()
     token = request.headers.get("token")
-    try:
-        account_token = (
-            db.session.query(zgiam.models.AccountToken)
-            .filter_by(token=token, expire_time=None)
-            .one()
-        )
-    except sqlalchemy.exc.NoResultFound:
+    if not token:
         return None
+
+    if zgiam.lib.config.get_settings().token_verify_mode == "jwt":
+        return _load_account_by_jwt(token)
+
+    db = zgiam.database.get_db()
+    token_cache = get_token_cache()
+    account_snapshot = token_cache.get(token)
+    if account_snapshot is not None:
+        return zgiam.models.merge_snapshot(db.session, zgiam.models.Account, account_snapshot)
+
+    query = (
+        db.session.query(zgiam.models.AccountToken)
+        .options(sqlalchemy.orm.joinedload(zgiam.models.AccountToken.account))
+        .filter_by(token_hash=zgiam.models.hash_token(token), expire_time=None)
+    )
+    account_token = _replica_first(query.one_or_none)
+    if account_token is None or not account_token.check_token(token):
+        return None
+    token_cache.set(token, zgiam.models.snapshot(account_token.account))
     return account_token.account
 
 
+def _load_account_by_jwt(token: str):
+    """verify API token signature in memory, only hit database on account cache miss"""
+    try:
+        claims = flask_jwt_extended.decode_token(token)
+    except (jwt.exceptions.PyJWTError, flask_jwt_extended.exceptions.JWTExtendedException):
+        return None
+    if get_token_denylist().is_revoked(token):
+        return None
+
+    db = zgiam.database.get_db()
+    token_cache = get_token_cache()
+    account_snapshot = token_cache.get(token)
+    if account_snapshot is not None:
+        return zgiam.models.merge_snapshot(db.session, zgiam.models.Account, account_snapshot)
+
+    app = zgiam.core.get_app()
+    account_id = claims[app.config.get("JWT_IDENTITY_CLAIM", "sub")]
+    account = _replica_first(
+        db.session.query(zgiam.models.Account).filter_by(id=account_id).one_or_none
+    )
+    if account is not None:
+        token_cache.set(token, zgiam.models.snapshot(account))
+    return account
+
+
 def _google_logged_in(
     blueprint: flask_dance.consumer.OAuth2ConsumerBlueprint,
     token: oauthlib.oauth2.rfc6749.tokens.OAuth2Token,
@@ -163,10 +443,11 @@ def _google_logged_in(
         token=token,
     )
 
-    db.session.merge(oauth)
+    oauth = db.session.merge(oauth)
     db.session.commit()
 
     flask_login.login_user(account)
+    _set_session_oauth_created_at(account_id, oauth.created_at)
 
     # Disable Flask-Dance's default behavior for saving the OAuth token
     return False
@@ -181,12 +462,7 @@ def verify_email_domains(email: str) -> bool:
     Returns:
         bool: True is email in the domains. Otherwise False
     """
-    config = zgiam.lib.config.get_config()
-    domains = json.loads(config.get("CORE", "DOMAINS"))
-    for domain in domains:
-        if email.endswith(domain):
-            return True
-    return False
+    return zgiam.lib.config.get_settings().match_domain(email)
 
 
 def _google_error(blueprint: flask_dance.consumer.OAuth2ConsumerBlueprint, message, response):
@@ -0,0 +1,112 @@
+"""cli module for admin commands, run `python -m zgiam.cli --help`"""
+import json
+import sys
+import typing
+
+import click
+
+import zgiam.api.account
+import zgiam.core
+import zgiam.database
+import zgiam.retention
+import zgiam.sync
+
+
+@click.group()
+def cli() -> None:
+    """ZGZG IAM admin commands"""
+
+
+@cli.command("export-accounts")
+@click.option(
+    "--format",
+    "format_",
+    type=click.Choice(["ndjson", "csv"]),
+    default="ndjson",
+    show_default=True,
+)
+@click.option("--groups/--no-groups", default=False, help="add group emails of the account")
+@click.option(
+    "--output", type=click.File("w", encoding="utf-8"), default="-", help="default to stdout"
+)
+def export_accounts(format_: str, groups: bool, output: typing.TextIO) -> None:
+    """stream all accounts to the output"""
+    with zgiam.core.get_app().app_context():
+        zgiam.database.get_db()
+        for line in zgiam.api.account.export_accounts(format_, groups=groups):
+            output.write(line)
+
+
+@cli.command("import-accounts")
+@click.argument("input_", metavar="INPUT", type=click.File("r", encoding="utf-8", lazy=False))
+@click.option(
+    "--format",
+    "format_",
+    type=click.Choice(["ndjson", "csv"]),
+    default="ndjson",
+    show_default=True,
+)
+@click.option(
+    "--on-conflict",
+    type=click.Choice(["ignore", "update"]),
+    default="ignore",
+    show_default=True,
+    help="existing emails are ignored, or updated with the not empty fields",
+)
+def import_accounts(input_: typing.TextIO, format_: str, on_conflict: str) -> None:
+    """register accounts from INPUT, "-" for stdin, the result of every row is printed as
+    NDJSON, exit code is 1 if any row fails"""
+    failed = False
+    with zgiam.core.get_app().app_context():
+        zgiam.database.get_db()
+        rows = zgiam.api.account.read_account_rows(input_, format_)
+        for report in zgiam.api.account.import_accounts(rows, on_conflict=on_conflict):
+            failed = failed or report["message"].startswith("ERROR")
+            click.echo(json.dumps(report))
+    if failed:
+        sys.exit(1)
+
+
+@cli.command("sync-directory")
+@click.option("--dry-run", is_flag=True, help="print the changes without writing anything")
+def sync_directory(dry_run: bool) -> None:
+    """push accounts, groups and group members changed since the last sync to Google Workspace,
+    every change is printed as NDJSON, exit code is 1 if any change fails"""
+    failed = False
+    with zgiam.core.get_app().app_context():
+        zgiam.database.get_db()
+        for report in zgiam.sync.sync_directory(dry_run=dry_run):
+            failed = failed or report["message"].startswith("ERROR")
+            click.echo(json.dumps(report))
+    if failed:
+        sys.exit(1)
+
+
+@cli.command("sweep-retention")
+def sweep_retention() -> None:
+    """delete expired API tokens and stale OAuth rows by the config CORE RETENTION_* policy, the
+    report of every table is printed as NDJSON, exit code is 1 if any table fails"""
+    failed = False
+    with zgiam.core.get_app().app_context():
+        zgiam.database.get_db()
+        for report in zgiam.retention.sweep():
+            failed = failed or report["message"].startswith("ERROR")
+            click.echo(json.dumps(report))
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    """this is the real main"""
+    return cli()  # pylint: disable=no-value-for-parameter
+
+
+def init():
+    """this is init script that replace the origin `if __name__ == "__main__"`
+    see zgiam.app.init
+    """
+    if __name__ == "__main__":
+        sys.exit(main())
+
+
+init()
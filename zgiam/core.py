@@ -34,6 +34,11 @@ def get_app(name: typing.Union[str, None] = None) -> flask.Flask:
         _app = flask.Flask(name)
         _app.config.update(flask_config)
         _convert_flask_config_type(_app.config)
+        if zgiam.lib.config.get_config().getboolean("METRICS", "ENABLED"):
+            # instrumentation imports models, which import this module
+            from zgiam import instrumentation  # pylint: disable=import-outside-toplevel
+
+            instrumentation.init_app(_app)
     return _app
 
 
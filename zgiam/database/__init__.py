@@ -1,16 +1,161 @@
 """Database connector"""
+import configparser
+import contextvars
 import typing
 import contextlib
+import json
+import logging
+import random
+import threading
+import time
 
+import sqlalchemy
+import sqlalchemy.exc
+import sqlalchemy.pool
+import sqlalchemy.dialects.mysql
+import sqlalchemy.dialects.postgresql
+import sqlalchemy.dialects.sqlite
 import sqlalchemy.orm
+import sqlalchemy.sql
 import flask_sqlalchemy
 import flask
 
+import zgiam.lib.cache
 import zgiam.lib.config
+import zgiam.lib.log
 import zgiam.core
 
 
+logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
+
 _db: typing.Union[flask_sqlalchemy.SQLAlchemy, None] = None
+_pool_metrics: typing.Union["PoolMetrics", None] = None
+_replica_engines: typing.Union[typing.List[sqlalchemy.engine.Engine], None] = None
+# API tokens wrote recently, their reads stay on the primary
+_token_write_marks: typing.Union[zgiam.lib.cache.TTLCache, None] = None
+_read_only: contextvars.ContextVar = contextvars.ContextVar("zgiam_read_only", default=False)
+_SESSION_WRITE_AT_KEY: str = "_db_write_at"
+
+
+class PoolMetrics:
+    """Connection pool checkout counters, logged every interval when enabled"""
+
+    def __init__(self, log_interval: float = 0):
+        """
+        Args:
+            log_interval (float, optional): seconds between metrics log, 0 means no log.
+                Defaults to 0.
+        """
+        self.log_interval = log_interval
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._pool: typing.Union[sqlalchemy.pool.QueuePool, None] = None
+        self._last_log = time.monotonic()
+        self._lock = threading.Lock()
+
+    def observe(self, pool: sqlalchemy.pool.QueuePool, wait: float, timeout: bool = False) -> None:
+        """record a checkout
+
+        Args:
+            pool (sqlalchemy.pool.QueuePool): pool checked out from
+            wait (float): seconds waited for the connection
+            timeout (bool, optional): no connection before pool timeout. Defaults to False.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._pool = pool
+            self.checkouts += 1
+            self.timeouts += timeout
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            should_log = self.log_interval and now - self._last_log >= self.log_interval
+            if should_log:
+                self._last_log = now
+        if should_log:
+            logger.info("Database pool metrics %s", self.stats())
+
+    def stats(self) -> typing.Dict[str, typing.Union[int, float]]:
+        """checkout counters and current pool usage
+
+        Returns:
+            typing.Dict[str, typing.Union[int, float]]: counters name and value
+        """
+        stats: typing.Dict[str, typing.Union[int, float]] = {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": self.wait_total,
+            "wait_seconds_max": self.wait_max,
+        }
+        pool = self._pool
+        if pool is not None:
+            stats.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        return stats
+
+
+def get_pool_metrics() -> PoolMetrics:
+    """get the connection pool metrics
+
+    Returns:
+        PoolMetrics
+    """
+    global _pool_metrics
+    if not _pool_metrics:
+        config = zgiam.lib.config.get_config()
+        _pool_metrics = PoolMetrics(config.getfloat("DATABASE", "POOL_METRICS_LOG_INTERVAL"))
+    return _pool_metrics
+
+
+class InstrumentedQueuePool(sqlalchemy.pool.QueuePool):
+    """QueuePool records how long every checkout waits to `PoolMetrics`"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            get_pool_metrics().observe(self, time.perf_counter() - start, timeout=True)
+            raise
+        get_pool_metrics().observe(self, time.perf_counter() - start)
+        return connection
+
+
+def _engine_options(type_: str, config: configparser.SectionProxy) -> dict:
+    if type_ == "sqlite":
+        # flask_sqlalchemy picks the pool of SQLite
+        return {}
+
+    connect_args = json.loads(config.get("CONNECT_ARGS"))
+    statement_timeout = config.getint("STATEMENT_TIMEOUT")
+    if type_ == "postgresql" and config.getboolean("PGBOUNCER"):
+        # PgBouncer is the pool, psycopg2 does not use server-side prepared statements
+        options: typing.Dict[str, typing.Any] = {"poolclass": sqlalchemy.pool.NullPool}
+        if statement_timeout:
+            logger.warning("STATEMENT_TIMEOUT is ignored with PGBOUNCER, set it on the role")
+    else:
+        options = {
+            "poolclass": InstrumentedQueuePool,
+            "pool_size": config.getint("POOL_SIZE"),
+            "max_overflow": config.getint("MAX_OVERFLOW"),
+            "pool_timeout": config.getfloat("POOL_TIMEOUT"),
+            "pool_recycle": config.getint("POOL_RECYCLE"),
+            "pool_pre_ping": config.getboolean("POOL_PRE_PING"),
+        }
+        if statement_timeout and type_ == "postgresql":
+            connect_args.setdefault("options", f"-c statement_timeout={statement_timeout}")
+        elif statement_timeout and type_ == "mysql":
+            connect_args.setdefault(
+                "init_command", f"SET SESSION MAX_EXECUTION_TIME={statement_timeout}"
+            )
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
 
 
 def _config_db(app: flask.Flask) -> None:
@@ -36,10 +181,40 @@ def _config_db(app: flask.Flask) -> None:
             "Unsupported DB type. Supported types are " "mysql", "postgresql and sqlite"
         )
     app.config["SQLALCHEMY_DATABASE_URI"] = url
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _engine_options(type_, config)
 
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = config.get("SQLALCHEMY_TRACK_MODIFICATIONS")
 
 
+class RoutingSession(flask_sqlalchemy.SignallingSession):
+    """Session sends queries in `read_only` block to a replica, others to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # pylint: disable=arguments-differ,unused-argument
+        if bind is not None:
+            return bind
+        if _read_only.get() and not self._flushing:
+            replicas = get_replica_engines()
+            if replicas and not _recent_write():
+                # one replica per session, reads in a transaction see the same snapshot
+                if "replica" not in self.info:
+                    self.info["replica"] = random.choice(replicas)  # nosec
+                return self.info["replica"]
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    """flask_sqlalchemy.SQLAlchemy with `RoutingSession`"""
+
+    def create_session(self, options):
+        return sqlalchemy.orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+@sqlalchemy.event.listens_for(RoutingSession, "after_flush")
+def _after_flush(*_) -> None:
+    _mark_write()
+
+
 def get_db() -> flask_sqlalchemy.SQLAlchemy:
     """get the database connector, require Flask app global has been created
 
@@ -50,10 +225,83 @@ def get_db() -> flask_sqlalchemy.SQLAlchemy:
     if not _db:
         app = zgiam.core.get_app()
         _config_db(app)
-        _db = flask_sqlalchemy.SQLAlchemy(app)
+        _db = RoutingSQLAlchemy(app)
     return _db
 
 
+def get_replica_engines() -> typing.List[sqlalchemy.engine.Engine]:
+    """get engines of config DATABASE:REPLICA_URLS, they share the primary engine options
+
+    Returns:
+        typing.List[sqlalchemy.engine.Engine]: replica engines, empty if no replica
+    """
+    global _replica_engines
+    if _replica_engines is None:
+        app = zgiam.core.get_app()
+        get_db()
+        urls = json.loads(zgiam.lib.config.get_config().get("DATABASE", "REPLICA_URLS"))
+        options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+        _replica_engines = [sqlalchemy.create_engine(url, **options) for url in urls]
+    return _replica_engines
+
+
+def get_token_write_marks() -> zgiam.lib.cache.TTLCache:
+    """get API tokens wrote in DATABASE:REPLICA_STICKY_SECONDS
+
+    Returns:
+        zgiam.lib.cache.TTLCache
+    """
+    global _token_write_marks
+    if not _token_write_marks:
+        config = zgiam.lib.config.get_config()
+        _token_write_marks = zgiam.lib.cache.TTLCache(
+            maxsize=config.getint("CORE", "TOKEN_CACHE_SIZE"),
+            ttl=config.getfloat("DATABASE", "REPLICA_STICKY_SECONDS"),
+        )
+    return _token_write_marks
+
+
+@contextlib.contextmanager
+def read_only() -> typing.Generator:
+    """queries in the block go to a replica if config DATABASE:REPLICA_URLS is set
+    Flush and the requester wrote in DATABASE:REPLICA_STICKY_SECONDS still go to the primary.
+    It can decorate a function too, `@zgiam.database.read_only()`
+
+    Yields:
+        Iterator[typing.Generator]: None
+    """
+    reset_token = _read_only.set(True)
+    try:
+        yield
+    finally:
+        _read_only.reset(reset_token)
+
+
+def _mark_write() -> None:
+    # without replicas every read is on the primary, a marked session only re-sends the cookie
+    if not flask.has_request_context() or not get_replica_engines():
+        return
+    flask.g.zgiam_database_write = True
+    token = flask.request.headers.get("token")
+    if token:
+        get_token_write_marks().set(token, True)
+    elif "_user_id" in flask.session:
+        # cookie login, every process can see it
+        flask.session[_SESSION_WRITE_AT_KEY] = time.time()
+
+
+def _recent_write() -> bool:
+    if not flask.has_request_context():
+        return False
+    if flask.g.get("zgiam_database_write"):
+        return True
+    token = flask.request.headers.get("token")
+    if token:
+        return get_token_write_marks().get(token, False)
+    sticky_seconds = zgiam.lib.config.get_settings().replica_sticky_seconds
+    return time.time() - flask.session.get(_SESSION_WRITE_AT_KEY, 0) < sticky_seconds
+
+
 @contextlib.contextmanager
 def get_session(
     session: sqlalchemy.orm.scoped_session = None, *, close: bool = False
@@ -82,3 +330,72 @@ def get_session(
     finally:
         if close:
             session.close()  # type: ignore
+
+
+def insert_ignore(
+    connection: sqlalchemy.engine.Connection, table: sqlalchemy.Table
+) -> sqlalchemy.sql.Insert:
+    """dialect-aware INSERT statement which skips rows conflicting with existing unique keys
+
+    Args:
+        connection (sqlalchemy.engine.Connection): database connection, decide the dialect
+        table (sqlalchemy.Table): table insert into
+
+    Raises:
+        TypeError: unsupported database dialect
+
+    Returns:
+        sqlalchemy.sql.Insert: insert statement
+    """
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        return sqlalchemy.dialects.postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == "mysql":
+        return sqlalchemy.insert(table).prefix_with("IGNORE")
+    if dialect == "sqlite":
+        return sqlalchemy.insert(table).prefix_with("OR IGNORE")
+    raise TypeError(f"Unsupported DB dialect {dialect}")
+
+
+def upsert(
+    connection: sqlalchemy.engine.Connection,
+    table: sqlalchemy.Table,
+    index_elements: typing.List[str],
+    update_columns: typing.List[str],
+) -> sqlalchemy.sql.Insert:
+    """dialect-aware INSERT statement which updates rows conflicting with existing unique keys,
+    NULL inserting values keep the existing values
+
+    Args:
+        connection (sqlalchemy.engine.Connection): database connection, decide the dialect
+        table (sqlalchemy.Table): table insert into
+        index_elements (typing.List[str]): columns of the conflicting unique key,
+            MySQL uses all unique keys
+        update_columns (typing.List[str]): columns updated on conflict
+
+    Raises:
+        TypeError: unsupported database dialect
+
+    Returns:
+        sqlalchemy.sql.Insert: insert statement
+    """
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        module = getattr(sqlalchemy.dialects, dialect)
+        statement = module.insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={
+                column: sqlalchemy.func.coalesce(statement.excluded[column], table.c[column])
+                for column in update_columns
+            },
+        )
+    if dialect == "mysql":
+        statement = sqlalchemy.dialects.mysql.insert(table)
+        return statement.on_duplicate_key_update(
+            {
+                column: sqlalchemy.func.coalesce(statement.inserted[column], table.c[column])
+                for column in update_columns
+            }
+        )
+    raise TypeError(f"Unsupported DB dialect {dialect}")
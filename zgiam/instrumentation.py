@@ -0,0 +1,345 @@
+"""Request and database query instrumentation module
+Flask request hooks and SQLAlchemy cursor events record wall time, query count and database
+time per endpoint. Results are logged and served in Prometheus text format at `/metrics`
+"""
+
+import collections
+import json
+import logging
+import threading
+import time
+import typing
+
+import flask
+import sqlalchemy
+import sqlalchemy.engine
+import sqlalchemy.event
+
+import zgiam.lib.log
+import zgiam.lib.config
+import zgiam.lib.google
+import zgiam.auth
+import zgiam.database
+
+
+logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
+
+_request_metrics: typing.Union["RequestMetrics", None] = None
+
+# seconds, upper bounds of the request latency histogram buckets
+_LATENCY_BUCKETS: typing.Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# endpoint label of requests matched no URL rule, such as 404
+_UNMATCHED_ENDPOINT: str = "<unmatched>"
+
+
+class EndpointStats:
+    """counters of one endpoint"""
+
+    def __init__(self, slow_query_samples: int):
+        self.requests: typing.Counter[typing.Tuple[str, int]] = collections.Counter()
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.latency_buckets = [0] * len(_LATENCY_BUCKETS)
+        self.queries = 0
+        self.db_time = 0.0
+        self.slow_queries = 0
+        # recent (seconds, statement) slower than the threshold
+        self.slow_query_samples: typing.Deque[typing.Tuple[float, str]] = collections.deque(
+            maxlen=slow_query_samples
+        )
+
+
+class RequestMetrics:
+    """Thread-safe per endpoint request and database query metrics"""
+
+    def __init__(
+        self,
+        slow_query_threshold: float = 0.1,
+        slow_query_samples: int = 10,
+        repeated_query_threshold: int = 10,
+        log_requests: bool = False,
+    ):
+        """
+        Args:
+            slow_query_threshold (float, optional): seconds, slower queries are logged and
+                sampled. Defaults to 0.1.
+            slow_query_samples (int, optional): slow queries kept per endpoint. Defaults to 10.
+            repeated_query_threshold (int, optional): a statement run this many times in one
+                request is logged as a possible N+1, 0 means no check. Defaults to 10.
+            log_requests (bool, optional): log one JSON line per request. Defaults to False.
+        """
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_query_samples = slow_query_samples
+        self.repeated_query_threshold = repeated_query_threshold
+        self.log_requests = log_requests
+        self.endpoints: typing.Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, endpoint: str) -> EndpointStats:
+        try:
+            return self.endpoints[endpoint]
+        except KeyError:
+            return self.endpoints.setdefault(endpoint, EndpointStats(self.slow_query_samples))
+
+    def observe_request(
+        self,
+        endpoint: str,
+        method: str,
+        status: int,
+        latency: float,
+        queries: int,
+        db_time: float,
+    ) -> None:
+        """record a finished request
+
+        Args:
+            endpoint (str): URL rule of the request
+            method (str): HTTP method
+            status (int): response status code
+            latency (float): seconds of the request
+            queries (int): database queries run by the request
+            db_time (float): seconds spent in the queries
+        """
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats.requests[(method, status)] += 1
+            stats.latency_sum += latency
+            stats.latency_count += 1
+            for i, bound in enumerate(_LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats.latency_buckets[i] += 1
+            stats.queries += queries
+            stats.db_time += db_time
+
+    def observe_slow_query(self, endpoint: str, duration: float, statement: str) -> None:
+        """record a query slower than the threshold
+
+        Args:
+            endpoint (str): URL rule of the request, `<none>` outside requests
+            duration (float): seconds of the query
+            statement (str): SQL statement
+        """
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats.slow_queries += 1
+            stats.slow_query_samples.append((duration, statement))
+
+    def render(self) -> str:
+        """Prometheus text format of the request metrics
+
+        Returns:
+            str: metrics lines
+        """
+        lines = [
+            "# HELP zgiam_http_requests_total HTTP requests",
+            "# TYPE zgiam_http_requests_total counter",
+        ]
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            for endpoint, stats in endpoints:
+                for (method, status), count in sorted(stats.requests.items()):
+                    labels = _labels(endpoint=endpoint, method=method, status=str(status))
+                    lines.append(f"zgiam_http_requests_total{labels} {count}")
+            lines += [
+                "# HELP zgiam_http_request_duration_seconds HTTP request wall time",
+                "# TYPE zgiam_http_request_duration_seconds histogram",
+            ]
+            for endpoint, stats in endpoints:
+                for bound, count in zip(_LATENCY_BUCKETS, stats.latency_buckets):
+                    labels = _labels(endpoint=endpoint, le=str(bound))
+                    lines.append(f"zgiam_http_request_duration_seconds_bucket{labels} {count}")
+                labels = _labels(endpoint=endpoint, le="+Inf")
+                lines.append(
+                    f"zgiam_http_request_duration_seconds_bucket{labels} {stats.latency_count}"
+                )
+                labels = _labels(endpoint=endpoint)
+                lines.append(f"zgiam_http_request_duration_seconds_sum{labels} {stats.latency_sum}")
+                lines.append(
+                    f"zgiam_http_request_duration_seconds_count{labels} {stats.latency_count}"
+                )
+            for name, help_, attribute in (
+                ("zgiam_db_queries_total", "database queries", "queries"),
+                ("zgiam_db_query_seconds_total", "database query time", "db_time"),
+                ("zgiam_db_slow_queries_total", "database queries over threshold", "slow_queries"),
+            ):
+                lines += [f"# HELP {name} {help_}", f"# TYPE {name} counter"]
+                for endpoint, stats in endpoints:
+                    lines.append(f"{name}{_labels(endpoint=endpoint)} {getattr(stats, attribute)}")
+        return "\n".join(lines) + "\n"
+
+
+def get_request_metrics() -> RequestMetrics:
+    """get the request metrics by config METRICS section
+
+    Returns:
+        RequestMetrics
+    """
+    global _request_metrics
+    if _request_metrics is None:
+        config = zgiam.lib.config.get_config()
+        _request_metrics = RequestMetrics(
+            slow_query_threshold=config.getfloat("METRICS", "SLOW_QUERY_THRESHOLD") / 1000,
+            slow_query_samples=config.getint("METRICS", "SLOW_QUERY_SAMPLES"),
+            repeated_query_threshold=config.getint("METRICS", "REPEATED_QUERY_THRESHOLD"),
+            log_requests=config.getboolean("METRICS", "LOG_REQUESTS"),
+        )
+    return _request_metrics
+
+
+def _labels(**labels: str) -> str:
+    def _escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _current_endpoint() -> str:
+    if not flask.has_request_context():
+        return "<none>"
+    rule = flask.request.url_rule
+    return rule.rule if rule is not None else _UNMATCHED_ENDPOINT
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # pylint: disable=unused-argument,too-many-arguments
+    conn.info.setdefault("zgiam_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # pylint: disable=unused-argument,too-many-arguments
+    try:
+        duration = time.perf_counter() - conn.info["zgiam_query_start"].pop()
+    except (KeyError, IndexError):
+        return
+    metrics = get_request_metrics()
+    if flask.has_request_context():
+        flask.g.zgiam_queries = getattr(flask.g, "zgiam_queries", 0) + 1
+        flask.g.zgiam_db_time = getattr(flask.g, "zgiam_db_time", 0.0) + duration
+        if metrics.repeated_query_threshold:
+            statements = flask.g.setdefault("zgiam_statements", collections.Counter())
+            statements[statement] += 1
+    if duration >= metrics.slow_query_threshold:
+        endpoint = _current_endpoint()
+        metrics.observe_slow_query(endpoint, duration, statement)
+        logger.warning(
+            "slow query %s",
+            json.dumps(
+                {"endpoint": endpoint, "duration_ms": round(duration * 1000, 3), "sql": statement}
+            ),
+        )
+
+
+def _start_request() -> None:
+    flask.g.zgiam_request_start = time.perf_counter()
+    flask.g.zgiam_queries = 0
+    flask.g.zgiam_db_time = 0.0
+
+
+def _save_status(response: flask.Response) -> flask.Response:
+    flask.g.zgiam_status = response.status_code
+    return response
+
+
+def _finish_request(_: typing.Union[BaseException, None]) -> None:
+    """record the request at teardown, queries of a streamed response are included"""
+    start = flask.g.pop("zgiam_request_start", None)
+    if start is None:
+        return
+    latency = time.perf_counter() - start
+    metrics = get_request_metrics()
+    endpoint = _current_endpoint()
+    queries = flask.g.get("zgiam_queries", 0)
+    db_time = flask.g.get("zgiam_db_time", 0.0)
+    status = flask.g.get("zgiam_status", 500)
+    metrics.observe_request(endpoint, flask.request.method, status, latency, queries, db_time)
+
+    statements = flask.g.get("zgiam_statements")
+    if statements:
+        statement, count = statements.most_common(1)[0]
+        if count >= metrics.repeated_query_threshold:
+            logger.warning(
+                "repeated query %s",
+                json.dumps({"endpoint": endpoint, "count": count, "sql": statement}),
+            )
+    if metrics.log_requests:
+        logger.info(
+            "request %s",
+            json.dumps(
+                {
+                    "endpoint": endpoint,
+                    "method": flask.request.method,
+                    "status": status,
+                    "duration_ms": round(latency * 1000, 3),
+                    "queries": queries,
+                    "db_ms": round(db_time * 1000, 3),
+                }
+            ),
+        )
+
+
+def _stats_lines(prefix: str, help_: str, stats: typing.Dict[str, typing.Any]) -> typing.List[str]:
+    """untyped metric lines of a `stats()` dict, nested dicts become `le` labeled buckets"""
+    lines = []
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            lines.append(f"# HELP {name} {help_} {key}")
+            lines += [f"{name}{_labels(le=le)} {count}" for le, count in value.items()]
+        elif isinstance(value, (int, float)):
+            lines += [f"# HELP {name} {help_} {key}", f"{name} {value}"]
+    return lines
+
+
+def render_metrics() -> str:
+    """request metrics and the stats of the database pool, Google API executor and caches in
+    Prometheus text format
+
+    Returns:
+        str: metrics exposition
+    """
+    lines = [get_request_metrics().render().rstrip("\n")]
+    lines += _stats_lines(
+        "zgiam_db_pool", "database pool", zgiam.database.get_pool_metrics().stats()
+    )
+    lines += _stats_lines(
+        "zgiam_google_api", "Google API", zgiam.lib.google.get_executor().metrics.stats()
+    )
+    lines += _stats_lines(
+        "zgiam_token_cache", "API token cache", zgiam.auth.get_token_cache().stats()
+    )
+    lines += _stats_lines(
+        "zgiam_account_cache", "login account cache", zgiam.auth.get_account_cache().stats()
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _metrics_view() -> flask.Response:
+    return flask.Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app: flask.Flask) -> None:
+    """register the request hooks, SQLAlchemy cursor events of all engines and `/metrics`
+
+    Args:
+        app (flask.Flask): Flask app
+    """
+    engine_class = sqlalchemy.engine.Engine
+    if not sqlalchemy.event.contains(engine_class, "before_cursor_execute", _before_cursor_execute):
+        sqlalchemy.event.listen(engine_class, "before_cursor_execute", _before_cursor_execute)
+        sqlalchemy.event.listen(engine_class, "after_cursor_execute", _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_save_status)
+    app.teardown_request(_finish_request)
+    app.add_url_rule("/metrics", "metrics", _metrics_view)
@@ -1,26 +1,232 @@
-"""jobs modules"""
-# TODO: may need to refactor and use tasks system with queue
+"""jobs modules
+Slow work runs as database queued jobs, `enqueue` them in a request and run them by `Worker`
+"""
 
+import concurrent.futures
+import datetime
 import logging
+import random
+import threading
+import time
+import typing
+
+import googleapiclient.errors
+import sqlalchemy
+import sqlalchemy.orm
 
 import zgiam.lib.log
 import zgiam.lib.config
 import zgiam.lib.google
+import zgiam.core
+import zgiam.database
 import zgiam.models
+import zgiam.retention
 
 
 logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
 
+# job type and function handle the job payload
+_handlers: typing.Dict[str, typing.Callable[[dict], typing.Any]] = {}
 
-def create_google_workspace_account(account: zgiam.models.Account) -> None:
-    """create Google Workspace account from Account models
+
+def job_handler(type_: str) -> typing.Callable:
+    """decorator register a function as the handler of a job type
+    The function gets the job payload and returns a JSON serializable result.
 
     Args:
-        account (zgiam.models.Account): database Account model
+        type_ (str): job type
+
+    Returns:
+        typing.Callable: decorator
+    """
+
+    def decorator(func: typing.Callable[[dict], typing.Any]) -> typing.Callable:
+        _handlers[type_] = func
+        return func
+
+    return decorator
+
+
+def enqueue(
+    type_: str,
+    payload: dict,
+    *,
+    session: typing.Union[sqlalchemy.orm.Session, None] = None,
+    max_attempts: typing.Union[int, None] = None,
+) -> zgiam.models.Job:
+    """add a job to the session, it is queued when the caller commits
+
+    Args:
+        type_ (str): job type registered by `job_handler`
+        payload (dict): JSON serializable job arguments
+        session (sqlalchemy.orm.Session, optional): SQLAlchemy session.
+            Defaults to flask_sqlalchemy.SQLAlchemy.session
+        max_attempts (int, optional): run times before failed.
+            Defaults to config JOB:MAX_ATTEMPTS
+
+    Raises:
+        KeyError: unknown job type
+
+    Returns:
+        zgiam.models.Job: job with id
+    """
+    if type_ not in _handlers:
+        raise KeyError(f"Unknown job type {type_}")
+    if max_attempts is None:
+        max_attempts = zgiam.lib.config.get_config().getint("JOB", "MAX_ATTEMPTS")
+    session = session or zgiam.database.get_db().session
+    job = zgiam.models.Job(type=type_, payload=payload, max_attempts=max_attempts)
+    session.add(job)
+    session.flush()
+    return job
+
+
+class Worker:
+    """Run queued jobs in a thread pool, failed jobs are retried with exponential backoff"""
+
+    def __init__(
+        self,
+        max_workers: typing.Union[int, None] = None,
+        poll_interval: typing.Union[float, None] = None,
+    ):
+        """
+        Args:
+            max_workers (int, optional): threads. Defaults to config JOB:MAX_WORKERS
+            poll_interval (float, optional): seconds to wait when no job.
+                Defaults to config JOB:POLL_INTERVAL
+        """
+        config = zgiam.lib.config.get_config()
+        self.max_workers = max_workers or config.getint("JOB", "MAX_WORKERS")
+        self.poll_interval = poll_interval or config.getfloat("JOB", "POLL_INTERVAL")
+        self.backoff_base = config.getfloat("JOB", "BACKOFF_BASE")
+        self.backoff_max = config.getfloat("JOB", "BACKOFF_MAX")
+        self.lease_timeout = config.getint("JOB", "LEASE_TIMEOUT")
+        self.retention_interval = config.getint("CORE", "RETENTION_INTERVAL")
+        self.stop_event = threading.Event()
+
+    def run(self) -> None:
+        """run until `stop_event` is set, the retention sweep is also run every
+        `retention_interval` seconds
+        """
+        logger.info("Job worker started with %s threads", self.max_workers)
+        running: typing.Set[concurrent.futures.Future] = set()
+        next_sweep = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self.stop_event.is_set():
+                running = {future for future in running if not future.done()}
+                if self.retention_interval > 0 and time.monotonic() >= next_sweep:
+                    next_sweep = time.monotonic() + self.retention_interval
+                    running.add(executor.submit(self.run_retention_sweep))
+                job_ids = self.claim(self.max_workers - len(running))
+                for job_id in job_ids:
+                    running.add(executor.submit(self.run_job, job_id))
+                if not job_ids:
+                    self.stop_event.wait(self.poll_interval)
+        logger.info("Job worker stopped")
+
+    def run_once(self) -> int:
+        """claim and run jobs in the current thread
+
+        Returns:
+            int: number of jobs run
+        """
+        job_ids = self.claim(self.max_workers)
+        for job_id in job_ids:
+            self.run_job(job_id)
+        return len(job_ids)
+
+    def claim(self, limit: int) -> typing.List[int]:
+        """mark due jobs RUNNING, jobs RUNNING longer than the lease timeout are claimed again
+
+        Args:
+            limit (int): max jobs
+
+        Returns:
+            typing.List[int]: claimed job ids
+        """
+        if limit <= 0:
+            return []
+        now = datetime.datetime.utcnow()
+        Job = zgiam.models.Job  # pylint: disable=invalid-name
+        with zgiam.database.get_session() as session:
+            jobs = (
+                session.query(Job)
+                .filter(
+                    sqlalchemy.or_(
+                        sqlalchemy.and_(Job.status == "QUEUED", Job.run_after <= now),
+                        sqlalchemy.and_(
+                            Job.status == "RUNNING",
+                            Job.updated_at < now - datetime.timedelta(seconds=self.lease_timeout),
+                        ),
+                    )
+                )
+                .order_by(Job.run_after)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for job in jobs:
+                job.status = "RUNNING"
+                job.attempts += 1
+            job_ids = [job.id for job in jobs]
+        return job_ids
+
+    def run_job(self, job_id: int) -> None:
+        """run a claimed job in its own app context and database session
+
+        Args:
+            job_id (int): job id
+        """
+        with zgiam.core.get_app().app_context():
+            with zgiam.database.get_session() as session:
+                job = session.query(zgiam.models.Job).filter_by(id=job_id).one()
+                job_type, payload = job.type, job.payload
+            try:
+                result = _handlers[job_type](payload)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.exception("Job %s(%s) failed", job_id, job_type)
+                self._fail(job_id, e)
+                return
+            with zgiam.database.get_session() as session:
+                job = session.query(zgiam.models.Job).filter_by(id=job_id).one()
+                job.status = "SUCCEEDED"
+                job.result = result
+                job.error = None
+
+    def run_retention_sweep(self) -> None:  # pylint: disable=no-self-use
+        """run `zgiam.retention.sweep` in its own app context"""
+        with zgiam.core.get_app().app_context():
+            try:
+                zgiam.retention.sweep()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Retention sweep failed")
+
+    def _fail(self, job_id: int, error: Exception) -> None:
+        with zgiam.database.get_session() as session:
+            job = session.query(zgiam.models.Job).filter_by(id=job_id).one()
+            job.error = repr(error)
+            if job.attempts >= job.max_attempts:
+                job.status = "FAILED"
+                return
+            # exponential backoff with jitter
+            delay = min(self.backoff_base * 2 ** (job.attempts - 1), self.backoff_max)
+            delay *= random.uniform(0.5, 1.0)  # nosec
+            job.status = "QUEUED"
+            job.run_after = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+
+
+def google_workspace_account_body(account: zgiam.models.Account) -> dict:
+    """Google Workspace user of the account, see Directory API users resource
+
+    Args:
+        account (zgiam.models.Account): database Account model or a row has the same columns
+
+    Returns:
+        dict: user resource
     """
     config = zgiam.lib.config.get_config()
     primary_domain = config.get("CORE", "PRIMARY_DOMAIN")
-    body = {
+    return {
         "externalIds": [{"value": account.id, "type": "organization"}],
         "primaryEmail": f"{account.id}@{primary_domain}",
         "orgUnitPath": f"/{primary_domain}",
@@ -30,4 +236,110 @@ def create_google_workspace_account(account: zgiam.models.Account) -> None:
         "recoveryEmail": account.email,
         "emails": [{"address": account.email, "type": "home"}],
     }
-    zgiam.lib.google.AdminDirectory().users.insert(body=body).execute()
+
+
+def create_google_workspace_account(account: zgiam.models.Account) -> None:
+    """create Google Workspace account from Account models, see
+    `insert_google_workspace_account`
+
+    Args:
+        account (zgiam.models.Account): database Account model
+    """
+    insert_google_workspace_account(google_workspace_account_body(account))
+
+
+def insert_google_workspace_account(body: dict) -> None:
+    """create Google Workspace account from the request body with no database access, an
+    existing account is kept, the insert is not idempotent and a re-run job finds the account
+    created by the last run
+
+    Args:
+        body (dict): body by `google_workspace_account_body`
+    """
+    request = zgiam.lib.google.AdminDirectory().users.insert(body=body)
+    try:
+        zgiam.lib.google.get_executor().execute(request)
+    except googleapiclient.errors.HttpError as e:
+        if not zgiam.lib.google.is_conflict(e):
+            raise
+        logger.info("Google Workspace account %s already exists", body["primaryEmail"])
+
+
+def create_google_workspace_accounts(
+    accounts: typing.Iterable[zgiam.models.Account],
+) -> typing.Dict[str, typing.Union[Exception, None]]:
+    """create Google Workspace accounts from Account models with batch requests
+    Batches size by config GOOGLE_API:BATCH_SIZE and run in GOOGLE_API:MAX_WORKERS threads
+
+    Args:
+        accounts (typing.Iterable[zgiam.models.Account]): database Account models
+
+    Returns:
+        typing.Dict[str, typing.Union[Exception, None]]: account email and the error,
+            None if created
+    """
+    # read models here, they are bound to the session of this thread
+    return insert_google_workspace_accounts(
+        {account.email: google_workspace_account_body(account) for account in accounts}
+    )
+
+
+def insert_google_workspace_accounts(
+    bodies: typing.Dict[str, dict],
+) -> typing.Dict[str, typing.Union[Exception, None]]:
+    """create Google Workspace accounts from request bodies with batch requests, no database
+    access, callers do not need to hold a transaction
+    Batches size by config GOOGLE_API:BATCH_SIZE and run in GOOGLE_API:MAX_WORKERS threads
+
+    Args:
+        bodies (typing.Dict[str, dict]): account email and the body by
+            `google_workspace_account_body`
+
+    Returns:
+        typing.Dict[str, typing.Union[Exception, None]]: account email and the error,
+            None if created
+    """
+    config = zgiam.lib.config.get_config()
+    batch_size = config.getint("GOOGLE_API", "BATCH_SIZE")
+    max_workers = config.getint("GOOGLE_API", "MAX_WORKERS")
+
+    items = list(bodies.items())
+    chunks = [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+    results: typing.Dict[str, typing.Union[Exception, None]] = {}
+    if not chunks:
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(max_workers, len(chunks))
+    ) as executor:
+        for chunk_results in executor.map(_insert_google_workspace_users, chunks):
+            results.update(chunk_results)
+    return results
+
+
+def _insert_google_workspace_users(
+    chunk: typing.List[typing.Tuple[str, dict]]
+) -> typing.Dict[str, typing.Union[Exception, None]]:
+    # httplib2 is not thread-safe, every thread has its own client
+    directory = zgiam.lib.google.AdminDirectory()
+    results = zgiam.lib.google.get_executor().execute_batch(
+        directory.service,
+        [(email, directory.users.insert(body=body)) for email, body in chunk],
+        inserts=frozenset(email for email, _ in chunk),
+    )
+    return {email: results[email][1] for email, _ in chunk}
+
+
+@job_handler("create_google_workspace_account")
+def _create_google_workspace_account_job(payload: dict) -> dict:
+    # no transaction is open during the Google request and its retries
+    with zgiam.database.get_session() as session:
+        account = session.query(zgiam.models.Account).filter_by(email=payload["email"]).one()
+        account_id = account.id
+        body = google_workspace_account_body(account)
+    insert_google_workspace_account(body)
+    with zgiam.database.get_session() as session:
+        session.query(zgiam.models.Account).filter_by(email=payload["email"]).update(
+            {"has_iam_google_account": True}, synchronize_session=False
+        )
+    return {"id": account_id}
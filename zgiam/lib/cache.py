@@ -0,0 +1,197 @@
+"""Cache module"""
+import abc
+import collections
+import importlib
+import json
+import threading
+import time
+import typing
+
+
+class CacheBackend(metaclass=abc.ABCMeta):
+    """Cache backend abstract class"""
+
+    @abc.abstractmethod
+    def get(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        """get value by key
+
+        Args:
+            key (typing.Hashable): cache key
+            default (typing.Any, optional): return value on miss. Defaults to None.
+        """
+
+    @abc.abstractmethod
+    def set(self, key: typing.Hashable, value: typing.Any) -> None:
+        """set value by key
+
+        Args:
+            key (typing.Hashable): cache key
+            value (typing.Any): value
+        """
+
+    @abc.abstractmethod
+    def delete(self, key: typing.Hashable) -> None:
+        """delete the key if exists
+
+        Args:
+            key (typing.Hashable): cache key
+        """
+
+    @abc.abstractmethod
+    def stats(self) -> typing.Dict[str, int]:
+        """cache counters
+
+        Returns:
+            typing.Dict[str, int]: counters name and value
+        """
+
+
+class TTLCache(CacheBackend):
+    """Thread-safe bounded LRU cache whose entries also expire after a time-to-live"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        """
+        Args:
+            maxsize (int, optional): maximum entries kept, the least recently used entry is
+                evicted first. Defaults to 1024.
+            ttl (float, optional): seconds an entry stays valid. Defaults to 60.0.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        """get value by key, expired entry counts as a miss
+
+        Args:
+            key (typing.Hashable): cache key
+            default (typing.Any, optional): return value on miss. Defaults to None.
+
+        Returns:
+            typing.Any: cached value or default
+        """
+        with self._lock:
+            try:
+                expire_at, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expire_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: typing.Hashable, value: typing.Any) -> None:
+        """set value by key
+
+        Args:
+            key (typing.Hashable): cache key
+            value (typing.Any): value
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: typing.Hashable) -> None:
+        """delete the key if exists
+
+        Args:
+            key (typing.Hashable): cache key
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_if(self, predicate: typing.Callable[[typing.Any, typing.Any], bool]) -> int:
+        """delete all entries the predicate returns True
+
+        Args:
+            predicate (typing.Callable[[typing.Any, typing.Any], bool]): function of (key, value)
+
+        Returns:
+            int: number of deleted entries
+        """
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        """delete all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> typing.Dict[str, int]:
+        """cache counters
+
+        Returns:
+            typing.Dict[str, int]: hits, misses and current size
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+class RedisCache(CacheBackend):
+    """Shared cache on a Redis compatible client, values are stored as JSON"""
+
+    def __init__(self, client: typing.Any, ttl: int = 60, prefix: str = "zgiam:"):
+        """
+        Args:
+            client (typing.Any): client has `get`, `set(name, value, ex=)` and `delete`,
+                such as `redis.Redis`
+            ttl (int, optional): seconds an entry stays valid. Defaults to 60.
+            prefix (str, optional): key prefix. Defaults to "zgiam:".
+        """
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._client = client
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisCache":
+        """create cache with a `redis` client connect to the url
+
+        Args:
+            url (str): such as redis://localhost:6379/0
+
+        Raises:
+            RuntimeError: redis package is not installed
+
+        Returns:
+            RedisCache
+        """
+        try:
+            redis = importlib.import_module("redis")
+        except ImportError as e:
+            raise RuntimeError("shared cache backend requires `redis` package") from e
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        value = self._client.get(f"{self.prefix}{key}")
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: typing.Hashable, value: typing.Any) -> None:
+        self._client.set(f"{self.prefix}{key}", json.dumps(value), ex=self.ttl)
+
+    def delete(self, key: typing.Hashable) -> None:
+        self._client.delete(f"{self.prefix}{key}")
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
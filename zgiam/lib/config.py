@@ -1,20 +1,90 @@
-"""Config module"""
+"""Config module
+`get_config` returns the raw `ConfigParser`, `get_settings` a typed snapshot of the options read
+on hot paths. `reload_config` builds a new config and swaps it in, `ConfigWatcher` runs it on
+SIGHUP or a config file change
+"""
 import typing
 import os
 import configparser
 import json
 import logging
 import logging.config
+import signal
+import threading
 
 from zgiam.lib import DEFAULT_CONFIG_FOLDER
 from . import log
 
 logger: logging.Logger = log.get_logger(__name__)
 
-_config: typing.Union[configparser.ConfigParser, None] = None
+_config: typing.Union["VersionedConfigParser", None] = None
+_settings: typing.Union["Settings", None] = None
 _ENV_PREFIX: str = "IAM"
 
 
+class VersionedConfigParser(configparser.ConfigParser):
+    """ConfigParser counts changes, `get_settings` rebuilds its snapshot when it changed"""
+
+    version: int = 0
+
+    def set(self, section: str, option: str, value: typing.Union[str, None] = None) -> None:
+        super().set(section, option, value)
+        self.version += 1
+
+
+class Settings(typing.NamedTuple):
+    """frozen snapshot of the parsed hot path options, see `get_settings`"""
+
+    # source of the snapshot
+    config: configparser.ConfigParser
+    version: int
+    domains: typing.Tuple[str, ...]
+    primary_domain: str
+    # `@domain` and `.domain` of every domain, lower case
+    domain_suffixes: typing.Tuple[str, ...]
+    google_oauth_token_expire_time: int
+    token_verify_mode: str
+    session_refresh_fraction: float
+    replica_sticky_seconds: float
+
+    @classmethod
+    def from_config(cls, config: "VersionedConfigParser") -> "Settings":
+        """parse the options once
+
+        Args:
+            config (VersionedConfigParser): config
+
+        Returns:
+            Settings
+        """
+        version = config.version
+        domains = tuple(json.loads(config.get("CORE", "DOMAINS")))
+        return cls(
+            config=config,
+            version=version,
+            domains=domains,
+            primary_domain=domains[0],
+            domain_suffixes=tuple(
+                f"{separator}{domain.lower()}" for domain in domains for separator in "@."
+            ),
+            google_oauth_token_expire_time=config.getint("CORE", "GOOGLE_OAUTH_TOKEN_EXPIRE_TIME"),
+            token_verify_mode=config.get("CORE", "TOKEN_VERIFY_MODE", fallback="database").lower(),
+            session_refresh_fraction=config.getfloat("CORE", "SESSION_REFRESH_FRACTION"),
+            replica_sticky_seconds=config.getfloat("DATABASE", "REPLICA_STICKY_SECONDS"),
+        )
+
+    def match_domain(self, email: str) -> bool:
+        """check the email is in one of the domains or their subdomains
+
+        Args:
+            email (str): email address
+
+        Returns:
+            bool: True if matched
+        """
+        return email.lower().endswith(self.domain_suffixes)
+
+
 def get_config(reload: bool = False) -> configparser.ConfigParser:
     """get config
 
@@ -33,56 +103,185 @@ def get_config(reload: bool = False) -> configparser.ConfigParser:
     return _config
 
 
-def _load_default_config() -> None:
-    global _config
+def get_settings() -> Settings:
+    """get the typed snapshot of the current config, rebuilt only after the config changed
+    Readers take no lock, a reload swaps the whole snapshot
+
+    Returns:
+        Settings
+    """
+    global _settings
+    settings = _settings
+    config = get_config()
+    if settings is None or settings.config is not config or settings.version != config.version:
+        settings = _settings = Settings.from_config(config)
+    return settings
+
+
+def reload_config() -> Settings:
+    """load the config files and environment variables again, the old config keeps serving
+    until the new one is complete. Options used at startup such as DATABASE still need a restart
+
+    Returns:
+        Settings: snapshot of the new config
+    """
+    global _config, _settings
+    # a broken config raises here, before anything is swapped
+    config = _build_config()
+    settings = Settings.from_config(config)
+    _apply_config(config)
+    # readers between the two swaps rebuild the snapshot from the new config
+    _config = config
+    _settings = settings
+    logger.info("Config reloaded")
+    return settings
+
+
+def _config_path() -> str:
+    return os.environ.get(f"{_ENV_PREFIX}_CONFIG_PATH", "/etc/zgiam/zgiam.cfg")
+
+
+class ConfigWatcher(threading.Thread):
+    """Daemon thread runs `reload_config` on SIGHUP or when the config file changed"""
+
+    def __init__(self, interval: typing.Union[float, None] = None):
+        """
+        Args:
+            interval (float, optional): seconds between config file checks, 0 only reloads on
+                SIGHUP. Defaults to config CORE:CONFIG_RELOAD_INTERVAL
+        """
+        super().__init__(name="zgiam-config-watcher", daemon=True)
+        if interval is None:
+            interval = get_config().getfloat("CORE", "CONFIG_RELOAD_INTERVAL")
+        self.interval = interval
+        self.reload_event = threading.Event()
+        self.stop_event = threading.Event()
+
+    def install_signal_handler(self) -> None:
+        """reload on SIGHUP, must be called in the main thread"""
+        if hasattr(signal, "SIGHUP"):
+            # only wake the thread, reloading in a signal handler may deadlock on logging locks
+            signal.signal(signal.SIGHUP, lambda *_: self.reload_event.set())
+
+    def stop(self) -> None:
+        """stop the thread"""
+        self.stop_event.set()
+        self.reload_event.set()
+
+    @staticmethod
+    def _mtime() -> typing.Union[float, None]:
+        try:
+            return os.stat(_config_path()).st_mtime
+        except OSError:
+            return None
+
+    def run(self) -> None:
+        mtime = self._mtime()
+        while not self.stop_event.is_set():
+            requested = self.reload_event.wait(self.interval or None)
+            self.reload_event.clear()
+            if self.stop_event.is_set():
+                break
+            current_mtime = self._mtime()
+            if not requested and current_mtime == mtime:
+                continue
+            mtime = current_mtime
+            try:
+                reload_config()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Config reload failed, keep the current config")
+
+
+def watch_config() -> ConfigWatcher:
+    """start a `ConfigWatcher` with SIGHUP handler
+
+    Returns:
+        ConfigWatcher: started thread
+    """
+    watcher = ConfigWatcher()
+    watcher.install_signal_handler()
+    watcher.start()
+    return watcher
+
+
+def _load_default_config() -> VersionedConfigParser:
     default_config_file = os.path.join(DEFAULT_CONFIG_FOLDER, "default_iam.cfg")
-    _config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
-    _config.optionxform = str  # type: ignore
-    _config.read(default_config_file)
+    config = VersionedConfigParser(interpolation=configparser.ExtendedInterpolation())
+    config.optionxform = str  # type: ignore
+    config.read(default_config_file)
+    return config
 
 
 @typing.no_type_check
-def _load_local_config() -> None:
+def _load_local_config(config: VersionedConfigParser) -> None:
     read_in_config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
     read_in_config.optionxform = str
-    env_config_path = os.environ.get(f"{_ENV_PREFIX}_CONFIG_PATH", "/etc/zgiam/zgiam.cfg")
-    read_in_config.read(env_config_path)
-    for section in _config.sections():
-        for option in _config.options(section):
-            config_value = _config.get(section, option)
+    read_in_config.read(_config_path())
+    for section in config.sections():
+        for option in config.options(section):
+            config_value = config.get(section, option)
             read_in_config_value = read_in_config.get(section, option, fallback=config_value)
-            _config.set(section, option, read_in_config_value)
+            config.set(section, option, read_in_config_value)
 
 
 @typing.no_type_check
-def _load_environ_config() -> None:
-    for section in _config.sections():
-        for option in _config.options(section):
-            config_value = _config.get(section, option)
+def _load_environ_config(config: VersionedConfigParser) -> None:
+    for section in config.sections():
+        for option in config.options(section):
+            config_value = config.get(section, option)
             environ_value = os.getenv(
                 f"{_ENV_PREFIX}_{section.upper()}_{option.upper()}", config_value
             )
-            _config.set(section, option, environ_value)
+            config.set(section, option, environ_value)
 
 
 @typing.no_type_check
 def _load_config() -> None:
-    _load_default_config()
-    _load_local_config()
-    _load_environ_config()
+    global _config
+    config = _build_config()
+    _apply_config(config)
+    _config = config
+
+
+@typing.no_type_check
+def _build_config() -> VersionedConfigParser:
+    """read the config files and environment variables into a new config, nothing global changes
 
+    Raises:
+        ValueError: DOMAINS is not a JSON list
+
+    Returns:
+        VersionedConfigParser
+    """
+    config = _load_default_config()
+    _load_local_config(config)
+    _load_environ_config(config)
+
+    # either DEBUG turns on both
+    if config.getboolean("CORE", "DEBUG", fallback=False) or config.getboolean(
+        "FLASK", "DEBUG", fallback=False
+    ):
+        config.set("FLASK", "DEBUG", "TRUE")
+        config.set("CORE", "DEBUG", "TRUE")
+
+    # set primary_domain
+    domains = json.loads(config.get("CORE", "DOMAINS"))  # type: ignore
+    # set google hosted_domain
+    config.set("CORE", "PRIMARY_DOMAIN", domains[0])
+    return config
+
+
+@typing.no_type_check
+def _apply_config(config: VersionedConfigParser) -> None:
+    """apply the logging and debug options of the config, the config is not changed"""
     # update logger config
-    new_logging_config_path = _config.get("LOGGING", "CONFIG_PATH")
+    new_logging_config_path = config.get("LOGGING", "CONFIG_PATH")
     if new_logging_config_path:
         logging.config.fileConfig(new_logging_config_path, disable_existing_loggers=False)
         logger.info("Logging format updated")
 
     #  update debug
-    if _config.getboolean("CORE", "DEBUG", fallback=False) or _config.getboolean(
-        "FLASK", "DEBUG", fallback=False
-    ):
-        _config.set("FLASK", "DEBUG", "TRUE")
-        _config.set("CORE", "DEBUG", "TRUE")
+    if config.getboolean("CORE", "DEBUG", fallback=False):
         root_package_name = __name__.split(".", maxsplit=1)[0]
         logging.getLogger(root_package_name).setLevel(logging.DEBUG)
         logging.getLogger().setLevel(logging.DEBUG)
@@ -103,7 +302,7 @@ def _load_config() -> None:
         logger.debug("DEBUG flag set, in debug mode")
 
     # update sqlalchemy logging debug flag
-    if _config.getboolean("DATABASE", "SQLALCHEMY_DEBUG", fallback=False):
+    if config.getboolean("DATABASE", "SQLALCHEMY_DEBUG", fallback=False):
         # FIXME: I don't know how to only set sqlalchemy to debug
         #        because the sqlalchemy will folk the root logger
         logging.getLogger().setLevel(logging.DEBUG)
@@ -117,8 +316,3 @@ def _load_config() -> None:
             logger_.setLevel(logging.DEBUG)
 
         logger.debug("SQLALCHEMY_DEBUG flag set, sqlalchemy will output debug logging")
-
-    # set primary_domain
-    domains = json.loads(_config.get("CORE", "DOMAINS"))  # type: ignore
-    # set google hosted_domain
-    _config.set("CORE", "PRIMARY_DOMAIN", domains[0])
@@ -1,10 +1,16 @@
 """Google client module"""
 import abc
+import json
 import logging
 import os.path
+import random
+import threading
+import time
 import typing
 
 import googleapiclient.discovery
+import googleapiclient.discovery_cache
+import googleapiclient.errors
 import google.oauth2.service_account
 
 import zgiam.lib.log
@@ -12,6 +18,426 @@ import zgiam.lib.config
 
 logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
 
+_registry: typing.Union["ClientRegistry", None] = None
+_executor: typing.Union["ApiExecutor", None] = None
+
+# HTTP status of Google API errors worth retrying
+_RETRIABLE_STATUSES: typing.FrozenSet[int] = frozenset((429, 500, 502, 503, 504))
+# error reasons of a retriable 403, other 403 are permission errors
+_RATE_LIMIT_REASONS: typing.Tuple[str, ...] = (
+    "rateLimitExceeded",
+    "userRateLimitExceeded",
+    "quotaExceeded",
+)
+# scopes of user provisioning, domain-wide delegation may grant only these
+ADMIN_DIRECTORY_USER_SCOPES: typing.Tuple[str, ...] = (
+    "https://www.googleapis.com/auth/admin.directory.user",
+)
+# scopes of the directory sync, it writes groups and members too
+ADMIN_DIRECTORY_SYNC_SCOPES: typing.Tuple[str, ...] = ADMIN_DIRECTORY_USER_SCOPES + (
+    "https://www.googleapis.com/auth/admin.directory.group",
+)
+# seconds, upper bounds of the latency histogram buckets
+_LATENCY_BUCKETS: typing.Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ClientRegistry:
+    """Process-wide Google client registry
+    Credentials and discovery documents are shared by all threads. Credentials refresh the
+    access token by themselves when it expires. Services are cached per thread because the
+    underlying httplib2 is not thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._credentials: typing.Dict[typing.Tuple[str, tuple], typing.Any] = {}
+        self._documents: typing.Dict[typing.Tuple[str, str], typing.Any] = {}
+        self._local = threading.local()
+
+    def get_credentials(
+        self, service_account_key_path: str, scopes: typing.Union[list, None] = None
+    ) -> google.oauth2.service_account.Credentials:
+        """get service account credentials, the key file is only read once
+
+        Args:
+            service_account_key_path (str): service account key path
+            scopes (list, optional): a scopes list Google required. Defaults to None.
+
+        Returns:
+            google.oauth2.service_account.Credentials
+        """
+        key = (service_account_key_path, tuple(scopes or ()))
+        with self._lock:
+            if key not in self._credentials:
+                credentials = google.oauth2.service_account.Credentials.from_service_account_file(
+                    service_account_key_path, scopes=scopes
+                )
+                self._credentials[key] = credentials
+            return self._credentials[key]
+
+    def get_document(self, service_name: str, version: str) -> typing.Any:
+        """get the parsed discovery document shipped with googleapiclient
+
+        Args:
+            service_name (str): such as "admin"
+            version (str): such as "directory_v1"
+
+        Returns:
+            typing.Any: discovery document, None if it is not shipped
+        """
+        key = (service_name, version)
+        with self._lock:
+            if key not in self._documents:
+                document = googleapiclient.discovery_cache.get_static_doc(service_name, version)
+                self._documents[key] = json.loads(document) if document else None
+            return self._documents[key]
+
+    def get_service(
+        self, service_name: str, version: str, credentials: typing.Any
+    ) -> googleapiclient.discovery.Resource:
+        """get the service of this thread
+
+        Args:
+            service_name (str): such as "admin"
+            version (str): such as "directory_v1"
+            credentials (typing.Any): credentials from `get_credentials`
+
+        Returns:
+            googleapiclient.discovery.Resource
+        """
+        services = self._local.__dict__.setdefault("services", {})
+        key = (service_name, version, id(credentials))
+        if key not in services:
+            document = self.get_document(service_name, version)
+            if document:
+                services[key] = googleapiclient.discovery.build_from_document(
+                    document, credentials=credentials
+                )
+            else:
+                logger.warning("no static discovery document for %s %s", service_name, version)
+                services[key] = googleapiclient.discovery.build(
+                    service_name, version, credentials=credentials
+                )
+        return services[key]
+
+
+def get_registry() -> ClientRegistry:
+    """get the process-wide Google client registry
+
+    Returns:
+        ClientRegistry
+    """
+    global _registry
+    if _registry is None:
+        _registry = ClientRegistry()
+    return _registry
+
+
+def warm_up() -> None:
+    """load credentials and discovery documents before serving requests"""
+    try:
+        AdminDirectory()
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.warning("Google client warm up failed: %s", e)
+
+
+class TokenBucket:
+    """Thread-safe token bucket, callers take tokens in turn and sleep off the deficit"""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate (float): tokens added per second, 0 means no limit
+            capacity (float): most tokens kept, the burst after idle
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """take tokens, wait until the bucket refills if it runs out
+
+        Args:
+            tokens (float, optional): tokens to take. Defaults to 1.
+
+        Returns:
+            float: seconds waited
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # the deficit is owed by this caller, later callers wait behind it
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class ApiMetrics:
+    """Google API call counters and latency histogram"""
+
+    def __init__(self):
+        self.calls = 0
+        self.batches = 0
+        self.retries = 0
+        self.errors = 0
+        self.throttle_wait_total = 0.0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.latency_buckets = [0] * len(_LATENCY_BUCKETS)
+        self._lock = threading.Lock()
+
+    def observe(self, calls: int, latency: float, batch: bool = False) -> None:
+        """record an HTTP request to Google
+
+        Args:
+            calls (int): API calls in the request, more than one for a batch request
+            latency (float): seconds of the request
+            batch (bool, optional): it is a batch request. Defaults to False.
+        """
+        with self._lock:
+            self.calls += calls
+            self.batches += batch
+            self.latency_sum += latency
+            self.latency_count += 1
+            for i, bound in enumerate(_LATENCY_BUCKETS):
+                if latency <= bound:
+                    self.latency_buckets[i] += 1
+
+    def count(self, retries: int = 0, errors: int = 0, throttle_wait: float = 0.0) -> None:
+        """add to the retry, error and throttle wait counters
+
+        Args:
+            retries (int, optional): calls retried. Defaults to 0.
+            errors (int, optional): calls failed after retries. Defaults to 0.
+            throttle_wait (float, optional): seconds waited for the rate limit. Defaults to 0.0.
+        """
+        with self._lock:
+            self.retries += retries
+            self.errors += errors
+            self.throttle_wait_total += throttle_wait
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        """counters and cumulative latency histogram
+
+        Returns:
+            typing.Dict[str, typing.Any]: counters name and value, latency_seconds_bucket maps
+                the bucket upper bound to the requests not slower than it
+        """
+        with self._lock:
+            buckets = {
+                str(bound): count for bound, count in zip(_LATENCY_BUCKETS, self.latency_buckets)
+            }
+            buckets["+Inf"] = self.latency_count
+            return {
+                "calls": self.calls,
+                "batches": self.batches,
+                "retries": self.retries,
+                "errors": self.errors,
+                "throttle_wait_seconds_total": self.throttle_wait_total,
+                "latency_seconds_sum": self.latency_sum,
+                "latency_seconds_count": self.latency_count,
+                "latency_seconds_bucket": buckets,
+            }
+
+
+def _http_status(error: Exception) -> typing.Union[int, None]:
+    if not isinstance(error, googleapiclient.errors.HttpError):
+        return None
+    try:
+        return int(error.resp.status)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def is_conflict(error: Exception) -> bool:
+    """Google API error is a conflict, the resource to insert already exists
+
+    Args:
+        error (Exception): error of a request
+
+    Returns:
+        bool: the resource exists
+    """
+    return _http_status(error) == 409
+
+
+def is_retriable(error: Exception) -> bool:
+    """Google API error is a rate limit or server error
+
+    Args:
+        error (Exception): error of a request
+
+    Returns:
+        bool: retry may succeed
+    """
+    status = _http_status(error)
+    if status is None:
+        return False
+    if status in _RETRIABLE_STATUSES:
+        return True
+    if status == 403:
+        content = error.content.decode("utf-8", errors="replace")
+        return any(reason in content for reason in _RATE_LIMIT_REASONS)
+    return False
+
+
+class ApiExecutor:
+    """Execute Google API requests under a process-wide rate limit, rate limited and server
+    errors are retried with exponential backoff and jitter"""
+
+    def __init__(
+        self,
+        rate: typing.Union[float, None] = None,
+        burst: typing.Union[float, None] = None,
+        max_retries: typing.Union[int, None] = None,
+    ):
+        """
+        Args:
+            rate (float, optional): requests per second. Defaults to config GOOGLE_API:RATE_LIMIT
+            burst (float, optional): requests at once after idle.
+                Defaults to config GOOGLE_API:RATE_BURST
+            max_retries (int, optional): retries of a request.
+                Defaults to config GOOGLE_API:MAX_RETRIES
+        """
+        config = zgiam.lib.config.get_config()
+        if rate is None:
+            rate = config.getfloat("GOOGLE_API", "RATE_LIMIT")
+        if burst is None:
+            burst = config.getfloat("GOOGLE_API", "RATE_BURST")
+        if max_retries is None:
+            max_retries = config.getint("GOOGLE_API", "MAX_RETRIES")
+        self.max_retries = max_retries
+        self.batch_size = config.getint("GOOGLE_API", "BATCH_SIZE")
+        self.backoff_base = config.getfloat("GOOGLE_API", "BACKOFF_BASE")
+        self.backoff_max = config.getfloat("GOOGLE_API", "BACKOFF_MAX")
+        self.bucket = TokenBucket(rate, burst)
+        self.metrics = ApiMetrics()
+
+    def execute(self, request: typing.Any, insert: bool = False) -> typing.Any:
+        """execute a request, retry if it is rate limited or a server error
+
+        Args:
+            request (typing.Any): googleapiclient.http.HttpRequest
+            insert (bool, optional): the request creates a resource, a conflict after a retry
+                is success, the failed attempt may have created it. Defaults to False.
+
+        Raises:
+            googleapiclient.errors.HttpError: not retriable or out of retries
+
+        Returns:
+            typing.Any: response body, None if an insert conflicted after a retry
+        """
+        for retry in range(self.max_retries + 1):
+            self.metrics.count(throttle_wait=self.bucket.acquire())
+            start = time.monotonic()
+            try:
+                return request.execute()
+            except googleapiclient.errors.HttpError as e:
+                if insert and retry > 0 and is_conflict(e):
+                    logger.info("Google API insert created by an earlier attempt: %s", e)
+                    return None
+                if retry == self.max_retries or not is_retriable(e):
+                    self.metrics.count(errors=1)
+                    raise
+                logger.warning("Google API request retry %s: %s", retry + 1, e)
+                self.metrics.count(retries=1)
+            finally:
+                self.metrics.observe(1, time.monotonic() - start)
+            self._backoff(retry)
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    def execute_batch(
+        self,
+        service: typing.Any,
+        requests: typing.Iterable[typing.Tuple[str, typing.Any]],
+        inserts: typing.Container[str] = (),
+    ) -> typing.Dict[str, typing.Tuple[typing.Any, typing.Union[Exception, None]]]:
+        """execute requests as batch requests of GOOGLE_API:BATCH_SIZE, requests rate limited
+        or with a server error are sent again in the next batch after a backoff
+
+        Args:
+            service (typing.Any): service has `new_batch_http_request`
+            requests (typing.Iterable[typing.Tuple[str, typing.Any]]): request id and request
+            inserts (typing.Container[str], optional): ids of the requests creating a resource,
+                see `insert` of `execute`. Defaults to ().
+
+        Returns:
+            typing.Dict[str, typing.Tuple[typing.Any, typing.Union[Exception, None]]]: request
+                id and (response, error), error is None if the request succeeded
+        """
+        pending = list(requests)
+        results: typing.Dict[str, typing.Tuple[typing.Any, typing.Union[Exception, None]]] = {}
+        for retry in range(self.max_retries + 1):
+            retrying = []
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start : start + self.batch_size]
+                chunk_results = self._execute_batch_once(service, chunk)
+                for request_id, request in chunk:
+                    response, error = chunk_results.get(
+                        request_id, (None, RuntimeError("no response from Google batch request"))
+                    )
+                    if retry > 0 and request_id in inserts and is_conflict(error):
+                        # the failed attempt created the resource
+                        response, error = None, None
+                    if error is not None and retry < self.max_retries and is_retriable(error):
+                        retrying.append((request_id, request))
+                    else:
+                        results[request_id] = (response, error)
+            if not retrying:
+                break
+            logger.warning("Google API batch retry %s: %s requests", retry + 1, len(retrying))
+            self.metrics.count(retries=len(retrying))
+            self._backoff(retry)
+            pending = retrying
+        self.metrics.count(errors=sum(error is not None for _, error in results.values()))
+        return results
+
+    def _execute_batch_once(
+        self, service: typing.Any, chunk: typing.List[typing.Tuple[str, typing.Any]]
+    ) -> typing.Dict[str, typing.Tuple[typing.Any, typing.Union[Exception, None]]]:
+        results = {}
+
+        def _callback(request_id, response, exception):
+            results[request_id] = (response, exception)
+
+        batch = service.new_batch_http_request(callback=_callback)
+        for request_id, request in chunk:
+            batch.add(request, request_id=request_id)
+        # every request in a batch counts against the quota
+        self.metrics.count(throttle_wait=self.bucket.acquire(len(chunk)))
+        start = time.monotonic()
+        try:
+            batch.execute()
+        except googleapiclient.errors.HttpError as e:
+            logger.error("Google batch request failed: %s", e)
+            return {request_id: (None, e) for request_id, _ in chunk}
+        finally:
+            self.metrics.observe(len(chunk), time.monotonic() - start, batch=True)
+        return results
+
+    def _backoff(self, retry: int) -> None:
+        delay = min(self.backoff_base * 2**retry, self.backoff_max)
+        time.sleep(delay * random.uniform(0.5, 1.0))  # nosec
+
+
+def get_executor() -> ApiExecutor:
+    """get the process-wide Google API executor, its rate limit is shared by all threads
+
+    Returns:
+        ApiExecutor
+    """
+    global _executor
+    if _executor is None:
+        _executor = ApiExecutor()
+    return _executor
+
 
 class Google(metaclass=abc.ABCMeta):
     """Google client abstract connector class"""
@@ -44,16 +470,19 @@ class Google(metaclass=abc.ABCMeta):
                 )
         service_account_key_path = os.path.normpath(service_account_key_path)
 
-        self._credentials = google.oauth2.service_account.Credentials.from_service_account_file(
-            service_account_key_path, scopes=scopes
-        )
+        self._credentials = get_registry().get_credentials(service_account_key_path, scopes=scopes)
 
 
 class AdminDirectory(Google):
     """Google Admin directory client connector class"""
 
     def __init__(
-        self, /, service_account_key_path: str = "", *args, **kwargs
+        self,
+        /,
+        service_account_key_path: str = "",
+        *args,
+        scopes: typing.Sequence[str] = ADMIN_DIRECTORY_USER_SCOPES,
+        **kwargs,
     ):  # pylint: disable=keyword-arg-before-vararg
         """Google admin directory API
             Reference: https://developers.google.com/admin-sdk/directory/reference/rest
@@ -62,6 +491,8 @@ class AdminDirectory(Google):
             service_account_key_path (str, optional): service account key path.
                 Defaults to config file GOOGLE_SERVICE_ACCOUNT_KEY_PATH:ADMIN_DIRECTORY_KEY
                 if not set, read fromm GOOGLE_SERVICE_ACCOUNT_KEY_PATH:GENERAL_KEY
+            scopes (typing.Sequence[str], optional): a scopes list Google required.
+                Defaults to ADMIN_DIRECTORY_USER_SCOPES
         """
         if not service_account_key_path:
             config = zgiam.lib.config.get_config()
@@ -71,12 +502,10 @@ class AdminDirectory(Google):
         super().__init__(
             service_account_key_path,
             *args,
-            scopes=["https://www.googleapis.com/auth/admin.directory.user"],
+            scopes=list(scopes),
             **kwargs,
         )
-        self.service = googleapiclient.discovery.build(
-            "admin", "directory_v1", credentials=self._credentials
-        )
+        self.service = get_registry().get_service("admin", "directory_v1", self._credentials)
 
     @property
     def users(self) -> googleapiclient.discovery.Resource:
@@ -97,3 +526,13 @@ class AdminDirectory(Google):
             googleapiclient.discovery.Resource: [description]
         """
         return self.service.groups()  # pylint: disable = no-member
+
+    @property
+    def members(self) -> googleapiclient.discovery.Resource:
+        """Members API
+            Reference: https://developers.google.com/admin-sdk/directory/reference/rest/v1/members
+
+        Returns:
+            googleapiclient.discovery.Resource: google resource class
+        """
+        return self.service.members()  # pylint: disable = no-member
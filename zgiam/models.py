@@ -1,6 +1,11 @@
 """Database model module"""
 
+import collections
+import datetime
+import hashlib
+import hmac
 import logging
+import re
 import typing
 import sqlalchemy
 import sqlalchemy.schema
@@ -51,6 +56,18 @@ class Account(flask_login.UserMixin, base):
     review_status = sqlalchemy.Column(sqlalchemy.String(30))
     has_iam_google_account = sqlalchemy.Column(sqlalchemy.Boolean, default=False)
 
+    # keyset pagination of account list, see zgiam.api.account.AccountList
+    __table_args__ = (
+        sqlalchemy.Index("ix_account_register_date_email", "register_date", "email"),
+        sqlalchemy.Index("ix_account_review_status_email", "review_status", "email"),
+        sqlalchemy.Index(
+            "ix_account_review_status_register_date_email",
+            "review_status",
+            "register_date",
+            "email",
+        ),
+    )
+
     reviewed_accounts: "Account" = sqlalchemy.orm.relationship(
         "Account", backref=sqlalchemy.orm.backref("review_by_user", remote_side=id)
     )
@@ -64,8 +81,19 @@ class Account(flask_login.UserMixin, base):
         "Group", secondary="accout_group", back_populates="accounts"
     )
 
-    tokens: typing.List["AccountToken"] = sqlalchemy.orm.relationship(
-        "AccountToken", back_populates="account"
+    # query-style, filter tokens in SQL instead of loading all the account ever had
+    tokens: sqlalchemy.orm.Query = sqlalchemy.orm.relationship(
+        "AccountToken", back_populates="account", lazy="dynamic"
+    )
+
+    # columns enough to identify the login account, others can be loaded when needed
+    identity_columns: typing.Tuple[str, ...] = (
+        "email",
+        "id",
+        "first_name",
+        "last_name",
+        "type",
+        "review_status",
     )
 
     def __repr__(self):
@@ -85,20 +113,115 @@ class Account(flask_login.UserMixin, base):
             return self.id
 
         with zgiam.database.get_session() as session:
-            pure_firstname = self.first_name.replace(" ", "").lower()  # type: ignore
-            lastname_initial = self.last_name.replace(" ", "").lower()[0]  # type: ignore
-
-            temp_id = f"{pure_firstname}{lastname_initial}"
-            query = (
-                session.query(Account)
-                .filter(Account.id.like(f"%{temp_id}%"))
-                .statement.with_only_columns([sqlalchemy.sql.func.count()])
-                .order_by(None)
-            )
-            count = session.execute(query).scalar()
-            self.id = temp_id if not count else f"{temp_id}{count}"
+            base_id = self.generate_base_id()
+            suffix = allocate_account_id_suffixes(session, base_id)
+            self.id = f"{base_id}{suffix or ''}"
         return self.id
 
+    def generate_base_id(self) -> str:
+        """id before the duplicate number, first_name + last_name initial
+
+        Returns:
+            str: base id
+        """
+        pure_firstname = self.first_name.replace(" ", "").lower()  # type: ignore
+        lastname_initial = self.last_name.replace(" ", "").lower()[0]  # type: ignore
+        return f"{pure_firstname}{lastname_initial}"
+
+
+class AccountIdSequence(base):
+    """next duplicate number of each account base id, see `Account.generate_id`"""
+
+    __tablename__ = "account_id_sequence"
+    base_id = sqlalchemy.Column(sqlalchemy.String(100), primary_key=True)
+    next_suffix = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"AccountIdSequence<base_id: {self.base_id}, next_suffix: {self.next_suffix}>"
+
+
+def allocate_account_id_suffixes(
+    session: sqlalchemy.orm.Session, base_id: str, count: int = 1
+) -> int:
+    """reserve duplicate numbers of a base id in the current transaction
+    The UPDATE locks the sequence row on PostgreSQL/MySQL and the whole database on SQLite,
+    so concurrent allocations are serialized until commit.
+
+    Args:
+        session (sqlalchemy.orm.Session): SQLAlchemy session
+        base_id (str): base id, see `Account.generate_base_id`
+        count (int, optional): how many numbers to reserve. Defaults to 1.
+
+    Raises:
+        RuntimeError: cannot allocate
+
+    Returns:
+        int: the first reserved number, reserved range is [return, return + count)
+    """
+    table = AccountIdSequence.__table__
+    connection = session.connection()
+    for _ in range(2):
+        result = connection.execute(
+            table.update()
+            .where(table.c.base_id == base_id)
+            .values(next_suffix=table.c.next_suffix + count)
+        )
+        if result.rowcount:
+            next_suffix = connection.execute(
+                sqlalchemy.select(table.c.next_suffix).where(table.c.base_id == base_id)
+            ).scalar()
+            return next_suffix - count
+
+        # first allocation of this base id, seed from ids already exist
+        seed = _next_existing_account_id_suffix(connection, base_id)
+        result = connection.execute(
+            zgiam.database.insert_ignore(connection, table).values(
+                base_id=base_id, next_suffix=seed + count
+            )
+        )
+        if result.rowcount:
+            return seed
+        # lost the race of seeding, the row exists now
+    raise RuntimeError(f"Cannot allocate account id for {base_id}")
+
+
+def generate_account_ids(
+    session: sqlalchemy.orm.Session, accounts: typing.Iterable[Account]
+) -> None:
+    """bulk version of `Account.generate_id`, numbers of a base id are reserved at once
+    Accounts already have id are skipped, caller commits the session.
+
+    Args:
+        session (sqlalchemy.orm.Session): SQLAlchemy session
+        accounts (typing.Iterable[Account]): accounts in the session
+    """
+    accounts_by_base_id: typing.Dict[str, typing.List[Account]] = collections.defaultdict(list)
+    for account in accounts:
+        if not account.id:
+            accounts_by_base_id[account.generate_base_id()].append(account)
+    # same lock order in every transaction
+    for base_id in sorted(accounts_by_base_id):
+        base_id_accounts = accounts_by_base_id[base_id]
+        first_suffix = allocate_account_id_suffixes(session, base_id, len(base_id_accounts))
+        for offset, account in enumerate(base_id_accounts):
+            suffix = first_suffix + offset
+            account.id = f"{base_id}{suffix or ''}"
+
+
+def _next_existing_account_id_suffix(connection: sqlalchemy.engine.Connection, base_id: str) -> int:
+    # prefix LIKE can use the unique index of account.id
+    escaped_base_id = base_id.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    account_ids = connection.execute(
+        sqlalchemy.select(Account.id).where(Account.id.like(f"{escaped_base_id}%", escape="\\"))
+    ).scalars()
+    id_regex = re.compile(rf"^{re.escape(base_id)}(\d*)$")
+    suffixes = [
+        int(match.group(1) or 0)
+        for match in (id_regex.match(account_id) for account_id in account_ids)
+        if match
+    ]
+    return max(suffixes) + 1 if suffixes else 0
+
 
 class Group(base):
     """group table model"""
@@ -124,6 +247,8 @@ class AccountGroup(base):
     """account and group during many to many join table"""
 
     __tablename__ = "accout_group"
+    # primary key starts with account_id, members of a group need their own index
+    __table_args__ = (sqlalchemy.Index("ix_accout_group_group_id", "group_id"),)
     account_id = sqlalchemy.Column(
         sqlalchemy.String(100), sqlalchemy.ForeignKey("account.id"), primary_key=True
     )
@@ -132,6 +257,119 @@ class AccountGroup(base):
     )
 
 
+# ids bound to one IN / executemany statement of group membership changes
+_MEMBERSHIP_CHUNK_SIZE: int = 500
+
+
+def _chunks(items: typing.Collection[str]) -> typing.Iterator[typing.List[str]]:
+    items = sorted(items)
+    for i in range(0, len(items), _MEMBERSHIP_CHUNK_SIZE):
+        yield items[i : i + _MEMBERSHIP_CHUNK_SIZE]
+
+
+def get_group_member_ids(
+    session: sqlalchemy.orm.Session,
+    group_id: int,
+    account_ids: typing.Union[typing.Collection[str], None] = None,
+) -> typing.Set[str]:
+    """account ids in the group
+
+    Args:
+        session (sqlalchemy.orm.Session): SQLAlchemy session
+        group_id (int): group id
+        account_ids (typing.Collection[str], optional): only check these accounts.
+            Defaults to all members.
+
+    Returns:
+        typing.Set[str]: member account ids
+    """
+    table = AccountGroup.__table__
+    query = sqlalchemy.select(table.c.account_id).where(table.c.group_id == group_id)
+    connection = session.connection()
+    if account_ids is None:
+        return set(connection.execute(query).scalars())
+    member_ids: typing.Set[str] = set()
+    for chunk in _chunks(account_ids):
+        member_ids.update(connection.execute(query.where(table.c.account_id.in_(chunk))).scalars())
+    return member_ids
+
+
+def change_group_members(
+    session: sqlalchemy.orm.Session,
+    group_id: int,
+    add: typing.Collection[str] = (),
+    remove: typing.Collection[str] = (),
+) -> typing.Tuple[typing.Set[str], typing.Set[str]]:
+    """add and remove group members with set-based INSERT and DELETE on the join table
+    Only the difference from the current members is written, caller commits the session.
+
+    Args:
+        session (sqlalchemy.orm.Session): SQLAlchemy session
+        group_id (int): group id
+        add (typing.Collection[str], optional): account ids to add. Defaults to ().
+        remove (typing.Collection[str], optional): account ids to remove. Defaults to ().
+
+    Returns:
+        typing.Tuple[typing.Set[str], typing.Set[str]]: account ids added and removed
+    """
+    session.flush()
+    add, remove = set(add), set(remove)
+    member_ids = get_group_member_ids(session, group_id, add | remove)
+    added = add - member_ids
+    removed = (remove & member_ids) - add
+    _write_group_members(session, group_id, added, removed)
+    return added, removed
+
+
+def replace_group_members(
+    session: sqlalchemy.orm.Session, group_id: int, account_ids: typing.Collection[str]
+) -> typing.Tuple[typing.Set[str], typing.Set[str]]:
+    """make the accounts the only members of the group, caller commits the session
+
+    Args:
+        session (sqlalchemy.orm.Session): SQLAlchemy session
+        group_id (int): group id
+        account_ids (typing.Collection[str]): account ids of all members
+
+    Returns:
+        typing.Tuple[typing.Set[str], typing.Set[str]]: account ids added and removed
+    """
+    session.flush()
+    account_ids = set(account_ids)
+    member_ids = get_group_member_ids(session, group_id)
+    added, removed = account_ids - member_ids, member_ids - account_ids
+    _write_group_members(session, group_id, added, removed)
+    return added, removed
+
+
+def _write_group_members(
+    session: sqlalchemy.orm.Session,
+    group_id: int,
+    added: typing.Set[str],
+    removed: typing.Set[str],
+) -> None:
+    table = AccountGroup.__table__
+    connection = session.connection()
+    for chunk in _chunks(removed):
+        connection.execute(
+            table.delete().where(table.c.group_id == group_id, table.c.account_id.in_(chunk))
+        )
+    # a member added by a concurrent request since the read is skipped, not a key conflict
+    for chunk in _chunks(added):
+        connection.execute(
+            zgiam.database.insert_ignore(connection, table),
+            [{"group_id": group_id, "account_id": account_id} for account_id in chunk],
+        )
+    if not added and not removed:
+        return
+    # loaded relationships are stale now
+    for instance in list(session.identity_map.values()):
+        if isinstance(instance, Group) and instance.id == group_id:
+            session.expire(instance, ["accounts"])
+        elif isinstance(instance, Account) and instance.id in added | removed:
+            session.expire(instance, ["groups"])
+
+
 class OAuth(flask_dance.consumer.storage.sqla.OAuthConsumerMixin, base):
     """account OAuth token"""
 
@@ -169,17 +407,169 @@ class OAuth(flask_dance.consumer.storage.sqla.OAuthConsumerMixin, base):
         return f"OAuth<account_id: {self.account_id}, provider: {self.provider}>"
 
 
+def hash_token(token: str) -> bytes:
+    """fixed-width digest stored in place of the API token
+
+    Args:
+        token (str): API token
+
+    Returns:
+        bytes: 32 bytes SHA-256 digest
+    """
+    return hashlib.sha256(token.encode()).digest()
+
+
 class AccountToken(base):
-    """account token"""
+    """account token
+    Only the SHA-256 digest of the token is stored, the token itself is known in memory when
+    the model is created by `AccountToken(token=...)`
+    """
 
     __tablename__ = "account_token"
 
     account_id = sqlalchemy.Column(sqlalchemy.String(100), sqlalchemy.ForeignKey("account.id"))
-    token = sqlalchemy.Column(sqlalchemy.String(300), primary_key=True)
+    token_hash = sqlalchemy.Column(sqlalchemy.LargeBinary(32), primary_key=True)
     # this expire time is not JWT expire time
     expire_time = sqlalchemy.Column(sqlalchemy.DateTime)
 
+    __table_args__ = (
+        sqlalchemy.Index("ix_account_token_account_id_expire_time", "account_id", "expire_time"),
+        # range scan of the retention sweep, see `zgiam.retention`
+        sqlalchemy.Index("ix_account_token_expire_time", "expire_time"),
+    )
+
     account: Account = sqlalchemy.orm.relationship("Account", back_populates="tokens")
 
+    # not mapped, kept only on the instance created with the token
+    _token: typing.Union[str, None] = None
+
+    @property
+    def token(self) -> typing.Union[str, None]:
+        """API token, None if the model is loaded from database"""
+        return self._token
+
+    @token.setter
+    def token(self, token: str) -> None:
+        self._token = token
+        self.token_hash = hash_token(token)
+
+    def check_token(self, token: str) -> bool:
+        """compare the token with the stored digest in constant time
+
+        Args:
+            token (str): API token
+
+        Returns:
+            bool: True if matched
+        """
+        return hmac.compare_digest(self.token_hash, hash_token(token))
+
+    def __repr__(self):
+        partial = self.token[-10:] if self.token is not None else self.token_hash.hex()[:10]
+        return f"AccountToken<account_id: {self.account_id}, partial token: {partial}>"
+
+
+def snapshot(
+    instance: typing.Any, keys: typing.Union[typing.Iterable[str], None] = None
+) -> typing.Dict[str, typing.Any]:
+    """copy column values of a model instance, the result is safe to share between sessions
+
+    Args:
+        instance (typing.Any): database model instance
+        keys (typing.Iterable[str], optional): column names to copy, must include primary key.
+            Defaults to all columns.
+
+    Returns:
+        typing.Dict[str, typing.Any]: column name and value mapping
+    """
+    if keys is None:
+        keys = [column.key for column in sqlalchemy.inspect(instance).mapper.column_attrs]
+    return {key: getattr(instance, key) for key in keys}
+
+
+def merge_snapshot(
+    session: sqlalchemy.orm.Session, model: typing.Any, snapshot_: typing.Dict[str, typing.Any]
+) -> typing.Any:
+    """attach a snapshot to the session as a persistent instance without SELECT
+    Columns missing in the snapshot are loaded on first access.
+
+    Args:
+        session (sqlalchemy.orm.Session): SQLAlchemy session
+        model (typing.Any): database model class
+        snapshot_ (typing.Dict[str, typing.Any]): value from `snapshot`, must include primary key
+
+    Returns:
+        typing.Any: instance of model bound to the session
+    """
+    instance = model(**snapshot_)
+    sqlalchemy.orm.make_transient_to_detached(instance)
+    return session.merge(instance, load=False)
+
+
+class Job(base):
+    """background job, see `zgiam.jobs`"""
+
+    __tablename__ = "job"
+    id = sqlalchemy.Column(sqlalchemy.Integer, autoincrement=True, primary_key=True)
+    type = sqlalchemy.Column(sqlalchemy.String(100), nullable=False)
+    payload = sqlalchemy.Column(sqlalchemy.JSON)
+    # QUEUED, RUNNING, SUCCEEDED or FAILED
+    status = sqlalchemy.Column(sqlalchemy.String(30), nullable=False, default="QUEUED")
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    max_attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=1)
+    run_after = sqlalchemy.Column(
+        sqlalchemy.DateTime, nullable=False, default=datetime.datetime.utcnow
+    )
+    result = sqlalchemy.Column(sqlalchemy.JSON)
+    error = sqlalchemy.Column(sqlalchemy.Text)
+    created_at = sqlalchemy.Column(
+        sqlalchemy.DateTime, nullable=False, default=datetime.datetime.utcnow
+    )
+    updated_at = sqlalchemy.Column(
+        sqlalchemy.DateTime,
+        nullable=False,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow,
+    )
+
+    __table_args__ = (sqlalchemy.Index("ix_job_status_run_after", "status", "run_after"),)
+
+    def __repr__(self):
+        return f"Job<id: {self.id}, type: {self.type}, status: {self.status}>"
+
+
+class SyncState(base):
+    """last pushed state of a Google Workspace directory entity, see `zgiam.sync`"""
+
+    __tablename__ = "sync_state"
+    # user, group or members
+    entity_type = sqlalchemy.Column(sqlalchemy.String(30), primary_key=True)
+    # primary email of the user or group
+    entity_key = sqlalchemy.Column(sqlalchemy.String(255), primary_key=True)
+    # sha256 of the pushed body
+    hash = sqlalchemy.Column(sqlalchemy.String(64), nullable=False)
+    # ETag of the directory resource after the push
+    etag = sqlalchemy.Column(sqlalchemy.String(255))
+    synced_at = sqlalchemy.Column(
+        sqlalchemy.DateTime,
+        nullable=False,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow,
+    )
+
+    def __repr__(self):
+        return f"SyncState<{self.entity_type}: {self.entity_key}, hash: {self.hash}>"
+
+
+class WebSession(base):
+    """server-side web session, see `zgiam.session.DatabaseSessionInterface`"""
+
+    __tablename__ = "web_session"
+    # sha256 of the session id in the cookie
+    id = sqlalchemy.Column(sqlalchemy.String(64), primary_key=True)
+    # flask tagged JSON
+    data = sqlalchemy.Column(sqlalchemy.Text, nullable=False)
+    expire_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False, index=True)
+
     def __repr__(self):
-        return f"AccountToken<account_id: {self.account_id}, partial token: {self.token[-10:]}>"
+        return f"WebSession<id: {self.id[:10]}, expire_at: {self.expire_at}>"
@@ -0,0 +1,168 @@
+"""Data retention module
+Delete expired `AccountToken` rows and stale `OAuth` rows by the config CORE RETENTION_* policy,
+and expired `WebSession` rows.
+Rows are deleted in bounded batches, each batch in its own short transaction, see
+`RetentionSweeper`
+"""
+
+import datetime
+import logging
+import time
+import typing
+
+import sqlalchemy
+import sqlalchemy.exc
+import sqlalchemy.orm
+import sqlalchemy.sql
+
+import zgiam.lib.log
+import zgiam.lib.config
+import zgiam.core
+import zgiam.database
+import zgiam.models
+
+
+logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
+
+
+class RetentionSweeper:
+    """Delete rows out of the retention policy"""
+
+    def __init__(
+        self,
+        batch_size: typing.Union[int, None] = None,
+        expired_token_days: typing.Union[int, None] = None,
+        oauth_seconds: typing.Union[int, None] = None,
+    ):
+        """
+        Args:
+            batch_size (int, optional): rows deleted per transaction.
+                Defaults to config CORE:RETENTION_BATCH_SIZE
+            expired_token_days (int, optional): days an expired API token is kept, 0 keeps
+                forever. Defaults to config CORE:RETENTION_EXPIRED_TOKEN_DAYS
+            oauth_seconds (int, optional): seconds an OAuth row is kept after created, 0 keeps
+                forever. Defaults to config CORE:RETENTION_OAUTH_SECONDS
+        """
+        config = zgiam.lib.config.get_config()
+        self.batch_size = batch_size or config.getint("CORE", "RETENTION_BATCH_SIZE")
+        self.expired_token_days = (
+            config.getint("CORE", "RETENTION_EXPIRED_TOKEN_DAYS")
+            if expired_token_days is None
+            else expired_token_days
+        )
+        self.oauth_seconds = (
+            config.getint("CORE", "RETENTION_OAUTH_SECONDS")
+            if oauth_seconds is None
+            else oauth_seconds
+        )
+
+    def run(self, now: typing.Union[datetime.datetime, None] = None) -> typing.List[dict]:
+        """sweep every table once
+
+        Args:
+            now (datetime.datetime, optional): naive UTC time. Defaults to utcnow.
+
+        Returns:
+            typing.List[dict]: report of every table, `table`, `deleted` rows, `seconds` taken
+                and `message` SUCCESS, SKIPPED or ERROR
+        """
+        now = now or datetime.datetime.utcnow()
+        AccountToken = zgiam.models.AccountToken  # pylint: disable=invalid-name
+        OAuth = zgiam.models.OAuth  # pylint: disable=invalid-name
+        WebSession = zgiam.models.WebSession  # pylint: disable=invalid-name
+        reports = []
+        token_cutoff = self._expired_token_cutoff(now)
+        reports.append(
+            self._sweep(
+                AccountToken.token_hash,
+                None if token_cutoff is None else AccountToken.expire_time < token_cutoff,
+            )
+        )
+        reports.append(
+            self._sweep(
+                OAuth.account_id,
+                (
+                    OAuth.created_at < now - datetime.timedelta(seconds=self.oauth_seconds)
+                    if self.oauth_seconds > 0
+                    else None
+                ),
+            )
+        )
+        reports.append(self._sweep(WebSession.id, WebSession.expire_at < now))
+        return reports
+
+    def _expired_token_cutoff(
+        self, now: datetime.datetime
+    ) -> typing.Union[datetime.datetime, None]:
+        """expire time before which tokens are deleted, None keeps all
+        `jwt` verify mode rejects revoked tokens by their rows, the rows are kept until the JWT
+        itself expires
+        """
+        if self.expired_token_days <= 0:
+            return None
+        retention = datetime.timedelta(days=self.expired_token_days)
+        if zgiam.lib.config.get_settings().token_verify_mode == "jwt":
+            jwt_expires = zgiam.core.get_app().config.get("JWT_ACCESS_TOKEN_EXPIRES")
+            if not jwt_expires:
+                return None
+            if not isinstance(jwt_expires, datetime.timedelta):
+                jwt_expires = datetime.timedelta(seconds=int(jwt_expires))
+            retention = max(retention, jwt_expires)
+        return now - retention
+
+    def _sweep(
+        self,
+        key_column: sqlalchemy.orm.InstrumentedAttribute,
+        condition: typing.Union[sqlalchemy.sql.ColumnElement, None],
+    ) -> dict:
+        table = key_column.class_.__tablename__
+        if condition is None:
+            return {"table": table, "deleted": 0, "seconds": 0.0, "message": "SKIPPED"}
+        start = time.perf_counter()
+        deleted = 0
+        message = "SUCCESS"
+        try:
+            while True:
+                count = self._delete_batch(key_column, condition)
+                deleted += count
+                if count < self.batch_size:
+                    break
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            logger.exception("retention sweep of %s failed", table)
+            message = f"ERROR: {e}"
+        report = {
+            "table": table,
+            "deleted": deleted,
+            "seconds": round(time.perf_counter() - start, 3),
+            "message": message,
+        }
+        logger.info("retention sweep %s", report)
+        return report
+
+    def _delete_batch(
+        self,
+        key_column: sqlalchemy.orm.InstrumentedAttribute,
+        condition: sqlalchemy.sql.ColumnElement,
+    ) -> int:
+        """delete one batch by primary keys, locks only the selected rows for a short time"""
+        with zgiam.database.get_session() as session:
+            keys = [
+                key for key, in session.query(key_column).filter(condition).limit(self.batch_size)
+            ]
+            if keys:
+                session.query(key_column.class_).filter(key_column.in_(keys)).delete(
+                    synchronize_session=False
+                )
+        return len(keys)
+
+
+def sweep(now: typing.Union[datetime.datetime, None] = None) -> typing.List[dict]:
+    """run `RetentionSweeper` once by the config policy
+
+    Args:
+        now (datetime.datetime, optional): naive UTC time. Defaults to utcnow.
+
+    Returns:
+        typing.List[dict]: report of every table, see `RetentionSweeper.run`
+    """
+    return RetentionSweeper().run(now)
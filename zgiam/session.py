@@ -0,0 +1,170 @@
+"""Web session module
+Sessions are permanent and the cookie is only re-issued when it changed or
+CORE:SESSION_REFRESH_FRACTION of PERMANENT_SESSION_LIFETIME passed since the last refresh.
+CORE:SESSION_BACKEND `database` keeps the session data in `web_session` and only a random
+session id in the cookie, see `DatabaseSessionInterface`
+"""
+
+import datetime
+import hashlib
+import logging
+import secrets
+import time
+import typing
+
+import flask
+import flask.sessions
+import flask_login
+import sqlalchemy
+
+import zgiam.lib.log
+import zgiam.lib.config
+import zgiam.database
+import zgiam.models
+
+
+logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
+
+_SESSION_REFRESHED_AT_KEY: str = "_refreshed_at"
+
+
+class ServerSideSession(flask.sessions.SecureCookieSession):
+    """session data loaded from `web_session`, the cookie has `sid` only"""
+
+    def __init__(
+        self, initial: typing.Union[dict, None] = None, sid: typing.Union[str, None] = None
+    ):
+        super().__init__(initial)
+        self.sid = sid
+
+
+class DatabaseSessionInterface(flask.sessions.SessionInterface):
+    """Server-side session store on the `web_session` table
+    Rows are read and written by their own connection, the request SQLAlchemy session and its
+    transaction are not touched
+    """
+
+    serializer = flask.sessions.session_json_serializer
+    session_class = ServerSideSession
+
+    @staticmethod
+    def _key(sid: str) -> str:
+        """stored id, a leaked table does not leak usable session ids"""
+        return hashlib.sha256(sid.encode()).hexdigest()
+
+    def open_session(self, app: flask.Flask, request: flask.Request) -> ServerSideSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return self.session_class()
+        table = zgiam.models.WebSession.__table__
+        with zgiam.database.get_db().engine.connect() as connection:
+            row = connection.execute(
+                sqlalchemy.select(table.c.data).where(
+                    table.c.id == self._key(sid),
+                    table.c.expire_at > datetime.datetime.utcnow(),
+                )
+            ).first()
+        if row is None:
+            return self.session_class()
+        try:
+            return self.session_class(self.serializer.loads(row.data), sid=sid)
+        except ValueError:
+            logger.warning("broken web session data, start a new session")
+            return self.session_class()
+
+    def regenerate(self, session: ServerSideSession) -> None:
+        """drop the stored session, it is saved again with a new sid by `save_session`"""
+        if session.sid:
+            table = zgiam.models.WebSession.__table__
+            with zgiam.database.get_db().engine.begin() as connection:
+                connection.execute(table.delete().where(table.c.id == self._key(session.sid)))
+        session.sid = None
+        session.modified = True
+
+    def save_session(
+        self, app: flask.Flask, session: ServerSideSession, response: flask.Response
+    ) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        table = zgiam.models.WebSession.__table__
+
+        if not session:
+            if session.modified and session.sid:
+                with zgiam.database.get_db().engine.begin() as connection:
+                    connection.execute(table.delete().where(table.c.id == self._key(session.sid)))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not self.should_set_cookie(app, session):
+            return
+
+        expires = self.get_expiration_time(app, session)
+        # naive UTC like other DateTime columns, a not permanent session is kept as long
+        expire_at = datetime.datetime.utcnow() + app.permanent_session_lifetime
+        sid = session.sid or secrets.token_urlsafe(32)
+        with zgiam.database.get_db().engine.begin() as connection:
+            connection.execute(
+                zgiam.database.upsert(connection, table, ["id"], ["data", "expire_at"]),
+                {
+                    "id": self._key(sid),
+                    "data": self.serializer.dumps(dict(session)),
+                    "expire_at": expire_at,
+                },
+            )
+        session.sid = sid
+        response.set_cookie(
+            name,
+            sid,
+            expires=expires,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def _refresh_session(response: flask.Response) -> flask.Response:
+    """make the session permanent, mark it modified only when it changed or the refresh is due"""
+    session = flask.session
+    if not session:
+        # nothing to keep, anonymous requests get no cookie
+        return response
+    if not session.permanent:
+        session.permanent = True  # pylint: disable=assigning-non-slot
+    now = time.time()
+    refresh_seconds = (
+        flask.current_app.permanent_session_lifetime.total_seconds()
+        * zgiam.lib.config.get_settings().session_refresh_fraction
+    )
+    if session.modified or now - session.get(_SESSION_REFRESHED_AT_KEY, 0) >= refresh_seconds:
+        session[_SESSION_REFRESHED_AT_KEY] = now
+    return response
+
+
+def _regenerate_session(sender: flask.Flask, **_) -> None:
+    """a sid planted before the login must not become the session of the logged-in user"""
+    if isinstance(sender.session_interface, DatabaseSessionInterface) and isinstance(
+        flask.session, ServerSideSession
+    ):
+        sender.session_interface.regenerate(flask.session)
+
+
+def init_app(app: flask.Flask) -> None:
+    """register the throttled session refresh and the session store by CORE:SESSION_BACKEND
+
+    Args:
+        app (flask.Flask): Flask app
+
+    Raises:
+        TypeError: unsupported backend
+    """
+    backend = zgiam.lib.config.get_config().get("CORE", "SESSION_BACKEND").lower()
+    if backend == "database":
+        app.session_interface = DatabaseSessionInterface()
+    elif backend != "cookie":
+        raise TypeError(f"Unsupported session backend {backend}")
+    # the cookie is sent only when the session is modified, see `_refresh_session`
+    app.config["SESSION_REFRESH_EACH_REQUEST"] = False
+    app.after_request(_refresh_session)
+    flask_login.user_logged_in.connect(_regenerate_session)
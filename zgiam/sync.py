@@ -0,0 +1,373 @@
+"""Google Workspace directory sync module
+Reconcile `Account` and `Group` rows with the Directory API. The last pushed body hash and the
+resource ETag of every entity are kept in `sync_state`, only entities changed on either side
+since the last sync are pushed, see `DirectorySync`
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import typing
+
+import sqlalchemy
+import sqlalchemy.orm
+
+import zgiam.lib.log
+import zgiam.lib.config
+import zgiam.lib.google
+import zgiam.database
+import zgiam.jobs
+import zgiam.models
+
+
+logger: logging.Logger = zgiam.lib.log.get_logger(__name__)
+
+# Directory API max results of list requests
+_LIST_PAGE_SIZES: typing.Dict[str, int] = {"users": 500, "groups": 200, "members": 200}
+# user fields managed by the sync, the password is only set when the user is inserted
+_USER_INSERT_ONLY_FIELDS: typing.Tuple[str, ...] = ("password", "changePasswordAtNextLogin")
+
+
+class SyncChange(typing.NamedTuple):
+    """a directory write, or an unmanaged directory entity reported only"""
+
+    # user, group or member
+    entity_type: str
+    # insert, update, delete or unmanaged
+    action: str
+    # primary email of the user or group, email of the member
+    key: str
+    # group email of the member
+    group: str = ""
+    body: typing.Union[dict, None] = None
+    # hash of the managed fields, saved in sync_state after the push
+    digest: str = ""
+
+
+class SyncPlan(typing.NamedTuple):
+    """changes to push and the member list hash of every group"""
+
+    changes: typing.List[SyncChange]
+    member_digests: typing.Dict[str, str]
+
+
+def _digest(data: typing.Any) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+class DirectorySync:
+    """Push differences between the database and the Google Workspace directory"""
+
+    def __init__(self, directory: typing.Any = None, *, dry_run: bool = False):
+        """
+        Args:
+            directory (typing.Any, optional): `zgiam.lib.google.AdminDirectory` or a fake has
+                the same resources. Defaults to AdminDirectory() with the sync scopes
+            dry_run (bool, optional): only plan, nothing is written. Defaults to False.
+        """
+        config = zgiam.lib.config.get_config()
+        self.directory = directory or zgiam.lib.google.AdminDirectory(
+            scopes=zgiam.lib.google.ADMIN_DIRECTORY_SYNC_SCOPES
+        )
+        self.dry_run = dry_run
+        self.primary_domain = config.get("CORE", "PRIMARY_DOMAIN")
+        # index of pushed changes and the response body
+        self._responses: typing.Dict[int, dict] = {}
+
+    def run(self) -> typing.List[dict]:
+        """plan and push the changes, entities failed are pushed again by the next run
+        No transaction is open during Directory API requests, the database is read before and
+        the states are saved after them in short sessions
+
+        Returns:
+            typing.List[dict]: entity_type, action, key, group and message of every change,
+                message is PLANNED in dry run, UNMANAGED, SUCCESS or ERROR
+        """
+        plan = self.plan()
+        if self.dry_run:
+            return [
+                _report(change, "UNMANAGED" if change.action == "unmanaged" else "PLANNED")
+                for change in plan.changes
+            ]
+        errors = self.push(plan.changes)
+        with zgiam.database.get_session() as session:
+            self._save_states(session, plan, errors)
+        reports = []
+        for i, change in enumerate(plan.changes):
+            if change.action == "unmanaged":
+                reports.append(_report(change, "UNMANAGED"))
+            elif errors.get(i):
+                error_details = getattr(errors[i], "error_details", errors[i])
+                reports.append(_report(change, f"ERROR: {error_details}"))
+            else:
+                reports.append(_report(change, "SUCCESS"))
+        return reports
+
+    def plan(self) -> SyncPlan:
+        """compare the database with sync_state and the directory, only read requests are sent
+        The database is read by columns in a short session ended before the directory is listed
+
+        Returns:
+            SyncPlan
+        """
+        SyncState = zgiam.models.SyncState  # pylint: disable=invalid-name
+        with zgiam.database.get_session() as session:
+            states = {
+                (state.entity_type, state.entity_key): state
+                for state in session.query(
+                    SyncState.entity_type, SyncState.entity_key, SyncState.hash, SyncState.etag
+                )
+            }
+            users, groups, members = self._local_entities(session)
+        remote_users = self._list_etags("users", "primaryEmail", customer="my_customer")
+        remote_groups = self._list_etags("groups", "email", customer="my_customer")
+
+        changes = _entity_changes("user", users, remote_users, states)
+        changes += _entity_changes("group", groups, remote_groups, states)
+        member_digests = {}
+        for group_email, member_emails in members.items():
+            digest = _digest(sorted(member_emails))
+            member_digests[group_email] = digest
+            state = states.get(("members", group_email))
+            if state is not None and state.hash == digest and group_email in remote_groups:
+                continue
+            remote_members = set()
+            if group_email in remote_groups:
+                remote_members = {
+                    member["email"].lower()
+                    for member in self._list("members", "email", groupKey=group_email)
+                }
+            changes += [
+                SyncChange("member", "insert", email, group_email, {"email": email})
+                for email in sorted(member_emails - remote_members)
+            ]
+            changes += [
+                SyncChange("member", "delete", email, group_email)
+                for email in sorted(remote_members - member_emails)
+            ]
+        return SyncPlan(changes, member_digests)
+
+    def push(self, changes: typing.List[SyncChange]) -> typing.Dict[int, Exception]:
+        """send the changes as batch requests, users and groups are written before members
+
+        Args:
+            changes (typing.List[SyncChange]): changes of the plan
+
+        Returns:
+            typing.Dict[int, Exception]: index of the failed changes and the error
+        """
+        self._responses = {}
+        errors: typing.Dict[int, Exception] = {}
+        for entity_types in (("user", "group"), ("member",)):
+            indexes = [
+                i
+                for i, change in enumerate(changes)
+                if change.entity_type in entity_types and change.action != "unmanaged"
+            ]
+            if indexes:
+                errors.update(self._execute_batch([(i, changes[i]) for i in indexes]))
+        return errors
+
+    def _execute_batch(
+        self, changes: typing.List[typing.Tuple[int, SyncChange]]
+    ) -> typing.Dict[int, Exception]:
+        """send by `zgiam.lib.google.ApiExecutor`, batches of GOOGLE_API:BATCH_SIZE"""
+        results = zgiam.lib.google.get_executor().execute_batch(
+            self.directory.service,
+            [(str(i), self._request(change)) for i, change in changes],
+            inserts={str(i) for i, change in changes if change.action == "insert"},
+        )
+        errors: typing.Dict[int, Exception] = {}
+        for request_id, (response, error) in results.items():
+            if error is None:
+                self._responses[int(request_id)] = response or {}
+            else:
+                errors[int(request_id)] = error
+        return errors
+
+    def _request(self, change: SyncChange) -> typing.Any:
+        if change.entity_type == "user":
+            if change.action == "insert":
+                return self.directory.users.insert(body=change.body)
+            return self.directory.users.patch(userKey=change.key, body=change.body)
+        if change.entity_type == "group":
+            if change.action == "insert":
+                return self.directory.groups.insert(body=change.body)
+            return self.directory.groups.patch(groupKey=change.key, body=change.body)
+        if change.action == "insert":
+            return self.directory.members.insert(groupKey=change.group, body=change.body)
+        return self.directory.members.delete(groupKey=change.group, memberKey=change.key)
+
+    def _local_entities(
+        self, session: sqlalchemy.orm.Session
+    ) -> typing.Tuple[typing.Dict[str, dict], typing.Dict[str, dict], typing.Dict[str, set]]:
+        """users, groups and member emails of the groups by the database"""
+        Account = zgiam.models.Account  # pylint: disable=invalid-name
+        Group = zgiam.models.Group  # pylint: disable=invalid-name
+        AccountGroup = zgiam.models.AccountGroup  # pylint: disable=invalid-name
+        approved = sqlalchemy.and_(Account.review_status == "APPROVED", Account.id.isnot(None))
+
+        users = {}
+        query = session.query(
+            Account.id, Account.first_name, Account.last_name, Account.phone_number, Account.email
+        ).filter(approved)
+        for row in query:
+            body = zgiam.jobs.google_workspace_account_body(row)
+            users[body["primaryEmail"].lower()] = body
+
+        groups = {}
+        members: typing.Dict[str, set] = {}
+        query = session.query(Group.email, Group.english_name, Group.chinese_name).filter(
+            Group.email.isnot(None)
+        )
+        for row in query:
+            email = row.email.lower()
+            groups[email] = {
+                "email": email,
+                "name": row.english_name or row.chinese_name or email,
+                "description": row.chinese_name or "",
+            }
+            members[email] = set()
+        query = (
+            session.query(Group.email, AccountGroup.account_id)
+            .join(AccountGroup, AccountGroup.group_id == Group.id)
+            .join(Account, Account.id == AccountGroup.account_id)
+            .filter(approved, Group.email.isnot(None))
+        )
+        for group_email, account_id in query:
+            members[group_email.lower()].add(f"{account_id}@{self.primary_domain}".lower())
+        return users, groups, members
+
+    def _list(self, resource_name: str, fields: str, **kwargs) -> typing.Iterator[dict]:
+        """page through a list request, only the fields are returned by the API"""
+        resource = getattr(self.directory, resource_name)
+        page_token = None
+        while True:
+            request = resource.list(
+                maxResults=_LIST_PAGE_SIZES[resource_name],
+                fields=f"nextPageToken,{resource_name}({fields})",
+                pageToken=page_token,
+                **kwargs,
+            )
+            response = zgiam.lib.google.get_executor().execute(request)
+            yield from response.get(resource_name, [])
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return
+
+    def _list_etags(self, resource_name: str, key: str, **kwargs) -> typing.Dict[str, str]:
+        return {
+            item[key].lower(): item.get("etag")
+            for item in self._list(resource_name, f"{key},etag", **kwargs)
+        }
+
+    def _save_states(
+        self,
+        session: sqlalchemy.orm.Session,
+        plan: SyncPlan,
+        errors: typing.Dict[int, Exception],
+    ) -> None:
+        """save hash and ETag of entities pushed without error"""
+        now = datetime.datetime.utcnow()
+        states = []
+        inserted_account_ids = []
+        failed_groups = set()
+        for i, change in enumerate(plan.changes):
+            if change.action == "unmanaged":
+                continue
+            if i in errors:
+                if change.entity_type == "member":
+                    failed_groups.add(change.group)
+                continue
+            if change.entity_type == "member":
+                continue
+            states.append(
+                {
+                    "entity_type": change.entity_type,
+                    "entity_key": change.key,
+                    "hash": change.digest,
+                    "etag": self._responses[i].get("etag"),
+                    "synced_at": now,
+                }
+            )
+            if change.entity_type == "user" and change.action == "insert":
+                inserted_account_ids.append(change.body["externalIds"][0]["value"])
+        states += [
+            {
+                "entity_type": "members",
+                "entity_key": group_email,
+                "hash": digest,
+                "etag": None,
+                "synced_at": now,
+            }
+            for group_email, digest in plan.member_digests.items()
+            if group_email not in failed_groups
+        ]
+
+        connection = session.connection()
+        if states:
+            table = zgiam.models.SyncState.__table__
+            connection.execute(
+                zgiam.database.upsert(
+                    connection,
+                    table,
+                    ["entity_type", "entity_key"],
+                    ["hash", "etag", "synced_at"],
+                ),
+                states,
+            )
+        if inserted_account_ids:
+            table = zgiam.models.Account.__table__
+            connection.execute(
+                table.update()
+                .where(table.c.id.in_(inserted_account_ids))
+                .values(has_iam_google_account=True)
+            )
+
+
+def _entity_changes(
+    entity_type: str,
+    local: typing.Dict[str, dict],
+    remote_etags: typing.Dict[str, str],
+    states: typing.Dict[typing.Tuple[str, str], sqlalchemy.engine.Row],
+) -> typing.List[SyncChange]:
+    """insert entities not in the directory, update entities changed in the database since the
+    last sync or changed in the directory (ETag is different), report directory only entities"""
+    changes = []
+    for key, body in sorted(local.items()):
+        managed_body = {
+            field: value for field, value in body.items() if field not in _USER_INSERT_ONLY_FIELDS
+        }
+        digest = _digest(managed_body)
+        if key not in remote_etags:
+            changes.append(SyncChange(entity_type, "insert", key, body=body, digest=digest))
+            continue
+        state = states.get((entity_type, key))
+        if state is None or state.hash != digest or state.etag != remote_etags[key]:
+            changes.append(SyncChange(entity_type, "update", key, body=managed_body, digest=digest))
+    changes += [
+        SyncChange(entity_type, "unmanaged", key) for key in sorted(set(remote_etags) - set(local))
+    ]
+    return changes
+
+
+def _report(change: SyncChange, message: str) -> dict:
+    report = {"entity_type": change.entity_type, "action": change.action, "key": change.key}
+    if change.group:
+        report["group"] = change.group
+    report["message"] = message
+    return report
+
+
+def sync_directory(directory: typing.Any = None, *, dry_run: bool = False) -> typing.List[dict]:
+    """run `DirectorySync` once
+
+    Args:
+        directory (typing.Any, optional): AdminDirectory or a fake. Defaults to AdminDirectory()
+        dry_run (bool, optional): only plan, nothing is written. Defaults to False.
+
+    Returns:
+        typing.List[dict]: report of every change, see `DirectorySync.run`
+    """
+    return DirectorySync(directory, dry_run=dry_run).run()
@@ -0,0 +1,31 @@
+"""worker module to run the background job worker entrypoint"""
+import signal
+import sys
+import zgiam.core
+import zgiam.database
+import zgiam.jobs
+import zgiam.lib.config
+import zgiam.lib.google
+
+
+def main():
+    """this is the real main"""
+    zgiam.core.get_app()
+    zgiam.database.get_db()
+    zgiam.lib.google.warm_up()
+    zgiam.lib.config.watch_config()
+    worker = zgiam.jobs.Worker()
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop_event.set())
+    worker.run()
+
+
+def init():
+    """this is init script that replace the origin `if __name__ == "__main__"`
+    see zgiam.app.init
+    """
+    if __name__ == "__main__":
+        sys.exit(main())
+
+
+init()